@@ -25,6 +25,24 @@ config.set_main_option("sqlalchemy.url", settings.SQLALCHEMY_DATABASE_URI)
 # for 'autogenerate' support
 target_metadata = Base.metadata
 
+# Tables owned by the agent (app/agent), defined on its own SQLAlchemy Core
+# metadata. Their migrations are written by hand, so autogenerate must not see
+# them as unknown tables and emit drop_table.
+AGENT_TABLES = {
+    "agent_checkpoints",
+    "agent_checkpoint_writes",
+    "agent_threads",
+    "agent_token_usage",
+}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and name in AGENT_TABLES:
+        return False
+    if type_ == "index" and getattr(object, "table", None) is not None:
+        return object.table.name not in AGENT_TABLES
+    return True
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -45,6 +63,7 @@ def run_migrations_offline() -> None:
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
         compare_type=True,
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -69,6 +88,7 @@ def run_migrations_online() -> None:
             connection=connection,
             target_metadata=target_metadata,
             compare_type=True,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
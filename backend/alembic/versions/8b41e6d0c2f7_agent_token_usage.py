@@ -0,0 +1,44 @@
+"""Agent token usage
+
+Revision ID: 8b41e6d0c2f7
+Revises: 3f9c2a7d1b54
+Create Date: 2026-10-18 10:48:05.904217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b41e6d0c2f7'
+down_revision: Union[str, Sequence[str], None] = '3f9c2a7d1b54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Token ledger of the agent (app/agent/token_ledger.py)
+    op.create_table('agent_token_usage',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('thread_id', sa.String(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('node', sa.String(), nullable=False),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('completion_tokens', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_agent_token_usage_created_at'), 'agent_token_usage', ['created_at'], unique=False)
+    op.create_index(op.f('ix_agent_token_usage_thread_id'), 'agent_token_usage', ['thread_id'], unique=False)
+    op.create_index(op.f('ix_agent_token_usage_user_id'), 'agent_token_usage', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_agent_token_usage_user_id'), table_name='agent_token_usage')
+    op.drop_index(op.f('ix_agent_token_usage_thread_id'), table_name='agent_token_usage')
+    op.drop_index(op.f('ix_agent_token_usage_created_at'), table_name='agent_token_usage')
+    op.drop_table('agent_token_usage')
@@ -0,0 +1,114 @@
+"""
+Đo dung lượng checkpoint ghi thêm mỗi lượt và thời gian mỗi lượt cho một
+cuộc hội thoại dài (mặc định 50 lượt), dùng SQLCheckpointSaver trên SQLite
+và model giả lập không có độ trễ.
+
+Chạy: python app/agent/benchmarks/bench_checkpoint.py [số lượt]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Benchmark không gọi Gemini và không kết nối database
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("TOKEN_LEDGER_BACKEND", "memory")
+# Không giới hạn token: benchmark chạy nhiều lượt trên một hội thoại
+os.environ.setdefault("TOKEN_BUDGET_CONVERSATION", "0")
+os.environ.setdefault("TOKEN_BUDGET_USER_DAILY", "0")
+
+from sqlalchemy import create_engine, func, select
+
+from checkpoint_store import SQLCheckpointSaver, checkpoints_table, writes_table
+from fake_llm import install_stub_llm
+from graph import build_graph
+
+
+class TimedSaver(SQLCheckpointSaver):
+    """SQLCheckpointSaver có đếm thời gian ghi checkpoint"""
+
+    write_seconds = 0.0
+
+    def put(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().put(*args, **kwargs)
+        finally:
+            self.write_seconds += time.perf_counter() - start
+
+    def put_writes(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().put_writes(*args, **kwargs)
+        finally:
+            self.write_seconds += time.perf_counter() - start
+
+
+def stored_bytes(saver: SQLCheckpointSaver, thread_id: str) -> int:
+    with saver.engine.connect() as conn:
+        total = 0
+        for table, column in (
+            (checkpoints_table, checkpoints_table.c.checkpoint),
+            (writes_table, writes_table.c.value),
+        ):
+            total += conn.execute(
+                select(func.coalesce(func.sum(func.length(column)), 0)).where(
+                    table.c.thread_id == thread_id
+                )
+            ).scalar_one()
+        return total
+
+
+async def run_conversation(turns: int, db_path: str) -> list[dict]:
+    """Một cuộc hội thoại `turns` lượt, trả về số liệu từng lượt"""
+    install_stub_llm(0)
+    # Giữ toàn bộ checkpoint để đo đúng lượng dữ liệu mỗi lượt ghi thêm
+    saver = TimedSaver(create_engine(f"sqlite:///{db_path}"))
+    saver.setup()
+    graph = build_graph(checkpointer=saver)
+    config = {"configurable": {"thread_id": "bench"}}
+
+    rows = []
+    previous = 0
+    for turn in range(turns + 1):
+        saver.write_seconds = 0.0
+        start = time.perf_counter()
+        if turn == 0:
+            await graph.ainvoke({}, config=config)
+        else:
+            await graph.aupdate_state(config, {"pending_user_input": "xin chào"})
+            await graph.ainvoke(None, config=config)
+        elapsed = time.perf_counter() - start
+        total = stored_bytes(saver, "bench")
+        rows.append(
+            {
+                "turn": turn,
+                "bytes": total - previous,
+                "total_bytes": total,
+                "turn_ms": elapsed * 1000,
+                "checkpoint_ms": saver.write_seconds * 1000,
+            }
+        )
+        previous = total
+    return rows
+
+
+def main(turns: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = asyncio.run(run_conversation(turns, os.path.join(tmp, "bench.db")))
+    print(f"{'turn':>4} {'bytes':>9} {'total':>10} {'turn ms':>8} {'ckpt ms':>8}")
+    for row in rows:
+        if row["turn"] % 5 and row["turn"] != turns:
+            continue
+        print(
+            f"{row['turn']:>4} {row['bytes']:>9,} {row['total_bytes']:>10,} "
+            f"{row['turn_ms']:>8.1f} {row['checkpoint_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,72 @@
+"""
+Load test: nhiều phiên chat chạy đồng thời qua build_graph() với model giả lập
+có độ trễ cố định, để xem throughput tăng thế nào theo số phiên đồng thời.
+Model được gọi qua LLMGateway (LLM_MAX_CONCURRENCY, LLM_QUEUE_MAX, ...), phiên
+nào bị gateway từ chối được đếm vào cột busy.
+
+Chạy: python app/agent/benchmarks/bench_concurrency.py [độ trễ model (s)]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Benchmark không gọi Gemini và không kết nối database
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("TOKEN_LEDGER_BACKEND", "memory")
+# Không giới hạn token: benchmark chạy nhiều lượt trên một hội thoại
+os.environ.setdefault("TOKEN_BUDGET_CONVERSATION", "0")
+os.environ.setdefault("TOKEN_BUDGET_USER_DAILY", "0")
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from fake_llm import install_stub_llm, run_session
+from graph import build_graph
+from llm_gateway import LLMBusy
+
+
+async def run_load(sessions: int, turns: int = 3, delay: float = 0.05) -> dict:
+    install_stub_llm(delay)
+    graph = build_graph(checkpointer=MemorySaver())
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_session(graph, f"load-{sessions}-{i}", turns) for i in range(sessions)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, LLMBusy):
+            raise result
+    latencies = sorted(
+        latency for session in results if isinstance(session, list) for latency in session
+    ) or [0.0]
+    return {
+        "sessions": sessions,
+        "busy": sum(isinstance(session, LLMBusy) for session in results),
+        "turns": len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "max": latencies[-1],
+    }
+
+
+async def main(delay: float):
+    print(f"Model delay: {delay * 1000:.0f} ms/call (2 calls per ordering turn)")
+    print(
+        f"{'sessions':>8} {'busy':>5} {'turns':>6} {'elapsed':>8} {'turns/s':>8} "
+        f"{'p50':>7} {'max':>7}"
+    )
+    for sessions in (1, 5, 10, 25, 50, 100):
+        r = await run_load(sessions, delay=delay)
+        print(
+            f"{r['sessions']:>8} {r['busy']:>5} {r['turns']:>6} {r['elapsed']:>7.2f}s "
+            f"{r['throughput']:>8.1f} {r['p50'] * 1000:>5.0f}ms {r['max'] * 1000:>5.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.05))
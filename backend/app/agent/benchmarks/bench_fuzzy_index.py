@@ -0,0 +1,110 @@
+"""
+Benchmark FuzzyIndex trên menu giả lập (mặc định 500, 5k và 50k món).
+
+Chạy: python app/agent/benchmarks/bench_fuzzy_index.py [số món ...]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzy_index import FuzzyIndex, fold
+
+BASES = [
+    "Cơm", "Phở", "Bún", "Mì", "Hủ tiếu", "Bánh mì", "Cháo", "Miến", "Xôi", "Gỏi",
+    "Bánh cuốn", "Bánh xèo", "Lẩu", "Nem", "Chả giò", "Bò bía", "Bánh canh",
+    "Mì Quảng", "Bún chả", "Bún riêu", "Cao lầu", "Bánh bèo", "Chè", "Sinh tố",
+    "Nước ép", "Trà", "Cà phê", "Sữa chua", "Kem", "Bánh flan",
+]
+PROTEINS = [
+    "sườn", "bò", "gà", "heo quay", "tôm", "cá", "vịt", "chả", "trứng", "mực",
+    "lươn", "ếch", "cua", "ốc", "nghêu", "xá xíu", "lạp xưởng", "đậu hũ", "nấm",
+    "thịt băm", "gân", "bắp bò", "cánh gà", "ba chỉ", "cá lóc", "cá basa",
+    "dừa", "xoài", "bơ", "dâu",
+]
+STYLES = [
+    "nướng", "chiên", "xào", "tái", "kho", "hấp", "rim", "luộc", "sốt me",
+    "đặc biệt", "chua ngọt", "sả ớt", "muối ớt", "bơ tỏi", "nước mắm", "tiêu đen",
+    "lá lốt", "mật ong", "phô mai", "ngũ vị", "", "", "",
+]
+# Tên quán/chi nhánh giả lập: mỗi nhà hàng đặt tên món hơi khác nhau
+ONSETS = ["b", "c", "ch", "d", "đ", "g", "h", "kh", "l", "m", "n", "ng", "nh", "ph", "s", "t", "th", "tr", "v", "x"]
+RHYMES = ["a", "an", "anh", "ao", "ê", "en", "i", "inh", "o", "ong", "ơ", "ơn", "u", "ung", "ư", "ương", "ai", "oi", "uy", "iên"]
+
+
+def make_titles(count: int, seed: int = 42) -> list[tuple[int, str]]:
+    rng = random.Random(seed)
+    shops = [
+        " ".join(rng.choice(ONSETS) + rng.choice(RHYMES) for _ in range(2)).title()
+        for _ in range(2_000)
+    ]
+    titles = []
+    for item_id in range(1, count + 1):
+        parts = [rng.choice(BASES), rng.choice(PROTEINS), rng.choice(STYLES)]
+        parts.append(rng.choice(shops))
+        titles.append((item_id, " ".join(part for part in parts if part)))
+    return titles
+
+
+def typo(text: str, rng: random.Random) -> str:
+    """Bỏ dấu và đổi/bỏ một ký tự để giả lập lỗi gõ"""
+    text = fold(text)
+    pos = rng.randrange(len(text))
+    if rng.random() < 0.5:
+        return text[:pos] + text[pos + 1 :]
+    return text[:pos] + rng.choice("aeiou") + text[pos + 1 :]
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(count: int, queries: int = 1_000):
+    rng = random.Random(7)
+    titles = make_titles(count)
+
+    start = time.perf_counter()
+    index = FuzzyIndex(titles, coverage_weight=0.2)
+    build = time.perf_counter() - start
+    print(f"\n== {count} món, build {build * 1000:.0f} ms ==")
+
+    samples = [rng.choice(titles) for _ in range(queries)]
+    # "mention": khách chỉ gõ vài từ đầu của tên món; "full": gõ cả tên món
+    for kind in ("mention", "full"):
+        for min_score in (0.5, 0.7):
+            timings = []
+            found = 0
+            for item_id, title in samples:
+                words = title.split()
+                text = " ".join(words[:3]) if kind == "mention" else title
+                query = typo(text, rng)
+                start = time.perf_counter()
+                results = index.search(query, limit=5, min_score=min_score)
+                timings.append((time.perf_counter() - start) * 1e6)
+                if kind == "full" and any(rid == item_id for rid, _ in results):
+                    found += 1
+            recall = f", recall@5 {found / queries:.1%}" if kind == "full" else ""
+            print(
+                f"{kind:8} min_score={min_score}: "
+                f"p50 {percentile(timings, 0.5):.0f} µs, "
+                f"p99 {percentile(timings, 0.99):.0f} µs{recall}"
+            )
+
+    start = time.perf_counter()
+    for item_id, title in samples[:500]:
+        index.add(item_id, title + " mới")
+    update = (time.perf_counter() - start) / 500 * 1e6
+    print(f"incremental add: {update:.0f} µs/món")
+
+
+def main(counts: list[int]):
+    for count in counts:
+        run(count)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [500, 5_000, 50_000])
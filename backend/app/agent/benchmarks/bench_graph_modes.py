@@ -0,0 +1,132 @@
+"""
+So sánh hai chế độ graph cho một lượt đặt món (BUY):
+- two_call: parse_user_order + solve_buy (hai lần gọi LLM)
+- single_call: parse_and_reply (một lần gọi, intent và reply chung một output)
+
+Model giả lập có độ trễ cố định mỗi lần gọi. Token vào/ra là ước lượng
+(approx_tokens), đủ để so sánh hai chế độ.
+
+Chạy: python app/agent/benchmarks/bench_graph_modes.py [độ trễ model (s)] [số lượt]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Benchmark không gọi Gemini và không kết nối database
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("TOKEN_LEDGER_BACKEND", "memory")
+# Không giới hạn token: benchmark chạy nhiều lượt trên một hội thoại
+os.environ.setdefault("TOKEN_BUDGET_CONVERSATION", "0")
+os.environ.setdefault("TOKEN_BUDGET_USER_DAILY", "0")
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.memory import MemorySaver
+
+import nodes
+from fake_llm import install_stub_llm, run_session
+from graph import SILENT_NODES, build_graph
+from history import message_tokens
+from prompt_store import approx_tokens
+
+class Usage:
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, messages, output: str) -> None:
+        self.calls += 1
+        self.input_tokens += sum(message_tokens(m) for m in messages)
+        self.output_tokens += approx_tokens(output)
+
+
+def count_usage(usage: Usage) -> None:
+    """Bọc các model giả lập đã cài để đếm số lần gọi và token"""
+    llm, structured_llm, turn_llm = nodes.llm, nodes.structured_llm, nodes.turn_llm
+
+    async def chat(messages):
+        response = await llm.ainvoke(messages)
+        usage.record(messages, response.content)
+        return response
+
+    async def parse(messages):
+        parsed = await structured_llm.ainvoke(messages)
+        usage.record(messages, parsed.model_dump_json())
+        return parsed
+
+    async def turn(messages):
+        last = None
+        async for partial in turn_llm.astream(messages):
+            last = partial
+            yield partial
+        usage.record(messages, str(last))
+
+    nodes.llm = RunnableLambda(lambda messages: None, afunc=chat)
+    nodes.structured_llm = RunnableLambda(lambda messages: None, afunc=parse)
+    nodes.turn_llm = RunnableLambda(turn)
+
+
+async def measure(mode: str, delay: float, turns: int) -> dict:
+    install_stub_llm(delay)
+    usage = Usage()
+    count_usage(usage)
+    graph = build_graph(checkpointer=MemorySaver(), mode=mode)
+    thread_id = f"modes-{mode}"
+    config = {"configurable": {"thread_id": thread_id}}
+    await run_session(graph, thread_id, turns=0)
+    usage.__init__()  # bỏ lượt chào
+
+    latencies, first_content = [], []
+    for _ in range(turns):
+        start = time.perf_counter()
+        first = None
+        await graph.aupdate_state(config, {"pending_user_input": "1 cơm sườn"})
+        async for stream_mode, chunk in graph.astream(
+            None, config=config, stream_mode=["messages", "custom"]
+        ):
+            # Giống sse_events: chỉ token của LLM (có ls_provider) ở các node trả lời
+            visible = stream_mode == "custom" or (
+                "ls_provider" in chunk[1]
+                and chunk[1].get("langgraph_node") not in SILENT_NODES
+            )
+            if visible and first is None:
+                first = time.perf_counter() - start
+        latencies.append(time.perf_counter() - start)
+        first_content.append(first)
+    return {
+        "latency": statistics.mean(latencies),
+        "first": statistics.mean(first_content),
+        "calls": usage.calls / turns,
+        "input": usage.input_tokens / turns,
+        "output": usage.output_tokens / turns,
+    }
+
+
+def main(delay: float, turns: int):
+    print(f"Model delay: {delay * 1000:.0f} ms/call, {turns} BUY turns (per-turn means)")
+    print(
+        f"{'mode':>11} {'latency':>8} {'first':>8} {'calls':>6} {'in tok':>7} {'out tok':>8}"
+    )
+    results = {}
+    for mode in ("two_call", "single_call"):
+        r = results[mode] = asyncio.run(measure(mode, delay, turns))
+        print(
+            f"{mode:>11} {r['latency'] * 1000:>6.0f}ms {r['first'] * 1000:>6.0f}ms "
+            f"{r['calls']:>6.1f} {r['input']:>7.0f} {r['output']:>8.0f}"
+        )
+    print(
+        f"single / two: latency {results['single_call']['latency'] / results['two_call']['latency']:.2f}, "
+        f"input tokens {results['single_call']['input'] / results['two_call']['input']:.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main(
+        float(sys.argv[1]) if len(sys.argv) > 1 else 0.3,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+    )
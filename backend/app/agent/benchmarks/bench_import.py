@@ -0,0 +1,90 @@
+"""
+Đo thời gian import lúc khởi động API worker bằng `python -X importtime`.
+
+API chỉ load agent (langgraph, langchain, client Gemini) khi có request chat
+đầu tiên / lúc warm-up, nên `import app.main` không được kéo theo các module
+này. Mỗi lần đo chạy trong một process mới (cold start, không có cache
+module), in ra các module tốn thời gian nhất và ghi toàn bộ output của
+-X importtime ra file nếu có --out.
+
+Chạy: python app/agent/benchmarks/bench_import.py [module] [--out file]
+"""
+
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+# Các module nặng của agent, không được import cùng API
+AGENT_STACK = ("langgraph", "langchain_core", "langchain_google_genai", "graph", "nodes")
+
+# Settings của API bắt buộc có các biến này; không kết nối database khi import
+PLACEHOLDER_ENV = {
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "app",
+    "POSTGRES_PASSWORD": "app",
+    "POSTGRES_DB": "app",
+    "POSTGRES_PORT": "5432",
+}
+
+
+def run_importtime(module: str = "app.main") -> tuple[dict[str, tuple[int, int]], str]:
+    """
+    Import `module` trong process mới với -X importtime.
+
+    Trả về (module -> (self µs, cumulative µs), output gốc của importtime).
+    """
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    records = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        records[name.strip()] = (int(self_us), int(cumulative_us))
+    return records, result.stderr
+
+
+def loaded_agent_stack(records: dict[str, tuple[int, int]]) -> list[str]:
+    """Các module của agent stack (cả module con) đã bị import"""
+    return sorted(
+        name
+        for name in records
+        if any(name == root or name.startswith(root + ".") for root in AGENT_STACK)
+    )
+
+
+def main(module: str, out: str | None):
+    records, raw = run_importtime(module)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(raw)
+    total = records[module][1]
+    print(f"import {module}: {total / 1000:.0f} ms, {len(records)} modules")
+    print(f"{'cumulative':>11} {'self':>8}  module")
+    top = sorted(records.items(), key=lambda item: item[1][1], reverse=True)[:20]
+    for name, (self_us, cumulative_us) in top:
+        print(f"{cumulative_us / 1000:>9.1f}ms {self_us / 1000:>6.1f}ms  {name}")
+    agent_modules = loaded_agent_stack(records)
+    if agent_modules:
+        print(f"Agent stack imported eagerly: {', '.join(agent_modules[:10])}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    out = None
+    if "--out" in args:
+        index = args.index("--out")
+        out = args[index + 1]
+        del args[index : index + 2]
+    main(args[0] if args else "app.main", out)
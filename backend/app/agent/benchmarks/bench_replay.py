@@ -0,0 +1,214 @@
+"""
+Replay các hội thoại mẫu (benchmarks/conversations/*.json) qua build_graph()
+với FakeChatModel, nhiều phiên chạy đồng thời, không cần Gemini hay Postgres
+(checkpoint lưu vào SQLite tạm).
+
+Mỗi lượt của hội thoại mẫu gồm tin nhắn của khách và output mà model giả lập
+trả về cho tin nhắn đó (intent, items, reply). Báo cáo:
+- độ trễ mỗi lượt p50/p95/p99 và thời gian tới nội dung đầu tiên (TTFT)
+- thời gian chờ model và phần overhead của graph (state, checkpoint, node)
+- kích thước checkpoint mỗi thread
+- số lượt có intent khác với kịch bản
+
+Chạy: python app/agent/benchmarks/bench_replay.py --sessions 20 --first-token-ms 300
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Benchmark không gọi Gemini và không kết nối database
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("TOKEN_LEDGER_BACKEND", "memory")
+# Không giới hạn token: benchmark chạy nhiều lượt trên một hội thoại
+os.environ.setdefault("TOKEN_BUDGET_CONVERSATION", "0")
+os.environ.setdefault("TOKEN_BUDGET_USER_DAILY", "0")
+
+import nodes
+from checkpoint_store import SQLCheckpointSaver
+from fake_llm import FakeChatModel, install_llm, track_model_time
+from graph import SILENT_NODES, build_graph
+
+CONVERSATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations")
+
+
+def load_conversations(pattern: str | None = None) -> list[dict]:
+    conversations = []
+    for path in sorted(glob.glob(pattern or os.path.join(CONVERSATIONS_DIR, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            conversations.extend(json.load(f))
+    return conversations
+
+
+def scripted_model(
+    conversations: list[dict], first_token_latency: float, per_token_latency: float
+) -> FakeChatModel:
+    """Model trả lời đúng theo kịch bản cho từng tin nhắn của khách"""
+    script = {turn["user"]: turn for conv in conversations for turn in conv["turns"]}
+    return FakeChatModel(
+        script=script,
+        first_token_latency=first_token_latency,
+        per_token_latency=per_token_latency,
+    )
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    # nearest-rank
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def is_client_content(mode: str, chunk) -> bool:
+    """Chunk mà API stream ra cho khách (giống sse_events trong chat.py)"""
+    if mode == "custom":
+        return bool(chunk.get("content"))
+    message, metadata = chunk
+    return (
+        "ls_provider" in metadata
+        and metadata.get("langgraph_node") not in SILENT_NODES
+        and bool(message.content)
+    )
+
+
+async def replay(graph, conversation: dict, thread_id: str) -> list[dict]:
+    """Chạy một hội thoại, trả về số liệu từng lượt (không tính lời chào)"""
+    config = {"configurable": {"thread_id": thread_id}}
+    async for _ in graph.astream({}, config=config, stream_mode="messages"):
+        pass
+
+    records = []
+    for turn in conversation["turns"]:
+        with track_model_time() as clock:
+            start = time.perf_counter()
+            first = None
+            await graph.aupdate_state(config, {"pending_user_input": turn["user"]})
+            async for mode, chunk in graph.astream(
+                None, config=config, stream_mode=["messages", "custom"]
+            ):
+                if first is None and is_client_content(mode, chunk):
+                    first = time.perf_counter() - start
+            latency = time.perf_counter() - start
+        state = await graph.aget_state(config)
+        records.append(
+            {
+                "latency": latency,
+                "ttft": latency if first is None else first,
+                "model": clock.seconds,
+                "calls": clock.calls,
+                "intent_ok": state.values.get("user_intent") == turn["intent"],
+            }
+        )
+    return records
+
+
+async def run_replay(
+    conversations: list[dict],
+    sessions: int = 10,
+    mode: str = "two_call",
+    first_token_latency: float = 0.3,
+    per_token_latency: float = 0.01,
+    solve_mode: str = "template",
+    fast_intent: bool = True,
+    checkpoint_dir: str | None = None,
+) -> dict:
+    """Mỗi phiên replay toàn bộ các hội thoại mẫu, `sessions` phiên chạy đồng thời"""
+    install_llm(
+        scripted_model(conversations, first_token_latency, per_token_latency),
+        solve_mode,
+    )
+    nodes.FAST_INTENT_ENABLED = fast_intent
+
+    with tempfile.TemporaryDirectory(dir=checkpoint_dir) as tmp:
+        saver = SQLCheckpointSaver.from_url(f"sqlite:///{os.path.join(tmp, 'replay.db')}")
+        saver.setup()
+        graph = build_graph(checkpointer=saver, mode=mode)
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                replay(graph, conversation, f"replay-{session}-{index}")
+                for session in range(sessions)
+                for index, conversation in enumerate(conversations)
+            )
+        )
+        elapsed = time.perf_counter() - start
+        _, threads = saver.list_threads(limit=sessions * len(conversations))
+        saver.engine.dispose()
+
+    records = [record for result in results for record in result]
+    latencies = [r["latency"] for r in records]
+    ttfts = [r["ttft"] for r in records]
+    overheads = [r["latency"] - r["model"] for r in records]
+    sizes = [thread["size_bytes"] for thread in threads]
+    return {
+        "mode": mode,
+        "threads": len(results),
+        "turns": len(records),
+        "elapsed": elapsed,
+        "turns_per_second": len(records) / elapsed,
+        "latency": {p: percentile(latencies, p) for p in (50, 95, 99)},
+        "ttft": {p: percentile(ttfts, p) for p in (50, 95, 99)},
+        "overhead": {p: percentile(overheads, p) for p in (50, 95, 99)},
+        "model_seconds_per_turn": sum(r["model"] for r in records) / len(records),
+        "llm_calls_per_turn": sum(r["calls"] for r in records) / len(records),
+        "checkpoint_bytes_per_thread": sum(sizes) / len(sizes) if sizes else 0,
+        "intent_mismatches": sum(not r["intent_ok"] for r in records),
+    }
+
+
+def print_report(report: dict) -> None:
+    ms = lambda values: " ".join(f"p{p}={v * 1000:.0f}ms" for p, v in values.items())
+    print(
+        f"[{report['mode']}] {report['threads']} threads, {report['turns']} turns "
+        f"in {report['elapsed']:.2f}s ({report['turns_per_second']:.1f} turns/s)"
+    )
+    print(f"  latency   {ms(report['latency'])}")
+    print(f"  ttft      {ms(report['ttft'])}")
+    print(f"  overhead  {ms(report['overhead'])}")
+    print(
+        f"  model     {report['model_seconds_per_turn'] * 1000:.0f}ms/turn, "
+        f"{report['llm_calls_per_turn']:.2f} calls/turn"
+    )
+    print(f"  checkpoint {report['checkpoint_bytes_per_thread'] / 1024:.1f} KB/thread")
+    print(f"  intent mismatches: {report['intent_mismatches']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--per-token-ms", type=float, default=10)
+    parser.add_argument("--mode", choices=("two_call", "single_call", "both"), default="both")
+    parser.add_argument("--solve-mode", choices=("llm", "template"), default="template")
+    parser.add_argument("--no-fast-intent", action="store_true")
+    parser.add_argument("--conversations", help="glob của các file kịch bản JSON")
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.conversations)
+    modes = ("two_call", "single_call") if args.mode == "both" else (args.mode,)
+    for mode in modes:
+        report = asyncio.run(
+            run_replay(
+                conversations,
+                sessions=args.sessions,
+                mode=mode,
+                first_token_latency=args.first_token_ms / 1000,
+                per_token_latency=args.per_token_ms / 1000,
+                solve_mode=args.solve_mode,
+                fast_intent=not args.no_fast_intent,
+            )
+        )
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+So sánh độ trễ một lượt đặt món (BUY) khi solve_buy trả lời bằng LLM và
+bằng template, với model giả lập có độ trễ cố định mỗi lần gọi.
+
+Chạy: python app/agent/benchmarks/bench_templates.py [độ trễ model (s)] [số lượt]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Benchmark không gọi Gemini và không kết nối database
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("TOKEN_LEDGER_BACKEND", "memory")
+# Không giới hạn token: benchmark chạy nhiều lượt trên một hội thoại
+os.environ.setdefault("TOKEN_BUDGET_CONVERSATION", "0")
+os.environ.setdefault("TOKEN_BUDGET_USER_DAILY", "0")
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from fake_llm import install_stub_llm, run_session
+from graph import build_graph
+
+
+async def measure(solve_mode: str, delay: float, turns: int) -> list[float]:
+    """Độ trễ từng lượt đặt món (bỏ lượt chào)"""
+    install_stub_llm(delay, solve_mode)
+    graph = build_graph(checkpointer=MemorySaver())
+    latencies = await run_session(graph, f"templates-{solve_mode}", turns)
+    return latencies[1:]
+
+
+def main(delay: float, turns: int):
+    print(f"Model delay: {delay * 1000:.0f} ms/call, {turns} BUY turns")
+    print(f"{'mode':>9} {'mean':>8} {'p50':>8} {'max':>8}")
+    results = {}
+    for mode in ("llm", "template"):
+        latencies = asyncio.run(measure(mode, delay, turns))
+        results[mode] = statistics.mean(latencies)
+        print(
+            f"{mode:>9} {results[mode] * 1000:>6.0f}ms "
+            f"{statistics.median(latencies) * 1000:>6.0f}ms {max(latencies) * 1000:>6.0f}ms"
+        )
+    print(f"template / llm: {results['template'] / results['llm']:.2f}")
+
+
+if __name__ == "__main__":
+    main(
+        float(sys.argv[1]) if len(sys.argv) > 1 else 0.3,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+    )
@@ -0,0 +1,697 @@
+"""
+Checkpointer lưu state của graph vào database (Postgres, hoặc SQLite khi test)
+thay cho MemorySaver.
+
+- State không mất khi restart và dùng chung được giữa nhiều worker
+- Mỗi thread chỉ giữ N checkpoint mới nhất (cùng các checkpoint cũ hơn cần
+  để dựng lại messages/giỏ hàng, xem _prune)
+- Thread không hoạt động quá TTL, hoặc vượt quá số thread tối đa, bị xoá
+  bởi cleanup() (chạy định kỳ bằng start_cleanup_task)
+
+Các bảng được tạo bằng migration alembic (backend/alembic/versions), setup()
+chỉ dùng cho SQLite (test, benchmark).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from importlib.metadata import version as package_version
+from collections.abc import AsyncIterator, Iterator, Mapping, Sequence
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+
+# DeltaChannelHistory là API beta của langgraph, còn _prune cần _DeltaSnapshot
+# (private) để biết checkpoint nào có snapshot của delta channel. Chỉ chạy với
+# các version langgraph-checkpoint đã kiểm tra (cùng khoảng trong
+# requirements.txt): version khác thì báo lỗi ngay, không âm thầm lưu sai
+SUPPORTED_CHECKPOINT_VERSIONS = ((4, 3), (4, 4))  # [từ, tới)
+
+
+def _check_langgraph_checkpoint() -> None:
+    installed = package_version("langgraph-checkpoint")
+    major_minor = tuple(int(part) for part in installed.split(".")[:2])
+    low, high = SUPPORTED_CHECKPOINT_VERSIONS
+    if not low <= major_minor < high:
+        raise ImportError(
+            f"checkpoint_store requires langgraph-checkpoint >={low[0]}.{low[1]},"
+            f"<{high[0]}.{high[1]} (installed {installed}): it relies on the beta"
+            " DeltaChannel API and the private _DeltaSnapshot type"
+        )
+
+
+_check_langgraph_checkpoint()
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    DeltaChannelHistory,
+    PendingWrite,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.types import _DeltaSnapshot
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    Text,
+    delete,
+    func,
+    select,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from metrics import CHECKPOINT, agent_metrics
+from db_pool import get_engine
+from config import (
+    DB_POOL_OPTIONS,
+    CHECKPOINT_BACKEND,
+    CHECKPOINT_DB_URL,
+    CHECKPOINT_KEEP_LATEST,
+    CHECKPOINT_MAX_THREADS,
+    CHECKPOINT_TTL_SECONDS,
+)
+
+metadata_obj = MetaData()
+
+checkpoints_table = Table(
+    "agent_checkpoints",
+    metadata_obj,
+    Column("thread_id", String, primary_key=True),
+    Column("checkpoint_ns", String, primary_key=True, default=""),
+    Column("checkpoint_id", String, primary_key=True),
+    Column("parent_checkpoint_id", String, nullable=True),
+    Column("type", String, nullable=False),
+    Column("checkpoint", LargeBinary, nullable=False),
+    Column("metadata_type", String, nullable=False),
+    Column("metadata", LargeBinary, nullable=False),
+    # Tên các channel có giá trị trong checkpoint, để tìm snapshot mà không cần giải mã
+    Column("channels", Text, nullable=False, default=""),
+    Column("created_at", Float, nullable=False),
+)
+
+writes_table = Table(
+    "agent_checkpoint_writes",
+    metadata_obj,
+    Column("thread_id", String, primary_key=True),
+    Column("checkpoint_ns", String, primary_key=True, default=""),
+    Column("checkpoint_id", String, primary_key=True),
+    Column("task_id", String, primary_key=True),
+    Column("idx", Integer, primary_key=True),
+    Column("channel", String, nullable=False),
+    Column("type", String, nullable=False),
+    Column("value", LargeBinary, nullable=False),
+    Column("task_path", String, nullable=False, default=""),
+)
+
+# Một dòng cho mỗi thread: dùng cho TTL / giới hạn số thread
+threads_table = Table(
+    "agent_threads",
+    metadata_obj,
+    Column("thread_id", String, primary_key=True),
+    Column("created_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False, index=True),
+    Column("size_bytes", Integer, nullable=False, default=0),
+)
+
+
+# insert() có on_conflict_do_update của từng dialect được hỗ trợ
+_DIALECT_INSERT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class SQLCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    Checkpointer dùng SQLAlchemy Core, chạy được trên Postgres và SQLite.
+
+    Args:
+        engine: engine SQLAlchemy dùng để lưu checkpoint
+        ttl_seconds: thread không có checkpoint mới quá lâu sẽ bị xoá (None: không xoá)
+        max_threads: số thread tối đa, thừa thì xoá các thread cũ nhất (None: không giới hạn)
+        keep_latest: số checkpoint giữ lại cho mỗi thread (None: giữ tất cả)
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        ttl_seconds: float | None = None,
+        max_threads: int | None = None,
+        keep_latest: int | None = None,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.engine = engine
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.keep_latest = keep_latest
+        self._cleanup_task: asyncio.Task | None = None
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "SQLCheckpointSaver":
+        return cls(get_engine(url, **DB_POOL_OPTIONS), **kwargs)
+
+    def setup(self) -> None:
+        """Tạo các bảng nếu chưa có (test / SQLite; Postgres dùng migration alembic)"""
+        metadata_obj.create_all(self.engine)
+
+    # ---- Đọc ----
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        query = select(checkpoints_table).where(
+            checkpoints_table.c.thread_id == thread_id,
+            checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+        )
+        if checkpoint_id:
+            query = query.where(checkpoints_table.c.checkpoint_id == checkpoint_id)
+        else:
+            query = query.order_by(checkpoints_table.c.checkpoint_id.desc()).limit(1)
+
+        with self.engine.connect() as conn:
+            row = conn.execute(query).mappings().first()
+            if row is None:
+                return None
+            writes = self._load_writes(conn, row)
+        return self._make_tuple(row, writes)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = select(checkpoints_table).order_by(
+            checkpoints_table.c.checkpoint_id.desc()
+        )
+        if config is not None:
+            query = query.where(
+                checkpoints_table.c.thread_id == config["configurable"]["thread_id"]
+            )
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                query = query.where(checkpoints_table.c.checkpoint_ns == checkpoint_ns)
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id:
+                query = query.where(checkpoints_table.c.checkpoint_id == checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            query = query.where(checkpoints_table.c.checkpoint_id < before_id)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).mappings().all()
+            results = []
+            for row in rows:
+                # metadata được serialize nên lọc sau khi đọc
+                if filter:
+                    meta = self.serde.loads_typed(
+                        (row["metadata_type"], row["metadata"])
+                    )
+                    if not all(meta.get(k) == v for k, v in filter.items()):
+                        continue
+                results.append(self._make_tuple(row, self._load_writes(conn, row)))
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    def _load_writes(self, conn, row) -> list[tuple[str, str, Any]]:
+        rows = conn.execute(
+            select(writes_table)
+            .where(
+                writes_table.c.thread_id == row["thread_id"],
+                writes_table.c.checkpoint_ns == row["checkpoint_ns"],
+                writes_table.c.checkpoint_id == row["checkpoint_id"],
+            )
+            .order_by(
+                writes_table.c.task_path, writes_table.c.task_id, writes_table.c.idx
+            )
+        ).mappings()
+        return [
+            (w["task_id"], w["channel"], self.serde.loads_typed((w["type"], w["value"])))
+            for w in rows
+        ]
+
+    def _make_tuple(self, row, writes) -> CheckpointTuple:
+        thread_id = row["thread_id"]
+        checkpoint_ns = row["checkpoint_ns"]
+        parent_id = row["parent_checkpoint_id"]
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": row["checkpoint_id"],
+                }
+            },
+            checkpoint=self.serde.loads_typed((row["type"], row["checkpoint"])),
+            metadata=self.serde.loads_typed((row["metadata_type"], row["metadata"])),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=writes,
+        )
+
+    def get_delta_channel_history(
+        self, *, config: RunnableConfig, channels: Sequence[str]
+    ) -> Mapping[str, DeltaChannelHistory]:
+        """
+        Dựng lại lịch sử của các DeltaChannel bằng 2 query (chuỗi checkpoint cha
+        và writes của chúng) thay vì gọi get_tuple cho từng checkpoint cha.
+        Chỉ checkpoint chứa snapshot mới phải giải mã.
+        """
+        if not channels:
+            return {}
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        scope = (
+            checkpoints_table.c.thread_id == thread_id,
+            checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+        )
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(
+                    checkpoints_table.c.checkpoint_id,
+                    checkpoints_table.c.parent_checkpoint_id,
+                    checkpoints_table.c.channels,
+                ).where(*scope)
+            ).all()
+            by_id = {row.checkpoint_id: row for row in rows}
+            if not checkpoint_id:
+                checkpoint_id = max(by_id, default=None)
+            target = by_id.get(checkpoint_id)
+
+            # Đi ngược chuỗi checkpoint cha tới khi mọi channel đều gặp snapshot
+            chain: list[str] = []
+            seed_at: dict[str, str] = {}
+            remaining = set(channels)
+            current = target.parent_checkpoint_id if target else None
+            while current in by_id and remaining:
+                row = by_id[current]
+                chain.append(current)
+                for channel in remaining & set(row.channels.split(",")):
+                    seed_at[channel] = current
+                remaining -= set(seed_at)
+                current = row.parent_checkpoint_id
+
+            seeds: dict[str, Any] = {}
+            for seed_id in set(seed_at.values()):
+                row = conn.execute(
+                    select(checkpoints_table.c.type, checkpoints_table.c.checkpoint).where(
+                        *scope, checkpoints_table.c.checkpoint_id == seed_id
+                    )
+                ).one()
+                values = self.serde.loads_typed((row.type, row.checkpoint))
+                for channel, at in seed_at.items():
+                    if at == seed_id:
+                        seeds[channel] = values["channel_values"][channel]
+
+            writes_by_checkpoint: dict[str, list[PendingWrite]] = {}
+            if chain:
+                for w in conn.execute(
+                    select(writes_table)
+                    .where(
+                        writes_table.c.thread_id == thread_id,
+                        writes_table.c.checkpoint_ns == checkpoint_ns,
+                        writes_table.c.checkpoint_id.in_(chain),
+                        writes_table.c.channel.in_(channels),
+                    )
+                    .order_by(
+                        writes_table.c.task_path,
+                        writes_table.c.task_id,
+                        writes_table.c.idx,
+                    )
+                ).mappings():
+                    writes_by_checkpoint.setdefault(w["checkpoint_id"], []).append(
+                        (
+                            w["task_id"],
+                            w["channel"],
+                            self.serde.loads_typed((w["type"], w["value"])),
+                        )
+                    )
+
+        result: dict[str, DeltaChannelHistory] = {}
+        for channel in channels:
+            # Writes từ checkpoint cũ đến mới, dừng ở checkpoint chứa snapshot
+            stop = seed_at.get(channel)
+            path = chain[: chain.index(stop) + 1] if stop else chain
+            writes = [
+                write
+                for checkpoint_id in reversed(path)
+                for write in writes_by_checkpoint.get(checkpoint_id, ())
+                if write[1] == channel
+            ]
+            entry: DeltaChannelHistory = {"writes": writes}
+            if channel in seeds:
+                entry["seed"] = seeds[channel]
+            result[channel] = entry
+        return result
+
+    async def aget_delta_channel_history(
+        self, *, config: RunnableConfig, channels: Sequence[str]
+    ) -> Mapping[str, DeltaChannelHistory]:
+        with agent_metrics.db_timer("delta_history", CHECKPOINT):
+            return await asyncio.to_thread(
+                self.get_delta_channel_history, config=config, channels=channels
+            )
+
+    # ---- Ghi ----
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        meta_type, meta_blob = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+        now = time.time()
+
+        with self.engine.begin() as conn:
+            conn.execute(
+                checkpoints_table.insert().values(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint["id"],
+                    parent_checkpoint_id=config["configurable"].get("checkpoint_id"),
+                    type=type_,
+                    checkpoint=blob,
+                    metadata_type=meta_type,
+                    metadata=meta_blob,
+                    channels=",".join(checkpoint["channel_values"]),
+                    created_at=now,
+                )
+            )
+            freed = 0
+            if self.keep_latest:
+                freed = self._prune(
+                    conn, thread_id, checkpoint_ns, self.keep_latest, checkpoint, metadata
+                )
+            self._touch_thread(conn, thread_id, now, len(blob) - freed)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        key = (
+            writes_table.c.thread_id == thread_id,
+            writes_table.c.checkpoint_ns == checkpoint_ns,
+            writes_table.c.checkpoint_id == checkpoint_id,
+            writes_table.c.task_id == task_id,
+        )
+
+        with self.engine.begin() as conn:
+            existing = set(conn.execute(select(writes_table.c.idx).where(*key)).scalars())
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                if idx in existing:
+                    # Write thường đã lưu thì bỏ qua, write đặc biệt (idx < 0) thì ghi đè
+                    if idx >= 0:
+                        continue
+                    conn.execute(delete(writes_table).where(*key, writes_table.c.idx == idx))
+                type_, blob = self.serde.dumps_typed(value)
+                conn.execute(
+                    writes_table.insert().values(
+                        thread_id=thread_id,
+                        checkpoint_ns=checkpoint_ns,
+                        checkpoint_id=checkpoint_id,
+                        task_id=task_id,
+                        idx=idx,
+                        channel=channel,
+                        type=type_,
+                        value=blob,
+                        task_path=task_path,
+                    )
+                )
+
+    def _prune(
+        self, conn, thread_id: str, checkpoint_ns: str, keep: int, checkpoint, metadata
+    ) -> int:
+        """
+        Xoá các checkpoint (và writes của chúng) cũ hơn `keep` checkpoint mới nhất.
+        Trả về số byte checkpoint đã xoá.
+
+        Channel dạng DeltaChannel (messages, giỏ hàng) chỉ lưu phần thêm vào;
+        giá trị đầy đủ được dựng lại từ checkpoint gần nhất có snapshot của
+        channel đó. Vì vậy các checkpoint cũ hơn vẫn được giữ cho tới khi mọi
+        delta channel đều có snapshot.
+        """
+        delta_channels = set(metadata.get("counters_since_delta_snapshot") or ())
+        delta_channels |= {
+            channel
+            for channel, value in checkpoint["channel_values"].items()
+            if isinstance(value, _DeltaSnapshot)
+        }
+        rows = conn.execute(
+            select(checkpoints_table.c.checkpoint_id, checkpoints_table.c.channels)
+            .where(
+                checkpoints_table.c.thread_id == thread_id,
+                checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+            )
+            .order_by(checkpoints_table.c.checkpoint_id.desc())
+            .offset(keep - 1)
+        ).all()
+        if len(rows) <= 1:
+            return 0
+
+        # rows[0] là checkpoint cũ nhất được giữ, tìm snapshot từ đó trở về trước
+        cutoff = len(rows)
+        for index, row in enumerate(rows):
+            delta_channels -= set(row.channels.split(","))
+            if not delta_channels:
+                cutoff = index + 1
+                break
+        stale = [row.checkpoint_id for row in rows[cutoff:]]
+        if not stale:
+            return 0
+        scope = (
+            checkpoints_table.c.thread_id == thread_id,
+            checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+            checkpoints_table.c.checkpoint_id.in_(stale),
+        )
+        freed = conn.execute(
+            select(func.coalesce(func.sum(func.length(checkpoints_table.c.checkpoint)), 0))
+            .where(*scope)
+        ).scalar_one()
+        for table in (writes_table, checkpoints_table):
+            conn.execute(
+                delete(table).where(
+                    table.c.thread_id == thread_id,
+                    table.c.checkpoint_ns == checkpoint_ns,
+                    table.c.checkpoint_id.in_(stale),
+                )
+            )
+        return freed
+
+    def _touch_thread(self, conn, thread_id: str, now: float, added_bytes: int) -> None:
+        """
+        Cập nhật thời gian hoạt động và dung lượng (cộng dồn) của thread bằng một
+        câu upsert: hai worker cùng ghi thread mới không bị trùng khoá
+        """
+        insert = _DIALECT_INSERT[conn.dialect.name](threads_table).values(
+            thread_id=thread_id, created_at=now, updated_at=now, size_bytes=added_bytes
+        )
+        conn.execute(
+            insert.on_conflict_do_update(
+                index_elements=[threads_table.c.thread_id],
+                set_={
+                    "updated_at": now,
+                    "size_bytes": threads_table.c.size_bytes + added_bytes,
+                },
+            )
+        )
+
+    # ---- Xoá ----
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.delete_threads([thread_id])
+
+    def delete_threads(self, thread_ids: Sequence[str]) -> int:
+        """Xoá toàn bộ checkpoint của các thread, trả về số thread đã xoá"""
+        if not thread_ids:
+            return 0
+        with self.engine.begin() as conn:
+            for table in (writes_table, checkpoints_table):
+                conn.execute(delete(table).where(table.c.thread_id.in_(thread_ids)))
+            result = conn.execute(
+                delete(threads_table).where(threads_table.c.thread_id.in_(thread_ids))
+            )
+        return result.rowcount
+
+    def list_threads(
+        self, *, limit: int = 100, offset: int = 0, now: float | None = None
+    ) -> tuple[int, list[dict]]:
+        """(tổng số thread, các thread hoạt động gần nhất trước) kèm thời gian rảnh và dung lượng"""
+        now = time.time() if now is None else now
+        with self.engine.connect() as conn:
+            total = conn.execute(
+                select(func.count()).select_from(threads_table)
+            ).scalar_one()
+            rows = conn.execute(
+                select(threads_table)
+                .order_by(threads_table.c.updated_at.desc())
+                .limit(limit)
+                .offset(offset)
+            ).mappings()
+            threads = [
+                {**row, "idle_seconds": max(0.0, now - row["updated_at"])}
+                for row in rows
+            ]
+        return total, threads
+
+    def expire_idle(self, idle_seconds: float, now: float | None = None) -> int:
+        """Xoá các thread không hoạt động quá idle_seconds, trả về số thread đã xoá"""
+        now = time.time() if now is None else now
+        with self.engine.connect() as conn:
+            expired = conn.execute(
+                select(threads_table.c.thread_id).where(
+                    threads_table.c.updated_at < now - idle_seconds
+                )
+            ).scalars().all()
+        return self.delete_threads(expired)
+
+    def cleanup(self, now: float | None = None) -> int:
+        """Xoá thread hết hạn TTL và thread vượt quá max_threads. Trả về số thread đã xoá"""
+        now = time.time() if now is None else now
+        deleted = 0
+        if self.ttl_seconds is not None:
+            deleted += self.expire_idle(self.ttl_seconds, now)
+        if self.max_threads is not None:
+            # Thread mới nhất giữ lại, phần còn lại (cũ hơn) bị xoá
+            with self.engine.connect() as conn:
+                overflow = conn.execute(
+                    select(threads_table.c.thread_id)
+                    .order_by(threads_table.c.updated_at.desc())
+                    .offset(self.max_threads)
+                ).scalars().all()
+            deleted += self.delete_threads(overflow)
+        if deleted:
+            print(f"[Checkpoint] Cleanup removed {deleted} threads")
+        return deleted
+
+    # ---- Async: chạy bản sync trong thread pool (thời gian ghi vào metrics) ----
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        with agent_metrics.db_timer("get_tuple", CHECKPOINT):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        with agent_metrics.db_timer("put", CHECKPOINT):
+            return await asyncio.to_thread(
+                self.put, config, checkpoint, metadata, new_versions
+            )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        with agent_metrics.db_timer("put_writes", CHECKPOINT):
+            await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: str | None, channel: None) -> str:
+        # Giống InMemorySaver: version là chuỗi so sánh được theo thứ tự
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{time.time_ns() % 10**16:016}"
+
+    # ---- Dọn dẹp định kỳ ----
+
+    def start_cleanup_task(self, interval: float) -> asyncio.Task:
+        """Chạy cleanup() mỗi `interval` giây trên event loop hiện tại (chỉ tạo một lần)"""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.get_running_loop().create_task(
+                self._cleanup_loop(interval)
+            )
+        return self._cleanup_task
+
+    async def _cleanup_loop(self, interval: float) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.cleanup)
+            except Exception as e:
+                print(f"[Checkpoint] Cleanup failed: {e}")
+            await asyncio.sleep(interval)
+
+
+def create_checkpointer():
+    """Checkpointer theo config: "sql" (mặc định) hoặc "memory" (MemorySaver)"""
+    if CHECKPOINT_BACKEND == "memory":
+        return MemorySaver()
+    return SQLCheckpointSaver.from_url(
+        CHECKPOINT_DB_URL,
+        ttl_seconds=CHECKPOINT_TTL_SECONDS,
+        max_threads=CHECKPOINT_MAX_THREADS,
+        keep_latest=CHECKPOINT_KEEP_LATEST,
+    )
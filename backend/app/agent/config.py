@@ -1,17 +1,31 @@
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from schema import UserIntent
+from llm_routes import DEFAULT, build_model, load_routes
 
 # load .env
 from dotenv import load_dotenv
 
 load_dotenv()
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    api_key=os.getenv("GEMINI_API_KEY"),
-    temperature=0.7,
-)
+# "google" (Gemini) hoặc "fake": model giả lập chạy cục bộ, không cần API key
+# (xem fake_llm.py), độ trễ cấu hình bằng FAKE_LLM_FIRST_TOKEN_MS / FAKE_LLM_PER_TOKEN_MS
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google")
+
+# Model, temperature, max_output_tokens, deadline và giá theo từng node của
+# graph (xem llm_routes.py), đọc từ LLM_ROUTES (JSON) hoặc LLM_ROUTES_FILE
+LLM_ROUTES = load_routes(os.getenv("LLM_ROUTES"), os.getenv("LLM_ROUTES_FILE"))
+
+fake_options = {}
+if LLM_PROVIDER == "fake":
+    fake_options = {
+        "first_token_latency": float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", "300")) / 1000,
+        "per_token_latency": float(os.getenv("FAKE_LLM_PER_TOKEN_MS", "10")) / 1000,
+    }
+# node -> chat model của route đó
+route_models = {
+    node: build_model(route, LLM_PROVIDER, **fake_options)
+    for node, route in LLM_ROUTES.items()
+}
+llm = route_models[DEFAULT]
 
 SERVER = os.getenv("POSTGRES_SERVER")
 USER = os.getenv("POSTGRES_USER")
@@ -21,4 +35,85 @@ PORT = os.getenv("POSTGRES_PORT")
 
 DATABASE_URL = f"postgresql://{USER}:{PASSWORD}@{SERVER}:{PORT}/{DB}"
 
-structured_llm = llm.with_structured_output(UserIntent)
+# Pool kết nối dùng chung với API trong một worker (xem db_pool.py)
+DB_POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "statement_timeout_ms": int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000")),
+}
+
+# "two_call": parse_user_order -> solve_* (mặc định)
+# "single_call": một lần gọi trả về cả intent và câu trả lời (xem graph.py)
+AGENT_GRAPH_MODE = os.getenv("AGENT_GRAPH_MODE", "two_call")
+
+# Parser cục bộ chạy trước structured_llm cho các câu đơn giản ("2 cơm sườn")
+FAST_INTENT_ENABLED = os.getenv("FAST_INTENT_ENABLED", "true").lower() == "true"
+
+# Mỗi worker giữ menu trong bộ nhớ (menu_cache.py). Menu sửa từ worker khác
+# được load lại sau tối đa bấy nhiêu giây (0: chỉ khi chính worker này sửa)
+MENU_CACHE_TTL = float(os.getenv("MENU_CACHE_TTL", "60"))
+
+# Cache lời chào theo (menu, món giảm giá, tên), xem greeting_cache.py
+GREETING_CACHE_ENABLED = os.getenv("GREETING_CACHE_ENABLED", "true").lower() == "true"
+GREETING_CACHE_VARIANTS = int(os.getenv("GREETING_CACHE_VARIANTS", "3"))
+GREETING_CACHE_MAX_ENTRIES = int(os.getenv("GREETING_CACHE_MAX_ENTRIES", "1000"))
+
+
+# Giới hạn lịch sử gửi lên LLM mỗi lượt (xem history.py)
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+INTENT_HISTORY_TOKEN_BUDGET = int(os.getenv("INTENT_HISTORY_TOKEN_BUDGET", "600"))
+
+# Checkpointer (xem checkpoint_store.py): "sql" lưu vào database, "memory" dùng MemorySaver
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sql")
+CHECKPOINT_DB_URL = os.getenv("CHECKPOINT_DB_URL", DATABASE_URL)
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 60 * 60)))
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "10000"))
+CHECKPOINT_KEEP_LATEST = int(os.getenv("CHECKPOINT_KEEP_LATEST", "5"))
+CHECKPOINT_CLEANUP_INTERVAL = int(os.getenv("CHECKPOINT_CLEANUP_INTERVAL", "300"))
+
+# Các request cùng thread_id được xử lý lần lượt (xem thread_gate.py).
+# Policy khi thread đang bận: "queue", "coalesce" hoặc "reject"
+THREAD_QUEUE_POLICY = os.getenv("THREAD_QUEUE_POLICY", "queue")
+THREAD_QUEUE_MAX_PENDING = int(os.getenv("THREAD_QUEUE_MAX_PENDING", "4"))
+THREAD_LOCK_IDLE_SECONDS = int(os.getenv("THREAD_LOCK_IDLE_SECONDS", "600"))
+
+# Mọi lần gọi model đi qua LLMGateway (xem llm_gateway.py): số lần gọi đồng
+# thời tối đa, số lần gọi được chờ, thời gian chờ tối đa và deadline của một
+# lần gọi (giây, 0: không giới hạn)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "5"))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "15"))
+# Circuit breaker: lỗi liên tiếp bấy nhiêu lần thì ngừng gọi model trong
+# LLM_BREAKER_RESET_SECONDS giây (trả lời bằng template / parser cục bộ)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Hedging cho structured_llm: gửi request thứ hai sau p95 độ trễ gần đây
+# (LLM_HEDGE_DELAY giây khi chưa đủ số liệu)
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2"))
+
+# Câu trả lời của solve_buy / solve_unclear: "template" (dựng sẵn, không gọi
+# LLM, xem response_templates.py) hoặc "llm"
+SOLVE_BUY_MODE = os.getenv("SOLVE_BUY_MODE", "template")
+SOLVE_UNCLEAR_MODE = os.getenv("SOLVE_UNCLEAR_MODE", "template")
+
+# In một dòng tóm tắt thời gian/token theo node sau mỗi lượt chat (xem metrics.py)
+METRICS_LOG_TURNS = os.getenv("METRICS_LOG_TURNS", "true").lower() == "true"
+
+# Sổ ghi token theo hội thoại / user (xem token_ledger.py): "sql" lưu vào
+# database theo lô, "memory" chỉ giữ trong bộ nhớ
+TOKEN_LEDGER_BACKEND = os.getenv("TOKEN_LEDGER_BACKEND", "sql")
+TOKEN_LEDGER_DB_URL = os.getenv("TOKEN_LEDGER_DB_URL", DATABASE_URL)
+TOKEN_LEDGER_BATCH_SIZE = int(os.getenv("TOKEN_LEDGER_BATCH_SIZE", "50"))
+TOKEN_LEDGER_FLUSH_INTERVAL = int(os.getenv("TOKEN_LEDGER_FLUSH_INTERVAL", "10"))
+TOKEN_LEDGER_MAX_TRACKED = int(os.getenv("TOKEN_LEDGER_MAX_TRACKED", "10000"))
+# Giới hạn token mỗi hội thoại và mỗi user mỗi ngày (0: không giới hạn).
+# Vượt giới hạn thì không gọi LLM nữa: "template" trả lời bằng template,
+# "end" chào tạm biệt và kết thúc hội thoại (qua solve_not_buy)
+TOKEN_BUDGET_CONVERSATION = int(os.getenv("TOKEN_BUDGET_CONVERSATION", "30000"))
+TOKEN_BUDGET_USER_DAILY = int(os.getenv("TOKEN_BUDGET_USER_DAILY", "200000"))
+TOKEN_BUDGET_ACTION = os.getenv("TOKEN_BUDGET_ACTION", "template")
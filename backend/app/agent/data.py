@@ -1,10 +1,23 @@
+import asyncio
 from schema import Item, Flavour, ItemCategory
 from typing import Iterable, Any
 from enum import Enum
-from sqlalchemy import create_engine, text
-from config import DATABASE_URL
+from sqlalchemy import text
+from config import DATABASE_URL, DB_POOL_OPTIONS
+from db_pool import PoolCollector, get_engine
+from menu_cache import MenuSnapshot, menu_cache
+from metrics import agent_metrics
 
-engine = create_engine(DATABASE_URL)
+# Cùng engine (cùng pool) với API khi chạy trong app/db/session.py
+engine = get_engine(DATABASE_URL, **DB_POOL_OPTIONS)
+agent_metrics.register(PoolCollector(engine))
+
+# Các query chạy thường xuyên được dựng một lần: SQLAlchemy cache bản
+# compile theo statement, không phải parse lại SQL / bind param mỗi lần
+ALL_ITEMS_QUERY = text("SELECT * FROM item WHERE is_active = true")
+# "user" là từ khoá của Postgres (FROM user trả về user của database)
+USER_NAME_QUERY = text('SELECT full_name, email FROM "user" WHERE id = :id')
+ITEM_BY_ID_QUERY = text("SELECT * FROM item WHERE id = :id")
 
 
 def parse_pg_array(value):
@@ -19,7 +32,7 @@ def parse_pg_array(value):
 def get_all_items() -> list[Item]:
     """Lấy tất cả các món ăn có is_active = true"""
     with engine.connect() as conn:
-        result = conn.execute(text("SELECT * FROM item WHERE is_active = true"))
+        result = conn.execute(ALL_ITEMS_QUERY)
         items = []
         for row in result:
             # Map database row to Item model
@@ -40,57 +53,32 @@ def get_all_items() -> list[Item]:
         return items
 
 
+def get_menu_snapshot() -> MenuSnapshot:
+    """Menu hiện tại, chỉ query lại database khi menu đã đổi version"""
+    return menu_cache.get(get_all_items)
+
+
 def get_discount_items() -> list[Item]:
-    with engine.connect() as conn:
-        result = conn.execute(
-            text(
-                "SELECT * FROM item WHERE is_active = true AND discount > 0 AND discount IS NOT NULL"
-            )
-        )
-        items = []
-        for row in result:
-            item = Item(
-                id=row.id,
-                title=row.title,
-                # description=row.description,
-                price=row.price,
-                # is_active=row.is_active,
-                discount=row.discount,
-                # purchase_count=row.purchase_count,
-                category=parse_pg_array(row.category),
-                flavour=parse_pg_array(row.flavour),
-            )
-            items.append(item)
-        return items
+    """Các món đang giảm giá, lọc từ menu đã cache thay vì query riêng"""
+    return list(get_menu_snapshot().discount_items)
 
 
 def get_user_name(user_id: int) -> str:
+    """full_name của user, không có thì phần trước @ của email (một query)"""
     with engine.connect() as conn:
-        result = conn.execute(
-            text("SELECT full_name FROM user WHERE id = :id"), {"id": user_id}
-        )
-        row = result.fetchone()
-        if row and row.full_name:
-            return row.full_name
-        # Fallback query if full_name is null or not found, maybe email?
-        # But for now let's just return Unknown or handle logic elsewhere.
-        # Actually let's check email if full_name is None
-        if row:  # row exists but full_name is None
-            result_email = conn.execute(
-                text("SELECT email FROM user WHERE id = :id"), {"id": user_id}
-            )
-            row_email = result_email.fetchone()
-            if row_email:
-                return row_email.email.split("@")[0]  # Return part before @ of email
-
+        row = conn.execute(USER_NAME_QUERY, {"id": user_id}).fetchone()
+    if row is None:
         return "Bạn"
+    if row.full_name:
+        return row.full_name
+    if row.email:
+        return row.email.split("@")[0]
+    return "Bạn"
 
 
 def get_item_by_id(item_id: int) -> Item | None:
     with engine.connect() as conn:
-        result = conn.execute(
-            text("SELECT * FROM item WHERE id = :id"), {"id": item_id}
-        )
+        result = conn.execute(ITEM_BY_ID_QUERY, {"id": item_id})
         row = result.fetchone()
         if row:
             return Item(
@@ -132,3 +120,51 @@ def format_items_for_intent(items: list[Item]) -> str:
     for item in items:
         lines.append(f"- ID {item.id}: {item.title}")
     return "\n".join(lines)
+
+
+# Bản async cho các node chạy trên event loop. Engine là sync (psycopg2) nên
+# query được đẩy sang thread pool để không chặn các phiên chat khác.
+
+
+async def aget_menu_snapshot(version_id: str | None = None) -> MenuSnapshot:
+    """
+    Snapshot menu hiện tại, hoặc snapshot của version_id (menu_version trong
+    state) nếu version đó vẫn còn được giữ.
+    """
+    if version_id is not None:
+        snapshot = menu_cache.resolve(version_id)
+        if snapshot is not None:
+            return snapshot
+    snapshot = menu_cache.peek()
+    if snapshot is not None:
+        return snapshot
+    with agent_metrics.db_timer("menu"):
+        return await asyncio.to_thread(get_menu_snapshot)
+
+
+async def aget_session_data(user_id: int | None) -> tuple[MenuSnapshot, str]:
+    """Menu và tên user cho đầu hội thoại, hai query chạy song song"""
+    if not user_id:
+        return await aget_menu_snapshot(), "Bạn"
+    menu, user_name = await asyncio.gather(aget_menu_snapshot(), aget_user_name(user_id))
+    return menu, user_name
+
+
+async def aget_all_items() -> list[Item]:
+    with agent_metrics.db_timer("all_items"):
+        return await asyncio.to_thread(get_all_items)
+
+
+async def aget_discount_items() -> list[Item]:
+    with agent_metrics.db_timer("discount_items"):
+        return await asyncio.to_thread(get_discount_items)
+
+
+async def aget_user_name(user_id: int) -> str:
+    with agent_metrics.db_timer("user_name"):
+        return await asyncio.to_thread(get_user_name, user_id)
+
+
+async def aget_item_by_id(item_id: int) -> Item | None:
+    with agent_metrics.db_timer("item"):
+        return await asyncio.to_thread(get_item_by_id, item_id)
@@ -0,0 +1,159 @@
+"""
+Pool kết nối database dùng chung trong một worker.
+
+API (app/db/session.py) và agent (data.py, checkpoint_store.py,
+token_ledger.py) cùng trỏ tới một Postgres. get_engine() trả về cùng một
+engine cho cùng một URL, nên mỗi worker chỉ có một pool với kích thước cấu
+hình được (pool_size, max_overflow, pool_timeout, pool_recycle) thay vì
+nhiều pool mặc định độc lập.
+
+Mỗi pool đếm số lần lấy connection, số connection mới, số lần hết thời gian
+chờ và tổng / lớn nhất thời gian chờ lấy connection (pool_stats()), để chọn
+kích thước pool cho từng worker.
+
+Module chỉ phụ thuộc SQLAlchemy (không import config của agent) để API import
+được mà không phải load graph / model.
+"""
+
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """Bộ đếm của một pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def observe_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool đo thời gian chờ lấy connection"""
+
+    stats: PoolStats | None = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            if self.stats is not None:
+                self.stats.observe_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        if self.stats is not None:
+            self.stats.observe_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # dispose() / invalidate tạo pool mới: giữ nguyên bộ đếm
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+_engines: dict[str, Engine] = {}
+_lock = threading.Lock()
+
+
+def get_engine(
+    url: str,
+    pool_size: int = 10,
+    max_overflow: int = 10,
+    pool_timeout: float = 10,
+    pool_recycle: int = 1800,
+    statement_timeout_ms: int = 0,
+) -> Engine:
+    """
+    Engine dùng chung cho url (tạo lần đầu với các tham số pool này).
+
+    statement_timeout_ms: giới hạn thời gian một câu query phía Postgres
+    (0: không giới hạn), để query treo không giữ connection của pool mãi.
+    """
+    with _lock:
+        engine = _engines.get(url)
+        if engine is not None:
+            return engine
+        connect_args = {}
+        if statement_timeout_ms and url.startswith("postgresql"):
+            connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+        engine = create_engine(
+            url,
+            poolclass=TimedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=True,
+            connect_args=connect_args,
+        )
+        stats = engine.pool.stats = PoolStats()
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            stats.observe_connect()
+
+        _engines[url] = engine
+        return engine
+
+
+def pool_stats(engine: Engine) -> dict:
+    """Trạng thái hiện tại và bộ đếm của pool của engine"""
+    pool = engine.pool
+    result = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        with stats._lock:
+            result.update(
+                checkouts=stats.checkouts,
+                connects=stats.connects,
+                timeouts=stats.timeouts,
+                wait_seconds=stats.wait_seconds,
+                avg_wait_seconds=stats.wait_seconds / stats.checkouts if stats.checkouts else 0.0,
+                max_wait_seconds=stats.max_wait_seconds,
+            )
+    return result
+
+
+class PoolCollector:
+    """Render pool_stats() của engine cùng các metric của agent (metrics.py)"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def render(self) -> list[str]:
+        stats = pool_stats(self.engine)
+        lines = []
+        for key in ("checked_out", "checked_in", "overflow"):
+            lines += [f"# TYPE agent_db_pool_{key} gauge", f"agent_db_pool_{key} {stats[key]}"]
+        for key in ("checkouts", "connects", "timeouts", "wait_seconds"):
+            if key in stats:
+                name = f"agent_db_pool_{key}_total"
+                lines += [f"# TYPE {name} counter", f"{name} {stats[key]}"]
+        return lines
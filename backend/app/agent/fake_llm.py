@@ -0,0 +1,307 @@
+"""
+Chat model giả lập chạy cục bộ (LLM_PROVIDER=fake), dùng cho benchmark và
+test khi không có Gemini key.
+
+- Độ trễ cấu hình được: first_token_latency trước token đầu tiên, sau đó
+  per_token_latency cho mỗi token (chars_per_token ký tự)
+- Hỗ trợ stream (stream_mode="messages" nhận từng token như Gemini)
+- Structured output theo kịch bản: script map tin nhắn cuối của khách ->
+  dict output (intent, items, reply). Không có trong script thì dùng
+  default_output. Chỉ các field có trong schema được trả về.
+- Giả lập sự cố provider: call_latencies (độ trễ riêng của lần gọi thứ n),
+  fail_calls (các lần gọi thứ n raise FakeModelError), failing (mọi lần gọi
+  đều lỗi, bật/tắt để giả lập provider sập rồi hồi phục)
+
+Mọi output là cố định theo input, không có ngẫu nhiên.
+
+install_llm / install_stub_llm cài model giả lập vào các node của graph với
+menu mẫu ITEMS (test và benchmark dùng chung), restored_llm hoàn tác việc đó.
+"""
+
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import BaseModel, Field, PrivateAttr
+
+from schema import Item
+
+DEFAULT_REPLY = "Dạ, bạn muốn đặt thêm món gì không ạ?"
+
+
+class ModelClock:
+    """Tổng thời gian chờ model trong một lượt (xem track_model_time)"""
+
+    __slots__ = ("seconds", "calls")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+
+_model_clock: ContextVar[ModelClock | None] = ContextVar("fake_llm_clock", default=None)
+
+
+@contextmanager
+def track_model_time() -> Iterator[ModelClock]:
+    """
+    Cộng dồn thời gian các FakeChatModel chạy bên trong khối này. Các node của
+    graph chạy trong task con (copy context) nhưng dùng chung object ModelClock,
+    nên người gọi vẫn thấy được tổng.
+    """
+    clock = ModelClock()
+    token = _model_clock.set(clock)
+    try:
+        yield clock
+    finally:
+        _model_clock.reset(token)
+
+
+def last_user_text(messages: list[BaseMessage]) -> str:
+    """Tin nhắn cuối của khách (bỏ qua các chỉ dẫn nội bộ gửi dưới dạng HumanMessage)"""
+    # Import ở đây vì config import module này (history -> prompt_store -> data -> config)
+    from history import INSTRUCTION
+
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage) and message.name != INSTRUCTION:
+            return str(message.content).strip()
+    return ""
+
+
+class FakeModelError(Exception):
+    """Lỗi provider giả lập"""
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model cục bộ, output và độ trễ cố định theo cấu hình"""
+
+    # Tên model (route trong llm_routes.py), dùng làm label trong metrics
+    model: str = "fake"
+    reply: str = DEFAULT_REPLY
+    script: dict[str, dict] = Field(default_factory=dict)
+    default_output: dict = Field(
+        default_factory=lambda: {"intent": "UNCLEAR", "items": [], "reply": DEFAULT_REPLY}
+    )
+    first_token_latency: float = 0.0
+    per_token_latency: float = 0.0
+    chars_per_token: int = 4
+    call_latencies: list[float] = Field(default_factory=list)
+    fail_calls: set[int] = Field(default_factory=set)
+    failing: bool = False
+    _calls: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"first_token_latency": self.first_token_latency}
+
+    def _output(self, messages: list[BaseMessage], structured_keys: list | None) -> str:
+        entry = self.script.get(last_user_text(messages))
+        if structured_keys is None:
+            return (entry or {}).get("reply") or self.reply
+        output = entry if entry is not None else self.default_output
+        return json.dumps(
+            {key: output.get(key) for key in structured_keys if key in output},
+            ensure_ascii=False,
+        )
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _start_call(self) -> float:
+        """Lỗi giả lập (nếu có) và độ trễ tới token đầu tiên của lần gọi này"""
+        index = self._calls
+        self._calls += 1
+        if self.failing or index in self.fail_calls:
+            raise FakeModelError(f"fake provider error (call {index})")
+        if index < len(self.call_latencies):
+            return self.call_latencies[index]
+        return self.first_token_latency
+
+    def _tokens(self, text: str) -> list[str]:
+        size = max(1, self.chars_per_token)
+        return [text[i : i + size] for i in range(0, len(text), size)] or [""]
+
+    def _record(self, started: float) -> None:
+        clock = _model_clock.get()
+        if clock is not None:
+            clock.seconds += time.perf_counter() - started
+            clock.calls += 1
+
+    def _result(self, text: str) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(self, messages, stop=None, run_manager=None, structured_keys=None, **kwargs):
+        started = time.perf_counter()
+        latency = self._start_call()
+        text = self._output(messages, structured_keys)
+        time.sleep(latency + self.per_token_latency * len(self._tokens(text)))
+        self._record(started)
+        return self._result(text)
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, structured_keys=None, **kwargs
+    ):
+        started = time.perf_counter()
+        latency = self._start_call()
+        text = self._output(messages, structured_keys)
+        await asyncio.sleep(latency + self.per_token_latency * len(self._tokens(text)))
+        self._record(started)
+        return self._result(text)
+
+    def _stream(self, messages, stop=None, run_manager=None, structured_keys=None, **kwargs):
+        started = time.perf_counter()
+        time.sleep(self._start_call())
+        for index, token in enumerate(self._tokens(self._output(messages, structured_keys))):
+            if index:
+                time.sleep(self.per_token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        self._record(started)
+
+    async def _astream(
+        self, messages, stop=None, run_manager=None, structured_keys=None, **kwargs
+    ):
+        started = time.perf_counter()
+        await asyncio.sleep(self._start_call())
+        for index, token in enumerate(self._tokens(self._output(messages, structured_keys))):
+            if index:
+                await asyncio.sleep(self.per_token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        self._record(started)
+
+    def with_structured_output(self, schema: Any, *, include_raw: bool = False, **kwargs):
+        """
+        Giống ChatGoogleGenerativeAI: schema là pydantic model -> trả về object,
+        schema là dict (JSON schema) -> trả về dict, stream ra dict dần dần.
+        """
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            keys = list(schema.model_fields)
+            parser = PydanticOutputParser(pydantic_object=schema)
+        else:
+            keys = list(schema.get("properties", {}))
+            parser = JsonOutputParser()
+        return self.bind(structured_keys=keys) | parser
+
+
+TURN_REPLY = "Dạ, mình đã thêm 1 Cơm sườn vào giỏ hàng rồi ạ. Bạn muốn đặt thêm món gì không ạ?"
+# Số ký tự mỗi token khi model giả lập stream
+TURN_CHUNK_CHARS = 8
+
+ITEMS = [
+    Item(id=1, title="Cơm sườn", price=35000, category=[], flavour=[]),
+    Item(id=2, title="Phở bò", price=45000, discount=0.1, category=[], flavour=[]),
+    Item(id=3, title="Trà đá", price=5000, category=[], flavour=[]),
+]
+
+
+# Các biến module của nodes mà install_llm thay đổi
+INSTALLED_NODE_GLOBALS = (
+    "llm",
+    "structured_llm",
+    "turn_llm",
+    "FAST_INTENT_ENABLED",
+    "SOLVE_BUY_MODE",
+    "SOLVE_UNCLEAR_MODE",
+)
+
+
+def install_llm(model: FakeChatModel, solve_mode: str = "llm") -> None:
+    """
+    Thay llm/structured_llm/turn_llm của các node bằng model giả lập (giống
+    config.py khi LLM_PROVIDER=fake). solve_mode là chế độ trả lời của
+    solve_buy/solve_unclear ("llm" hoặc "template").
+    """
+    import nodes
+    from llm_gateway import llm_gateway
+    from menu_cache import menu_cache
+    from schema import TurnResult, UserIntent
+
+    nodes.llm = llm_gateway.wrap(model)
+    nodes.structured_llm = llm_gateway.wrap(model.with_structured_output(UserIntent))
+    nodes.turn_llm = llm_gateway.wrap(
+        model.with_structured_output(TurnResult.model_json_schema(), method="json_schema")
+    )
+    nodes.FAST_INTENT_ENABLED = False
+    nodes.SOLVE_BUY_MODE = solve_mode
+    nodes.SOLVE_UNCLEAR_MODE = solve_mode
+    # Luôn bắt đầu từ menu mẫu, kể cả khi lần chạy trước đã đổi menu
+    menu_cache.bump()
+    menu_cache.get(lambda: ITEMS)
+
+
+def install_stub_llm(delay: float, solve_mode: str = "llm") -> None:
+    """Model giả lập trả lời sau `delay` giây, mọi tin nhắn đều là đặt 1 cơm sườn"""
+    install_llm(
+        FakeChatModel(
+            first_token_latency=delay,
+            chars_per_token=TURN_CHUNK_CHARS,
+            default_output={
+                "intent": "BUY",
+                "items": [{"item_id": 1, "quantity": 1}],
+                "reply": TURN_REPLY,
+            },
+        ),
+        solve_mode,
+    )
+
+
+@contextmanager
+def restored_llm() -> Iterator[None]:
+    """
+    Khôi phục những gì install_llm / các lần gọi model thay đổi (model và chế
+    độ của nodes, menu đang cache, circuit breaker và độ trễ của gateway) khi
+    ra khỏi khối with. Test dùng qua fixture trong tests/conftest.py.
+    """
+    import nodes
+    from llm_gateway import llm_gateway
+    from menu_cache import menu_cache
+
+    saved = {name: getattr(nodes, name) for name in INSTALLED_NODE_GLOBALS}
+    breaker = dict(vars(llm_gateway.breaker))
+    latencies = list(llm_gateway._latencies)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(nodes, name, value)
+        vars(llm_gateway.breaker).update(breaker)
+        llm_gateway._latencies.clear()
+        llm_gateway._latencies.extend(latencies)
+        # Menu mẫu không phải menu thật: lần sau load lại
+        menu_cache.bump()
+
+
+async def run_session(graph, session_id: str, turns: int) -> list[float]:
+    """Một phiên: lời chào + `turns` lượt đặt món. Trả về độ trễ từng lượt"""
+    config = {"configurable": {"thread_id": session_id}}
+    latencies = []
+
+    start = time.perf_counter()
+    async for _ in graph.astream({}, config=config, stream_mode="messages"):
+        pass
+    latencies.append(time.perf_counter() - start)
+
+    for _ in range(turns):
+        start = time.perf_counter()
+        await graph.aupdate_state(config, {"pending_user_input": "1 cơm sườn"})
+        async for _ in graph.astream(None, config=config, stream_mode="messages"):
+            pass
+        latencies.append(time.perf_counter() - start)
+    return latencies
@@ -0,0 +1,357 @@
+"""
+Bộ phân tích intent cục bộ, chạy trước structured_llm.
+
+Chỉ trả về UserIntent khi chắc chắn (ví dụ "2 cơm sườn", "cho mình ba trà đá
+nhé", "2 com suon", "2 phở bò, 1 trà đá", "không mua nữa"). Mọi trường hợp
+còn lại trả về None để LLM xử lý.
+"""
+
+import re
+import threading
+import unicodedata
+from menu_cache import MenuSnapshot
+from schema import OrderLine, UserIntent
+from fuzzy_index import fold, get_menu_title_index
+from metrics import agent_metrics
+
+DIGITS = {
+    "không": 0,
+    "một": 1,
+    "mốt": 1,
+    "hai": 2,
+    "ba": 3,
+    "bốn": 4,
+    "tư": 4,
+    "năm": 5,
+    "lăm": 5,
+    "sáu": 6,
+    "bảy": 7,
+    "bẩy": 7,
+    "tám": 8,
+    "chín": 9,
+}
+
+# Từ chỉ đơn vị đứng giữa số lượng và tên món: "2 phần cơm sườn"
+CLASSIFIERS = set(
+    "phần suất xuất dĩa đĩa tô bát chén ly cốc cái chai lon hộp miếng cây món x".split()
+)
+
+# Các từ đệm không làm thay đổi ý nghĩa của một câu đặt món
+FILLERS = set(
+    "cho mình tôi tao em anh chị bạn lấy đặt mua gọi thêm muốn nhé nha nhá ạ à "
+    "đi nữa luôn với và giúp hộ ok oke vậy thì thôi order".split()
+)
+
+# Có các từ này thì câu có thể mang nghĩa phủ định/huỷ -> để LLM xử lý
+NEGATIONS = set("không ko k hông khỏi bỏ hủy huỷ đừng chưa trừ bớt".split())
+
+REFUSALS = {
+    "không mua nữa",
+    "không mua",
+    "không đặt nữa",
+    "không đặt",
+    "không lấy nữa",
+    "không cần nữa",
+    "không cần",
+    "không muốn mua nữa",
+    "không muốn mua",
+    "ko mua nữa",
+    "ko mua",
+    "k mua nữa",
+    "thôi",
+    "thôi không mua nữa",
+    "thôi không mua",
+    "thôi khỏi",
+    "khỏi",
+    "vậy thôi",
+    "thế thôi",
+    "đủ rồi",
+    "vậy đủ rồi",
+    "hết rồi",
+    "vậy là đủ",
+    "xong rồi",
+}
+
+# Các từ lịch sự ở cuối câu, bỏ đi trước khi so với REFUSALS
+TRAILING_PARTICLES = set("ạ à nhé nha nhá đâu bạn em shop".split())
+
+# Số lượng lớn bất thường thì không tự tin, để LLM hỏi lại
+MAX_QUANTITY = 50
+
+# Tên món gõ sai/thiếu: chỉ nhận khi điểm fuzzy đủ cao và bỏ xa ứng viên thứ hai
+FUZZY_MIN_SCORE = 0.7
+FUZZY_MARGIN = 0.1
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_DIGIT_RE = re.compile(r"(\d+)")
+
+
+def normalize(text: str) -> list[str]:
+    """Chuẩn hoá (NFC, chữ thường, bỏ dấu câu) và tách thành các từ"""
+    text = unicodedata.normalize("NFC", text).lower()
+    text = _PUNCT_RE.sub(" ", text)
+    # Tách số khỏi chữ: "x2" -> "x 2", "2phần" -> "2 phần"
+    text = _DIGIT_RE.sub(r" \1 ", text)
+    return text.split()
+
+
+def matches_diacritics(typed: list[str], title: tuple[str, ...]) -> bool:
+    """
+    Các từ khách gõ có dấu phải đúng dấu của tên món ("bơ" không khớp "bò"),
+    từ gõ không dấu thì khớp theo chữ ("bo" khớp cả hai)
+    """
+    return all(word == exact or word == fold(word) for word, exact in zip(typed, title))
+
+
+def parse_quantity(tokens: list[str]) -> int | None:
+    """
+    Đọc số lượng từ một dãy từ liên tiếp: "2", "hai", "mười hai",
+    "hai mươi lăm", "một chục", "nửa chục". Trả về None nếu không phải số.
+    """
+    if not tokens:
+        return None
+    if len(tokens) == 1 and tokens[0].isdigit():
+        return int(tokens[0])
+
+    if tokens[-1] == "chục":
+        if len(tokens) == 1:
+            return 10
+        if tokens[:-1] == ["nửa"]:
+            return 5
+        base = parse_quantity(tokens[:-1])
+        return base * 10 if base else None
+
+    total = 0
+    tens_seen = False
+    for index, token in enumerate(tokens):
+        if token == "mười" and index == 0:
+            total = 10
+            tens_seen = True
+        elif token == "mươi" and index == 1 and total >= 2:
+            total *= 10
+            tens_seen = True
+        elif token in DIGITS:
+            value = DIGITS[token]
+            # "mốt", "lăm", "tư" chỉ hợp lệ sau hàng chục
+            if token in ("mốt", "lăm") and not tens_seen:
+                return None
+            if index > 0 and not tens_seen:
+                return None
+            total += value
+        else:
+            return None
+    return total or None
+
+
+class FastIntentParser:
+    """Parser cục bộ kèm bộ đếm hit/miss để theo dõi tỉ lệ phải gọi LLM"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._titles_version: int | None = None
+        self._titles: list[tuple[tuple[str, ...], tuple[str, ...], int]] = []
+        self._by_folded: dict[tuple[str, ...], list[tuple[tuple[str, ...], int]]] = {}
+
+    def _get_titles(self, menu: MenuSnapshot):
+        """
+        Danh sách (tên món đã tách từ, tên đã bỏ dấu, item_id), tên dài xếp
+        trước, và tên đã bỏ dấu -> các món có tên đó
+        """
+        if self._titles_version != menu.version:
+            titles = []
+            by_folded = {}
+            for item in menu.items:
+                exact = tuple(normalize(item.title))
+                folded = tuple(fold(word) for word in exact)
+                titles.append((exact, folded, item.id))
+                by_folded.setdefault(folded, []).append((exact, item.id))
+            titles.sort(key=lambda entry: len(entry[0]), reverse=True)
+            with self._lock:
+                self._titles = titles
+                self._by_folded = by_folded
+                self._titles_version = menu.version
+        return self._titles, self._by_folded
+
+    def _find_dishes(
+        self, tokens: list[str], menu: MenuSnapshot
+    ) -> list[tuple[int, int, int]] | None:
+        """
+        Tìm các tên món xuất hiện trong câu: (start, end, item_id), không chồng lấn.
+
+        Khớp đúng tên (cả dấu) trước, sau đó mới khớp trên từ đã bỏ dấu nên
+        "com suon" khớp "Cơm sườn". Trả về None (để LLM xử lý) khi bỏ dấu thì
+        không biết là món nào: "ca kho" với "Cá kho" và "Cà kho", hoặc "bơ"
+        khi menu chỉ có "Bò".
+        """
+        titles, by_folded = self._get_titles(menu)
+        folded_tokens = [fold(token) for token in tokens]
+        found = []
+        used = [False] * len(tokens)
+
+        def spans(words: list[str], title: tuple[str, ...]):
+            size = len(title)
+            for start in range(len(words) - size + 1) if size else ():
+                end = start + size
+                if tuple(words[start:end]) == title and not any(used[start:end]):
+                    yield start, end
+
+        def take(start: int, end: int, item_id: int) -> None:
+            found.append((start, end, item_id))
+            for i in range(start, end):
+                used[i] = True
+
+        for exact, _, item_id in titles:
+            for start, end in spans(tokens, exact):
+                take(start, end, item_id)
+        for _, folded, _ in titles:
+            for start, end in spans(folded_tokens, folded):
+                typed = tokens[start:end]
+                item_ids = {
+                    item_id
+                    for exact, item_id in by_folded[folded]
+                    if matches_diacritics(typed, exact)
+                }
+                if len(item_ids) != 1:
+                    return None
+                take(start, end, item_ids.pop())
+        return found
+
+    def _split_quantities(self, tokens: list[str]) -> tuple[list[int], list[str]]:
+        """Tách các cụm số lượng ra khỏi câu, bỏ qua từ đệm và đơn vị"""
+        quantities = []
+        others = []
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            if token in CLASSIFIERS or token in FILLERS or token == "|":
+                index += 1
+                continue
+            # Gom dãy từ số dài nhất bắt đầu tại index
+            for stop in range(len(tokens), index, -1):
+                quantity = parse_quantity(tokens[index:stop])
+                if quantity is not None:
+                    quantities.append(quantity)
+                    index = stop
+                    break
+            else:
+                others.append(token)
+                index += 1
+        return quantities, others
+
+    def _fuzzy_dish(self, mention: list[str], menu: MenuSnapshot) -> int | None:
+        """Đoán món từ phần còn lại của câu, chỉ khi có một ứng viên rõ ràng"""
+        if not mention:
+            return None
+        candidates = get_menu_title_index(menu).search(
+            " ".join(mention), limit=2, min_score=FUZZY_MIN_SCORE
+        )
+        if not candidates:
+            return None
+        if len(candidates) > 1 and candidates[0][1] - candidates[1][1] < FUZZY_MARGIN:
+            return None
+        # Index dùng chung có thể vừa được đồng bộ với snapshot khác
+        item = menu.get(candidates[0][0])
+        if item is None:
+            return None
+        # Từ có dấu không có trong tên món ("2 bơ" với "Bò"): có thể là món khác
+        words = set(normalize(item.title))
+        if any(word != fold(word) and word not in words for word in mention):
+            return None
+        return item.id
+
+    def _parse(self, text: str, menu: MenuSnapshot) -> UserIntent | None:
+        if "?" in text:
+            return None
+        tokens = normalize(text)
+        if not tokens:
+            return None
+
+        dishes = self._find_dishes(tokens, menu)
+        if dishes is None:
+            return None
+        if not dishes:
+            stripped = list(tokens)
+            while len(stripped) > 1 and stripped[-1] in TRAILING_PARTICLES:
+                stripped.pop()
+            if " ".join(stripped) in REFUSALS:
+                return UserIntent(intent="NOT_BUY")
+            if any(token in NEGATIONS for token in tokens):
+                return None
+            # Không khớp chính xác: thử tên món gõ sai ("2 com suong")
+            quantities, others = self._split_quantities(tokens)
+            item_id = self._fuzzy_dish(others, menu)
+            if item_id is None:
+                return None
+            others = []
+        elif len(dishes) > 1:
+            return self._parse_many(tokens, dishes)
+        else:
+            start, end, item_id = dishes[0]
+            rest = tokens[:start] + ["|"] + tokens[end:]
+            if any(token in NEGATIONS for token in rest):
+                return None
+            quantities, others = self._split_quantities(rest)
+
+        if others or len(quantities) != 1 or not 0 < quantities[0] <= MAX_QUANTITY:
+            return None
+        return UserIntent(
+            intent="BUY", items=[OrderLine(item_id=item_id, quantity=quantities[0])]
+        )
+
+    def _parse_many(
+        self, tokens: list[str], dishes: list[tuple[int, int, int]]
+    ) -> UserIntent | None:
+        """
+        Nhiều món trong một câu: các đoạn giữa các tên món phải là đúng một số
+        lượng, cùng đứng trước ("2 phở bò 1 trà đá") hoặc cùng đứng sau tên món
+        ("phở bò x2, trà đá x1").
+        """
+        if any(token in NEGATIONS for token in tokens):
+            return None
+        dishes = sorted(dishes)
+        bounds = [0] + [end for _, end, _ in dishes]
+        starts = [start for start, _, _ in dishes] + [len(tokens)]
+        gaps = []
+        for gap_start, gap_end in zip(bounds, starts):
+            quantities, others = self._split_quantities(tokens[gap_start:gap_end])
+            if others or len(quantities) > 1:
+                return None
+            gaps.append(quantities)
+
+        if gaps[0] and not gaps[-1]:
+            quantities = gaps[:-1]  # số lượng đứng trước tên món
+        elif gaps[-1] and not gaps[0]:
+            quantities = gaps[1:]  # số lượng đứng sau tên món
+        else:
+            return None
+        if not all(q and 0 < q[0] <= MAX_QUANTITY for q in quantities):
+            return None
+        return UserIntent(
+            intent="BUY",
+            items=[
+                OrderLine(item_id=item_id, quantity=q[0])
+                for (_, _, item_id), q in zip(dishes, quantities)
+            ],
+        )
+
+    def parse(self, text: str, menu: MenuSnapshot) -> UserIntent | None:
+        parsed = self._parse(text, menu)
+        if parsed is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        agent_metrics.record_cache("fast_intent", parsed is not None)
+        return parsed
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "fallback_rate": self.misses / total if total else 0.0,
+        }
+
+
+fast_intent_parser = FastIntentParser()
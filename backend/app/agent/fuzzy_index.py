@@ -0,0 +1,192 @@
+"""
+Index tìm tên món gần đúng, không phân biệt dấu tiếng Việt.
+
+Mỗi tên món được bỏ dấu ("Cơm sườn" -> "com suon") rồi tách thành các
+trigram ký tự (giống pg_trgm) để chấm điểm; ứng viên được lấy qua index từ
+nên không cần duyệt toàn bộ menu.
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Iterable
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+
+
+def fold(text: str) -> str:
+    """Bỏ dấu, chữ thường, bỏ dấu câu: "Phở Bò Tái!" -> "pho bo tai" """
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _NON_WORD_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def trigrams(text: str) -> frozenset[str]:
+    """Trigram của từng từ, mỗi từ được đệm 2 dấu cách phía trước, 1 phía sau"""
+    grams = set()
+    for word in fold(text).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i : i + 3])
+    return frozenset(grams)
+
+
+class FuzzyIndex:
+    """
+    Index tên món, cập nhật được từng món.
+
+    Tìm ứng viên theo từ: mỗi từ của truy vấn được so gần đúng với tập từ vựng
+    của các tên món, rồi chỉ lấy các món chứa những từ hiếm nhất. Nhờ vậy số
+    món phải chấm điểm nhỏ dù menu rất lớn.
+
+    Điểm của một ứng viên là trung bình có trọng số của:
+    - coverage: tỉ lệ trigram của câu truy vấn có trong tên món
+    - jaccard: độ giống nhau tổng thể giữa hai tập trigram
+    coverage_weight cao phù hợp cho ô tìm kiếm ("com" khớp mọi món cơm),
+    thấp khi cần đoán đúng một món từ lời khách ("com suong" -> "Cơm sườn").
+    """
+
+    # Hai từ được coi là "giống nhau" khi jaccard trigram của chúng đạt ngưỡng này
+    WORD_SIMILARITY = 0.4
+
+    def __init__(
+        self, items: Iterable[tuple[int, str]] = (), coverage_weight: float = 0.5
+    ):
+        self.coverage_weight = coverage_weight
+        self._lock = threading.Lock()
+        self._titles: dict[int, str] = {}
+        self._grams: dict[int, frozenset[str]] = {}
+        self._item_words: dict[int, frozenset[str]] = {}
+        # từ (đã bỏ dấu) -> các món chứa từ đó
+        self._words: dict[str, set[int]] = {}
+        # trigram -> các từ chứa trigram đó (index trên từ vựng, không phải trên món)
+        self._vocab: dict[str, set[str]] = {}
+        for item_id, title in items:
+            self.add(item_id, title)
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._titles
+
+    def add(self, item_id: int, title: str) -> None:
+        """Thêm hoặc cập nhật tên của một món"""
+        with self._lock:
+            self._add(item_id, title)
+
+    def _add(self, item_id: int, title: str) -> None:
+        if self._titles.get(item_id) == title:
+            return
+        self._remove(item_id)
+        words = frozenset(fold(title).split())
+        self._titles[item_id] = title
+        self._grams[item_id] = trigrams(title)
+        self._item_words[item_id] = words
+        for word in words:
+            posting = self._words.get(word)
+            if posting is None:
+                posting = self._words[word] = set()
+                for gram in trigrams(word):
+                    self._vocab.setdefault(gram, set()).add(word)
+            posting.add(item_id)
+
+    def remove(self, item_id: int) -> None:
+        with self._lock:
+            self._remove(item_id)
+
+    def _remove(self, item_id: int) -> None:
+        self._titles.pop(item_id, None)
+        self._grams.pop(item_id, None)
+        for word in self._item_words.pop(item_id, ()):
+            posting = self._words[word]
+            posting.discard(item_id)
+            if posting:
+                continue
+            # Từ không còn món nào dùng: bỏ khỏi từ vựng
+            del self._words[word]
+            for gram in trigrams(word):
+                words = self._vocab[gram]
+                words.discard(word)
+                if not words:
+                    del self._vocab[gram]
+
+    def sync(self, items: Iterable[tuple[int, str]]) -> None:
+        """Đồng bộ với danh sách món mới: chỉ thêm/sửa/xoá những món thay đổi"""
+        items = dict(items)
+        with self._lock:
+            for item_id in [i for i in self._titles if i not in items]:
+                self._remove(item_id)
+            for item_id, title in items.items():
+                self._add(item_id, title)
+
+    def search(
+        self, query: str, limit: int = 5, min_score: float = 0.3
+    ) -> list[tuple[int, float]]:
+        """Trả về [(item_id, score)] giảm dần theo score, score trong [0, 1]"""
+        query_grams = trigrams(query)
+        if not query_grams or limit <= 0:
+            return []
+
+        with self._lock:
+            results = self._search(query, query_grams, min_score)
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:limit]
+
+    def _similar_words(self, word: str) -> set[int]:
+        """Các món chứa một từ gần giống `word` (kể cả chính nó)"""
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._vocab.get(gram, ()))
+        items: set[int] = set()
+        for other, count in shared.items():
+            # Số trigram của một từ = số ký tự + 2 (do đệm)
+            union = len(grams) + len(other) + 2 - count
+            if count / union >= self.WORD_SIMILARITY:
+                items |= self._words[other]
+        return items
+
+    def _search(
+        self, query: str, query_grams: frozenset[str], min_score: float
+    ) -> list[tuple[int, float]]:
+        # Món đạt min_score phải chứa phần lớn từ của truy vấn, nên chỉ cần lấy
+        # ứng viên từ (số từ - số từ cần khớp + 1) từ hiếm nhất
+        words = set(fold(query).split())
+        needed = max(1, math.ceil(min_score * len(words)))
+        # Từ không khớp từ nào trong menu (gõ sai nặng) không đóng góp ứng viên
+        matches = sorted(filter(None, map(self._similar_words, words)), key=len)
+        candidates = set().union(*matches[: max(0, len(matches) - needed + 1)])
+
+        results = []
+        size = len(query_grams)
+        weight = self.coverage_weight
+        for item_id in candidates:
+            grams = self._grams[item_id]
+            count = len(query_grams & grams)
+            coverage = count / size
+            jaccard = count / (size + len(grams) - count)
+            score = coverage * weight + jaccard * (1 - weight)
+            if score >= min_score:
+                results.append((item_id, score))
+        return results
+
+
+# Index dùng cho agent, luôn đồng bộ với MenuSnapshot đang dùng
+_menu_index = FuzzyIndex(coverage_weight=0.2)
+_menu_index_source = None
+_menu_index_lock = threading.Lock()
+
+
+def get_menu_title_index(menu) -> FuzzyIndex:
+    """Index tên món theo MenuSnapshot, cập nhật tăng dần khi snapshot đổi"""
+    global _menu_index_source
+    if _menu_index_source is not menu:
+        with _menu_index_lock:
+            if _menu_index_source is not menu:
+                _menu_index.sync((item.id, item.title) for item in menu.items)
+                _menu_index_source = menu
+    return _menu_index
@@ -1,18 +1,26 @@
 from typing import Literal
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from schema import AgentState
+from checkpoint_store import create_checkpointer
+from config import AGENT_GRAPH_MODE
+from metrics import agent_metrics
 from nodes import (
     get_data,
     greet_user,
     get_user_input,
     parse_user_order,
+    parse_and_reply,
     solve_unclear,
     solve_buy,
     solve_not_buy,
 )
 
 
+# Các node mà output LLM (JSON intent) không được stream cho khách;
+# parse_and_reply tự stream phần reply qua stream "custom"
+SILENT_NODES = {"parse_user_order", "parse_and_reply"}
+
+
 def route_after_parse(
     state: AgentState,
 ) -> Literal["solve_buy", "solve_not_buy", "solve_unclear"]:
@@ -24,27 +32,25 @@ def route_after_parse(
     return "solve_unclear"
 
 
-def build_graph():
-    """
-    Build the agent graph with original flow.
-    Uses interrupt_before to pause at get_user_input node,
-    allowing external input from either CLI or API.
-    """
-    workflow = StateGraph(AgentState)
+def route_after_reply(state: AgentState) -> Literal["get_user_input", "__end__"]:
+    if state.get("user_intent") == "NOT_BUY":
+        return END
+    return "get_user_input"
 
-    # Nodes - giữ nguyên như ban đầu
-    workflow.add_node("get_data", get_data)
-    workflow.add_node("greet_user", greet_user)
-    workflow.add_node("get_user_input", get_user_input)
-    workflow.add_node("parse_user_order", parse_user_order)
-    workflow.add_node("solve_unclear", solve_unclear)
-    workflow.add_node("solve_buy", solve_buy)
-    workflow.add_node("solve_not_buy", solve_not_buy)
+
+def add_node(workflow: StateGraph, name: str, node) -> None:
+    """Thêm node, bọc để đo thời gian chạy (xem metrics.py)"""
+    workflow.add_node(name, agent_metrics.instrument_node(name, node))
+
+
+def add_two_call_nodes(workflow: StateGraph) -> None:
+    """Luồng ban đầu: parse_user_order xác định intent, solve_* trả lời"""
+    add_node(workflow, "parse_user_order", parse_user_order)
+    add_node(workflow, "solve_unclear", solve_unclear)
+    add_node(workflow, "solve_buy", solve_buy)
+    add_node(workflow, "solve_not_buy", solve_not_buy)
 
     # Edges - giữ nguyên luồng ban đầu
-    workflow.add_edge(START, "get_data")
-    workflow.add_edge("get_data", "greet_user")
-    workflow.add_edge("greet_user", "get_user_input")
     workflow.add_edge("get_user_input", "parse_user_order")
     workflow.add_conditional_edges(
         "parse_user_order",
@@ -59,14 +65,55 @@ def build_graph():
     workflow.add_edge("solve_buy", "get_user_input")
     workflow.add_edge("solve_not_buy", END)
 
+
+def build_graph(checkpointer=None, mode=None):
+    """
+    Build the agent graph with original flow.
+    Uses interrupt_before to pause at get_user_input node,
+    allowing external input from either CLI or API.
+
+    checkpointer mặc định lấy theo config (xem checkpoint_store.create_checkpointer).
+
+    mode (mặc định AGENT_GRAPH_MODE):
+    - "two_call": parse_user_order rồi solve_* (hai lần gọi LLM mỗi lượt)
+    - "single_call": parse_and_reply trả về intent và câu trả lời trong một lần gọi
+    """
+    mode = mode or AGENT_GRAPH_MODE
+    if mode not in ("two_call", "single_call"):
+        raise ValueError(f"Unknown agent graph mode: {mode}")
+    workflow = StateGraph(AgentState)
+
+    # Nodes - giữ nguyên như ban đầu
+    add_node(workflow, "get_data", get_data)
+    add_node(workflow, "greet_user", greet_user)
+    add_node(workflow, "get_user_input", get_user_input)
+
+    workflow.add_edge(START, "get_data")
+    workflow.add_edge("get_data", "greet_user")
+    workflow.add_edge("greet_user", "get_user_input")
+
+    if mode == "single_call":
+        add_node(workflow, "parse_and_reply", parse_and_reply)
+        workflow.add_edge("get_user_input", "parse_and_reply")
+        workflow.add_conditional_edges(
+            "parse_and_reply",
+            route_after_reply,
+            {"get_user_input": "get_user_input", END: END},
+        )
+    else:
+        add_two_call_nodes(workflow)
+
     # Add checkpointer for state persistence
-    checkpointer = MemorySaver()
+    if checkpointer is None:
+        checkpointer = create_checkpointer()
 
     # Compile với interrupt_before để dừng TRƯỚC khi chạy get_user_input
     # Điều này cho phép API/CLI inject user message vào state
     chain = workflow.compile(
         checkpointer=checkpointer, interrupt_before=["get_user_input"]
     )
+    # Đo thời gian / token của mọi lần gọi chat model trong graph
+    chain = chain.with_config(callbacks=[agent_metrics.callback_handler])
 
     return chain
 
@@ -0,0 +1,124 @@
+"""
+Cache lời chào của greet_user.
+
+Lời chào chỉ phụ thuộc vào tên khách và các món đang giảm giá của menu, nên
+được cache theo (version menu, các món giảm giá, tên). Mỗi key giữ một nhóm
+tối đa `variants` lời chào khác nhau do model viết, chọn ngẫu nhiên khi dùng
+để khách không thấy mãi một câu. Key dùng lâu nhất bị bỏ khi quá max_entries.
+
+Key chưa có lời chào nào: greet_user chào bằng template ngay, còn model viết
+lời chào cho key đó ở background (warm), không chặn request.
+"""
+
+import asyncio
+import contextvars
+import random
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from metrics import agent_metrics
+from config import GREETING_CACHE_MAX_ENTRIES, GREETING_CACHE_VARIANTS
+
+GreetingKey = tuple[str, tuple[str, ...], str]
+
+
+def greeting_key(menu_version: str, discount_names, user_name: str) -> GreetingKey:
+    return (menu_version, tuple(sorted(discount_names)), user_name)
+
+
+class GreetingCache:
+    """
+    Args:
+        variants: số lời chào khác nhau giữ cho mỗi key
+        max_entries: số key tối đa (LRU)
+    """
+
+    def __init__(self, variants: int = 3, max_entries: int = 1000):
+        self.variants = variants
+        self.max_entries = max_entries
+        self._entries: OrderedDict[GreetingKey, list[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Các key đang được model viết thêm lời chào (mỗi key một lần gọi)
+        self._warming: set[GreetingKey] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.evicted = 0
+
+    def get(self, key: GreetingKey) -> str | None:
+        """Một lời chào ngẫu nhiên của key, None nếu chưa có"""
+        with self._lock:
+            pool = self._entries.get(key)
+            if pool:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        agent_metrics.record_cache("greeting", bool(pool))
+        return random.choice(pool) if pool else None
+
+    def add(self, key: GreetingKey, text: str) -> None:
+        with self._lock:
+            pool = self._entries.setdefault(key, [])
+            self._entries.move_to_end(key)
+            if text not in pool and len(pool) < self.variants:
+                pool.append(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def warm(self, key: GreetingKey, generate: Callable[[], Awaitable[str]]) -> asyncio.Task | None:
+        """
+        Cho model viết thêm một lời chào cho key ở background (nếu key còn
+        thiếu variant và chưa có lần gọi nào đang chạy).
+
+        Task chạy trong context rỗng: không thuộc về lượt chat hiện tại, nên
+        token của nó không bị stream cho khách và không tính vào lượt này.
+        """
+        with self._lock:
+            if len(self._entries.get(key, ())) >= self.variants or key in self._warming:
+                return None
+            self._warming.add(key)
+        task = asyncio.get_running_loop().create_task(
+            self._warm(key, generate), context=contextvars.Context()
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _warm(self, key: GreetingKey, generate: Callable[[], Awaitable[str]]) -> None:
+        try:
+            text = (await generate()).strip()
+            if text:
+                self.add(key, text)
+                self.generated += 1
+        except Exception as e:
+            print(f"[Greeting] Warm failed: {e}")
+        finally:
+            with self._lock:
+                self._warming.discard(key)
+
+    async def join(self) -> None:
+        """Chờ các lần warm đang chạy xong"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "variants": sum(len(pool) for pool in self._entries.values()),
+                "warming": len(self._warming),
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+                "evicted": self.evicted,
+            }
+
+
+greeting_cache = GreetingCache(GREETING_CACHE_VARIANTS, GREETING_CACHE_MAX_ENTRIES)
@@ -0,0 +1,162 @@
+"""
+Giới hạn lịch sử hội thoại gửi lên LLM.
+
+State vẫn giữ toàn bộ messages, nhưng mỗi lần gọi model chỉ gửi:
+system prompt + tóm tắt các lượt cũ + giỏ hàng hiện tại + N lượt gần nhất
+(trong giới hạn token). Nhờ vậy độ trễ và chi phí mỗi lượt không tăng theo
+độ dài cuộc hội thoại.
+"""
+
+import threading
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+)
+from prompt_store import approx_tokens
+
+# HumanMessage do node tự tạo (chỉ dẫn cho model), không phải lời của khách
+INSTRUCTION = "instruction"
+
+# Độ dài tối đa của một dòng trong phần tóm tắt
+SUMMARY_LINE_CHARS = 80
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content
+    return approx_tokens(content if isinstance(content, str) else str(content))
+
+
+def split_turns(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """Chia messages thành các lượt, mỗi lượt bắt đầu bằng một HumanMessage"""
+    turns: list[list[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def cart_summary(cart: list[dict] | None) -> str:
+    if not cart:
+        return "Giỏ hàng hiện tại: trống."
+    lines = [
+        f"- {line['quantity']} x {line['title']} (ID:{line['item_id']})"
+        for line in cart
+    ]
+    return "Giỏ hàng hiện tại:\n" + "\n".join(lines)
+
+
+def summarize_turns(turns: list[list[BaseMessage]], token_budget: int) -> str:
+    """Mỗi câu của khách/bot thành một dòng ngắn, giữ các dòng gần nhất"""
+    lines = []
+    for turn in turns:
+        for message in turn:
+            if isinstance(message, SystemMessage) or message.name == INSTRUCTION:
+                continue
+            role = "Bot" if isinstance(message, AIMessage) else "Khách"
+            text = " ".join(str(message.content).split())
+            if len(text) > SUMMARY_LINE_CHARS:
+                text = text[: SUMMARY_LINE_CHARS - 1] + "…"
+            lines.append(f"- {role}: {text}")
+
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        used += approx_tokens(line)
+        if used > token_budget:
+            break
+        kept.append(line)
+    kept.reverse()
+
+    if not kept:
+        return ""
+    omitted = len(lines) - len(kept)
+    header = "Tóm tắt các lượt trước"
+    if omitted:
+        header += f" (bỏ qua {omitted} câu cũ hơn)"
+    return header + ":\n" + "\n".join(kept)
+
+
+class HistoryMetrics:
+    """Đếm token đã gửi và token tiết kiệm được, theo từng loại lịch sử"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def record(self, kind: str, full_tokens: int, sent_tokens: int) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                kind, {"calls": 0, "full_tokens": 0, "sent_tokens": 0, "last_saved": 0}
+            )
+            stats["calls"] += 1
+            stats["full_tokens"] += full_tokens
+            stats["sent_tokens"] += sent_tokens
+            stats["last_saved"] = full_tokens - sent_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for kind, stats in self._stats.items():
+                saved = stats["full_tokens"] - stats["sent_tokens"]
+                result[kind] = {
+                    **stats,
+                    "saved_tokens": saved,
+                    "saved_per_call": saved / stats["calls"] if stats["calls"] else 0,
+                }
+            return result
+
+
+history_metrics = HistoryMetrics()
+
+
+def window_messages(
+    messages: list[BaseMessage],
+    *,
+    max_turns: int,
+    token_budget: int,
+    cart: list[dict] | None = None,
+    kind: str = "messages",
+) -> list[BaseMessage]:
+    """
+    Cắt lịch sử để gửi cho model.
+
+    - Giữ nguyên system prompt (messages[0]) và không tính vào token_budget
+    - Giữ tối đa max_turns lượt gần nhất trong token_budget (luôn giữ lượt cuối)
+    - Nếu có lượt bị bỏ, chúng được gộp thành một đoạn tóm tắt kèm giỏ hàng
+      hiện tại (thông tin giỏ hàng có thể nằm trong các lượt đã bỏ)
+    """
+    if not messages:
+        return messages
+    head, rest = [], messages
+    if isinstance(messages[0], SystemMessage):
+        head, rest = [messages[0]], messages[1:]
+
+    turns = split_turns(rest)
+    kept: list[list[BaseMessage]] = []
+    used = 0
+    for turn in reversed(turns):
+        cost = sum(message_tokens(message) for message in turn)
+        if kept and (len(kept) >= max_turns or used + cost > token_budget):
+            break
+        kept.append(turn)
+        used += cost
+    kept.reverse()
+    dropped = turns[: len(turns) - len(kept)]
+
+    window = head[:]
+    if dropped:
+        # Phần tóm tắt dùng tối đa 1/4 budget
+        parts = [summarize_turns(dropped, token_budget // 4), cart_summary(cart)]
+        context = "\n\n".join(part for part in parts if part)
+        window.append(SystemMessage(content=context))
+    for turn in kept:
+        window.extend(turn)
+
+    full_tokens = sum(message_tokens(message) for message in rest)
+    sent_tokens = sum(message_tokens(message) for message in window[len(head) :])
+    history_metrics.record(kind, full_tokens, sent_tokens)
+    return window
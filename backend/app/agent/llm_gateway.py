@@ -0,0 +1,542 @@
+"""
+Cổng chung cho mọi lần gọi model (llm / structured_llm / turn_llm).
+
+Giờ cao điểm mỗi request chat gọi Gemini ngay lập tức, không giới hạn, nên
+bị provider throttle và độ trễ đuôi tăng không kiểm soát. LLMGateway:
+
+- Giới hạn số lần gọi model chạy đồng thời (max_concurrency)
+- Các lần gọi phải chờ xếp vào hàng đợi công bằng theo user: khi có chỗ
+  trống, lần lượt (round-robin) mỗi user được một lượt, nên một user gửi
+  liên tục không chặn các user khác
+- Hàng đợi đầy (max_queue) hoặc chờ quá queue_timeout thì từ chối ngay bằng
+  LLMBusy (API trả về sự kiện SSE [BUSY] thay vì treo request)
+- Mỗi lần gọi có deadline (call_timeout). Quá deadline hoặc provider lỗi thì
+  raise LLMUnavailable: các node trả lời bằng template / parser cục bộ
+- Circuit breaker: lỗi liên tiếp quá breaker_failures lần thì mở mạch trong
+  breaker_reset giây, mọi lần gọi raise LLMUnavailable ngay (không chờ
+  provider); hết thời gian thì cho một lần gọi thử để đóng mạch lại
+- Hedging (chỉ với model được wrap(hedge=True), output không stream cho
+  khách): lần gọi chưa xong sau p95 độ trễ gần đây thì gửi thêm một request,
+  lấy kết quả của request xong trước
+- Độ sâu hàng đợi, số lần gọi đang chạy, thời gian chờ, số lần từ chối / lỗi,
+  hedge và trạng thái mạch được render cùng các metric khác của agent (metrics.py)
+- ModelRouter: mỗi node gọi model của route của nó (llm_routes.py), với
+  deadline riêng của route
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import ensure_config
+
+from metrics import Counter, Gauge, Histogram, agent_metrics
+from llm_routes import DEFAULT, ModelRoute
+from config import (
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+    LLM_CALL_TIMEOUT,
+    LLM_HEDGE_DELAY,
+    LLM_HEDGE_ENABLED,
+    LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_MAX,
+    LLM_QUEUE_TIMEOUT,
+)
+
+# Số lần gọi gần nhất dùng để tính p95 độ trễ (hedge delay), và số mẫu tối
+# thiểu trước khi dùng p95 thay cho hedge_delay cấu hình
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class LLMBusy(Exception):
+    """Không được gọi model: hàng đợi đầy hoặc chờ quá lâu"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LLM gateway busy ({reason})")
+        self.reason = reason
+
+
+class LLMUnavailable(Exception):
+    """Model không trả lời được: quá deadline, provider lỗi hoặc mạch đang mở"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LLM unavailable ({reason})")
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """
+    closed: gọi bình thường. Lỗi liên tiếp đủ failure_threshold lần -> open:
+    từ chối mọi lần gọi. Sau reset_timeout giây -> half_open: cho đúng một
+    lần gọi thử, thành công thì closed, lỗi thì open lại.
+    """
+
+    STATES = ("closed", "half_open", "open")
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Lần gọi này có được gửi tới provider không"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = self._clock()
+        self._probing = False
+
+    def end_probe(self) -> None:
+        """
+        Lần gọi thử kết thúc mà không có kết quả (bị huỷ: khách ngắt kết nối,
+        request hedge thua, app tắt): cho lần gọi sau được thử lại
+        """
+        self._probing = False
+
+
+def caller_key() -> str:
+    """User của lần gọi hiện tại (metadata user_id), không có thì theo thread_id"""
+    config = ensure_config()
+    user_id = config.get("metadata", {}).get("user_id")
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"thread:{config.get('configurable', {}).get('thread_id', '-')}"
+
+
+class LLMGateway:
+    """
+    Args:
+        max_concurrency: số lần gọi model chạy đồng thời tối đa
+        max_queue: số lần gọi được chờ tối đa (tính chung mọi user)
+        queue_timeout: thời gian chờ tối đa trong hàng đợi (giây)
+        call_timeout: deadline của một lần gọi model (giây, None: không giới hạn)
+        breaker: circuit breaker (mặc định CircuitBreaker())
+        hedge_delay: gửi request thứ hai sau bấy nhiêu giây khi chưa đủ mẫu
+            để tính p95 (None: tắt hedging)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        queue_timeout: float = 5.0,
+        call_timeout: float | None = 15.0,
+        breaker: CircuitBreaker | None = None,
+        hedge_delay: float | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_delay = hedge_delay
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.in_flight = 0
+        # user -> các lần gọi đang chờ (Future được set khi tới lượt), và thứ tự
+        # round-robin giữa các user đang có lần gọi chờ
+        self._waiting: dict[str, deque[asyncio.Future]] = {}
+        self._turns: deque[str] = deque()
+        self.queued = 0
+        self.calls = 0
+
+        self.queue_depth = Gauge("agent_llm_queue_depth", "Số lần gọi model đang chờ")
+        self.in_flight_gauge = Gauge("agent_llm_in_flight", "Số lần gọi model đang chạy")
+        self.wait_seconds = Histogram(
+            "agent_llm_queue_wait_seconds", "Thời gian chờ trong hàng đợi trước khi gọi model"
+        )
+        self.rejected = Counter(
+            "agent_llm_rejected_total", "Lần gọi model bị từ chối", ("reason",)
+        )
+        self.failures = Counter(
+            "agent_llm_failures_total", "Lần gọi model không có kết quả", ("reason",)
+        )
+        self.hedges = Counter(
+            "agent_llm_hedged_total", "Request thứ hai đã gửi / thắng request đầu", ("result",)
+        )
+        self.breaker_state = Gauge(
+            "agent_llm_circuit_state", "Trạng thái mạch: 0 closed, 1 half_open, 2 open"
+        )
+
+    def _update_gauges(self) -> None:
+        self.queue_depth.set(self.queued)
+        self.in_flight_gauge.set(self.in_flight)
+        self.breaker_state.set(CircuitBreaker.STATES.index(self.breaker.state))
+
+    def available(self) -> bool:
+        """Mạch không mở: có nên thử gọi model không"""
+        return self.breaker.state != "open"
+
+    def _fail(self, reason: str) -> LLMUnavailable:
+        self.failures.inc(1, reason)
+        if reason != "circuit_open":
+            self.breaker.record_failure()
+        self._update_gauges()
+        return LLMUnavailable(reason)
+
+    def _check_breaker(self) -> bool:
+        """
+        Gọi sau khi đã có chỗ (half_open chỉ cho một lần gọi thử). Trả về True
+        nếu lần gọi này là lần gọi thử: người gọi phải end_probe() khi xong
+        """
+        probe = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            raise self._fail("circuit_open")
+        return probe
+
+    def _fail_fast(self) -> None:
+        """Mạch đang mở thì từ chối ngay, không xếp hàng"""
+        if not self.available():
+            raise self._fail("circuit_open")
+
+    def _succeed(self, seconds: float | None = None) -> None:
+        self.breaker.record_success()
+        if seconds is not None:
+            self._latencies.append(seconds)
+        self._update_gauges()
+
+    def _reject(self, reason: str) -> LLMBusy:
+        self.rejected.inc(1, reason)
+        return LLMBusy(reason)
+
+    def _dequeue(self, key: str, future: asyncio.Future) -> None:
+        waiting = self._waiting.get(key)
+        if waiting is not None and future in waiting:
+            waiting.remove(future)
+            self.queued -= 1
+            if not waiting:
+                del self._waiting[key]
+                self._turns.remove(key)
+
+    async def acquire(self, key: str) -> None:
+        """Chờ tới lượt gọi model, raise LLMBusy nếu bị từ chối"""
+        if self.in_flight < self.max_concurrency and not self.queued:
+            self.in_flight += 1
+            self.wait_seconds.observe(0)
+            self._update_gauges()
+            return
+        if self.queued >= self.max_queue:
+            raise self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        if key not in self._waiting:
+            self._waiting[key] = deque()
+            self._turns.append(key)
+        self._waiting[key].append(future)
+        self.queued += 1
+        self._update_gauges()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                # Tới lượt đúng lúc hết thời gian chờ
+                return
+            future.cancel()
+            self._dequeue(key, future)
+            self._update_gauges()
+            raise self._reject("queue_timeout") from None
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Đã tới lượt nhưng request bị huỷ: trả lại chỗ cho người khác
+                self.release()
+            else:
+                future.cancel()
+                self._dequeue(key, future)
+                self._update_gauges()
+            raise
+        finally:
+            self.wait_seconds.observe(time.perf_counter() - started)
+
+    def release(self) -> None:
+        """Trả chỗ: nhường cho lần gọi đang chờ của user kế tiếp (round-robin)"""
+        while self._turns:
+            key = self._turns.popleft()
+            waiting = self._waiting[key]
+            future = waiting.popleft()
+            self.queued -= 1
+            if waiting:
+                self._turns.append(key)
+            else:
+                del self._waiting[key]
+            if not future.done():
+                # Giữ nguyên in_flight: chỗ được chuyển thẳng cho lần gọi này
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self.in_flight -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self, key: str | None = None) -> AsyncIterator[None]:
+        await self.acquire(key or caller_key())
+        self.calls += 1
+        try:
+            yield
+        finally:
+            self.release()
+
+    def try_acquire(self) -> bool:
+        """Lấy chỗ nếu đang trống và không ai chờ (dùng cho request hedge)"""
+        if self.in_flight < self.max_concurrency and not self.queued:
+            self.in_flight += 1
+            self._update_gauges()
+            return True
+        return False
+
+    def current_hedge_delay(self) -> float | None:
+        """p95 độ trễ các lần gọi gần đây, chưa đủ mẫu thì dùng hedge_delay"""
+        if self.hedge_delay is None:
+            return None
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return self.hedge_delay
+        values = sorted(self._latencies)
+        return values[math.ceil(0.95 * len(values)) - 1]
+
+    def _timeout(self, timeout: float | None) -> float | None:
+        """Deadline của route, không có thì call_timeout"""
+        return self.call_timeout if timeout is None else timeout
+
+    async def _attempt(self, coro_factory, timeout: float | None):
+        """Một request tới provider, có deadline, cập nhật circuit breaker"""
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(coro_factory(), timeout)
+        except asyncio.TimeoutError:
+            raise self._fail("deadline") from None
+        except OutputParserException:
+            # Provider vẫn trả lời, chỉ là output sai định dạng
+            self._succeed()
+            raise
+        except Exception as e:
+            raise self._fail("error") from e
+        self._succeed(time.perf_counter() - started)
+        return result
+
+    async def call(self, coro_factory, key: str | None = None, timeout: float | None = None):
+        """Chạy coro_factory() khi tới lượt, giới hạn trong timeout (mặc định call_timeout)"""
+        self._fail_fast()
+        async with self.slot(key):
+            probe = self._check_breaker()
+            try:
+                return await self._attempt(coro_factory, self._timeout(timeout))
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+
+    async def hedged_call(self, coro_factory, key: str | None = None, timeout: float | None = None):
+        """
+        Như call(), nhưng request đầu chưa xong sau current_hedge_delay() thì
+        gửi thêm một request (nếu còn chỗ trống), lấy kết quả xong trước
+        """
+        delay = self.current_hedge_delay()
+        if delay is None:
+            return await self.call(coro_factory, key, timeout)
+        timeout = self._timeout(timeout)
+        self._fail_fast()
+        async with self.slot(key):
+            probe = self._check_breaker()
+            first = asyncio.ensure_future(self._attempt(coro_factory, timeout))
+            pending = {first}
+            hedged = False
+            try:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                # Circuit half-open chỉ cho đúng một request thử đi qua
+                if done or probe or not self.try_acquire():
+                    return await first
+
+                hedged = True
+                self.hedges.inc(1, "launched")
+                remaining = None if timeout is None else max(0.0, timeout - delay)
+                second = asyncio.ensure_future(self._attempt(coro_factory, remaining))
+                pending = {first, second}
+                error = None
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is second:
+                                self.hedges.inc(1, "won")
+                            return task.result()
+                        error = error or task.exception()
+                raise error
+            finally:
+                # Bị huỷ khi đang chờ: huỷ luôn các request còn chạy
+                for task in pending:
+                    task.cancel()
+                if hedged:
+                    self.release()
+                if probe:
+                    self.breaker.end_probe()
+
+    async def stream(self, iterator_factory, key: str | None = None, timeout: float | None = None):
+        """Như call() nhưng cho stream: tổng thời gian stream giới hạn trong timeout"""
+        timeout = self._timeout(timeout)
+        self._fail_fast()
+        async with self.slot(key):
+            probe = self._check_breaker()
+            deadline = None
+            if timeout is not None:
+                deadline = asyncio.get_running_loop().time() + timeout
+            iterator = aiter(iterator_factory())
+            received = False
+            try:
+                while True:
+                    try:
+                        async with asyncio.timeout_at(deadline):
+                            chunk = await anext(iterator)
+                    except StopAsyncIteration:
+                        if not received:
+                            self._succeed()
+                        return
+                    except TimeoutError:
+                        raise self._fail("deadline") from None
+                    except OutputParserException:
+                        self._succeed()
+                        raise
+                    except Exception as e:
+                        raise self._fail("error") from e
+                    if not received:
+                        # Có token đầu tiên: provider đang hoạt động
+                        received = True
+                        self._succeed()
+                    yield chunk
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+                await iterator.aclose()
+
+    def wrap(self, model, hedge: bool = False, timeout: float | None = None) -> "GatedModel":
+        """hedge=True chỉ dùng cho model mà output không stream cho khách"""
+        return GatedModel(model, self, hedge, timeout)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "waiting_users": len(self._waiting),
+            "calls": self.calls,
+            "rejected": {
+                reason: int(self.rejected.value(reason))
+                for reason in ("queue_full", "queue_timeout")
+            },
+            "failures": {
+                reason: int(self.failures.value(reason))
+                for reason in ("deadline", "error", "circuit_open")
+            },
+            "circuit": self.breaker.state,
+            "hedge_delay": self.current_hedge_delay(),
+            "hedged": int(self.hedges.value("launched")),
+            "hedge_wins": int(self.hedges.value("won")),
+        }
+
+
+class GatedModel:
+    """Model (hoặc chain structured output) mà mọi lần gọi đi qua LLMGateway"""
+
+    def __init__(self, model, gateway: LLMGateway, hedge: bool = False, timeout: float | None = None):
+        self.model = model
+        self.gateway = gateway
+        self.hedge = hedge
+        self.timeout = timeout
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        call = self.gateway.hedged_call if self.hedge else self.gateway.call
+        return await call(lambda: self.model.ainvoke(input, config, **kwargs), timeout=self.timeout)
+
+    def astream(self, input, config=None, **kwargs):
+        return self.gateway.stream(
+            lambda: self.model.astream(input, config, **kwargs), timeout=self.timeout
+        )
+
+
+def current_node(config=None) -> str | None:
+    """Node của graph đang gọi model (metadata langgraph_node), None khi gọi ngoài graph"""
+    node = (config or {}).get("metadata", {}).get("langgraph_node")
+    return node or ensure_config().get("metadata", {}).get("langgraph_node")
+
+
+class ModelRouter:
+    """
+    Chọn model theo node đang chạy: node có route riêng thì dùng model của
+    route đó, không thì route "default". Mọi lần gọi đi qua gateway với
+    deadline của route.
+
+    Args:
+        models: node -> chat model (hoặc chain structured output) của route
+        routes: node -> ModelRoute (deadline, giá token)
+        gateway: LLMGateway dùng chung
+        hedge: xem LLMGateway.wrap
+    """
+
+    def __init__(
+        self,
+        models: dict,
+        routes: dict[str, ModelRoute],
+        gateway: LLMGateway,
+        hedge: bool = False,
+    ):
+        self.routes = routes
+        self.models = {
+            node: gateway.wrap(model, hedge, routes[node].timeout)
+            for node, model in models.items()
+        }
+        for route in routes.values():
+            agent_metrics.set_model_price(route.model, route.input_price, route.output_price)
+
+    def for_node(self, node: str | None) -> GatedModel:
+        return self.models.get(node) or self.models[DEFAULT]
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.for_node(current_node(config)).ainvoke(input, config, **kwargs)
+
+    def astream(self, input, config=None, **kwargs):
+        return self.for_node(current_node(config)).astream(input, config, **kwargs)
+
+
+llm_gateway = LLMGateway(
+    LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_MAX,
+    LLM_QUEUE_TIMEOUT,
+    LLM_CALL_TIMEOUT or None,
+    breaker=CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS),
+    hedge_delay=LLM_HEDGE_DELAY if LLM_HEDGE_ENABLED else None,
+)
+agent_metrics.register(
+    llm_gateway.queue_depth,
+    llm_gateway.in_flight_gauge,
+    llm_gateway.wait_seconds,
+    llm_gateway.rejected,
+    llm_gateway.failures,
+    llm_gateway.hedges,
+    llm_gateway.breaker_state,
+)
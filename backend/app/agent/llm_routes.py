@@ -0,0 +1,83 @@
+"""
+Bảng định tuyến model theo node của graph.
+
+Mỗi node gọi LLM (greet_user, parse_user_order, parse_and_reply, solve_*)
+có thể dùng model, temperature, max_output_tokens và deadline riêng: phân
+loại intent cần model nhỏ, nhanh, temperature 0; lời chào cần model viết hay
+hơn. Node không có trong bảng dùng route "default".
+
+Bảng được đọc một lần lúc khởi động từ LLM_ROUTES (JSON) hoặc LLM_ROUTES_FILE
+(đường dẫn file JSON), ghi đè lên DEFAULT_ROUTES theo từng field:
+
+    {"default": {"model": "gemini-2.0-flash"},
+     "parse_user_order": {"model": "gemini-2.0-flash-lite", "temperature": 0}}
+
+Giá (USD / 1 triệu token) dùng để tính chi phí theo route trong metrics.py.
+"""
+
+import json
+import os
+from typing import Optional
+from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel
+from fake_llm import FakeChatModel
+
+DEFAULT = "default"
+
+
+class ModelRoute(BaseModel):
+    model: str = "gemini-2.0-flash"
+    temperature: float = 0.7
+    max_output_tokens: Optional[int] = None
+    # Deadline của một lần gọi (giây), None: dùng LLM_CALL_TIMEOUT của gateway
+    timeout: Optional[float] = None
+    input_price: float = 0.10
+    output_price: float = 0.40
+
+
+DEFAULT_ROUTES: dict[str, dict] = {
+    DEFAULT: {},
+    "greet_user": {"temperature": 0.9, "max_output_tokens": 300},
+    # Chỉ trả về JSON intent + items: model nhỏ, cố định, output ngắn
+    "parse_user_order": {
+        "model": "gemini-2.0-flash-lite",
+        "temperature": 0,
+        "max_output_tokens": 256,
+        "timeout": 8,
+        "input_price": 0.075,
+        "output_price": 0.30,
+    },
+    "parse_and_reply": {"temperature": 0.3, "max_output_tokens": 512},
+}
+
+
+def load_routes(raw: str | None = None, path: str | None = None) -> dict[str, ModelRoute]:
+    """DEFAULT_ROUTES ghi đè bởi JSON trong raw hoặc file path (path ưu tiên)"""
+    overrides: dict[str, dict] = {}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+    elif raw:
+        overrides = json.loads(raw)
+    if not isinstance(overrides, dict):
+        raise ValueError("LLM routes must be a JSON object: node -> route")
+
+    default = {**DEFAULT_ROUTES[DEFAULT], **overrides.get(DEFAULT, {})}
+    routes = {}
+    for node in {*DEFAULT_ROUTES, *overrides}:
+        fields = {**DEFAULT_ROUTES.get(node, {}), **overrides.get(node, {})}
+        # Field không khai báo cho node thì lấy theo route default
+        routes[node] = ModelRoute(**{**default, **fields})
+    return routes
+
+
+def build_model(route: ModelRoute, provider: str = "google", **fake_options):
+    """Chat model cho một route. provider="fake": FakeChatModel (fake_options: độ trễ)"""
+    if provider == "fake":
+        return FakeChatModel(model=route.model, **fake_options)
+    return ChatGoogleGenerativeAI(
+        model=route.model,
+        api_key=os.getenv("GEMINI_API_KEY"),
+        temperature=route.temperature,
+        max_output_tokens=route.max_output_tokens,
+    )
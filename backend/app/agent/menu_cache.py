@@ -0,0 +1,191 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Callable, Iterable
+from schema import Item
+from metrics import agent_metrics
+from config import MENU_CACHE_TTL
+
+# Version menu cũ được giữ lại cho các thread đang dùng trong khoảng thời gian
+# này (tính từ lần dùng cuối), tối đa MAX_RETAINED_VERSIONS version
+RETAIN_SECONDS = 24 * 60 * 60
+MAX_RETAINED_VERSIONS = 8
+
+
+def menu_version_id(items: Iterable[Item]) -> str:
+    """Mã version theo nội dung menu: giống nhau giữa các worker và sau khi restart"""
+    payload = json.dumps(
+        [item.model_dump() for item in items], sort_keys=True, default=str
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class MenuSnapshot:
+    """
+    Ảnh chụp menu tại một version, index sẵn theo id và theo giảm giá.
+
+    version là số thứ tự trong process (dùng để biết snapshot đã cũ chưa),
+    version_id là mã theo nội dung menu, được lưu vào state của thread.
+    """
+
+    __slots__ = ("version", "version_id", "items", "by_id", "discount_items")
+
+    def __init__(self, version: int, items: Iterable[Item]):
+        self.version = version
+        self.items = tuple(items)
+        self.version_id = menu_version_id(self.items)
+        self.by_id = {item.id: item for item in self.items}
+        self.discount_items = tuple(
+            item for item in self.items if item.discount and item.discount > 0
+        )
+
+    def get(self, item_id: int) -> Item | None:
+        return self.by_id.get(item_id)
+
+    def get_many(self, item_ids: Iterable[int | None]) -> dict[int, Item]:
+        """Tra nhiều món một lần, bỏ qua id không có trong menu"""
+        by_id = self.by_id
+        return {item_id: by_id[item_id] for item_id in item_ids if item_id in by_id}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+class MenuCache:
+    """
+    Giữ một MenuSnapshot trong bộ nhớ cho tất cả các phiên chat.
+
+    Version tăng mỗi khi menu thay đổi (tạo/sửa/xoá món). Snapshot chỉ được
+    build lại khi version hiện tại khác version của snapshot đang giữ, nên
+    nhiều phiên chat liên tiếp không tốn query nào cho menu.
+
+    bump() chỉ chạy trong worker xử lý request sửa menu. Các worker khác biết
+    menu đã đổi nhờ ttl: snapshot quá ttl giây thì load lại menu từ database,
+    nội dung khác thì tăng version, giống thì giữ nguyên snapshot cũ.
+
+    Các snapshot cũ vẫn được giữ (theo version_id) để thread bắt đầu trước khi
+    menu thay đổi tiếp tục thấy đúng menu của nó, xem resolve().
+    """
+
+    def __init__(
+        self,
+        retain_seconds: float = RETAIN_SECONDS,
+        max_retained: int = MAX_RETAINED_VERSIONS,
+        ttl: float = 0,
+        clock=time.monotonic,
+    ):
+        self.retain_seconds = retain_seconds
+        self.max_retained = max_retained
+        self.ttl = ttl  # 0: chỉ build lại khi bump()
+        self._clock = clock
+        self._version = 0
+        self._snapshot: MenuSnapshot | None = None
+        self._loaded_at = 0.0
+        # version_id -> (snapshot, lần dùng cuối)
+        self._retained: dict[str, tuple[MenuSnapshot, float]] = {}
+        self._lock = threading.Lock()  # chỉ một thread build snapshot
+        self._version_lock = threading.Lock()  # bump không phải chờ build xong
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def bump(self) -> int:
+        """Đánh dấu menu đã thay đổi, snapshot hiện tại sẽ bị build lại"""
+        with self._version_lock:
+            self._version += 1
+            return self._version
+
+    def _fresh(self, snapshot: MenuSnapshot | None) -> bool:
+        if snapshot is None or snapshot.version != self._version:
+            return False
+        return not self.ttl or self._clock() - self._loaded_at < self.ttl
+
+    def peek(self) -> MenuSnapshot | None:
+        """Snapshot hiện tại nếu còn đúng version và chưa quá ttl, không bao giờ gọi loader"""
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            self.hits += 1
+            agent_metrics.record_cache("menu", True)
+            return snapshot
+        return None
+
+    def get(self, loader: Callable[[], Iterable[Item]]) -> MenuSnapshot:
+        snapshot = self.peek()
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            # Có thể một thread khác vừa build xong trong lúc chờ lock
+            snapshot = self._snapshot
+            version = self._version
+            if self._fresh(snapshot):
+                self.hits += 1
+                agent_metrics.record_cache("menu", True)
+                return snapshot
+
+            self.misses += 1
+            agent_metrics.record_cache("menu", False)
+            items = tuple(loader())
+            loaded_at = self._clock()
+            if snapshot is not None and snapshot.version == version:
+                # Quá ttl: menu có thể đã bị sửa từ worker khác
+                if menu_version_id(items) == snapshot.version_id:
+                    self._loaded_at = loaded_at
+                    return snapshot
+                version = self.bump()
+            # Nếu menu bị bump trong lúc đang load, snapshot này mang version cũ
+            # và lần get() tiếp theo sẽ tự build lại
+            snapshot = MenuSnapshot(version, items)
+            self._snapshot = snapshot
+            self._loaded_at = loaded_at
+            self._retain(snapshot)
+            return snapshot
+
+    def resolve(self, version_id: str) -> MenuSnapshot | None:
+        """
+        Snapshot của một version_id đã lưu trong state. None nếu version đó đã
+        bị bỏ (quá hạn giữ, hoặc process mới khởi động với menu đã khác).
+        """
+        with self._version_lock:
+            retained = self._retained.get(version_id)
+            agent_metrics.record_cache("menu_version", retained is not None)
+            if retained is None:
+                return None
+            snapshot = retained[0]
+            self._retained[version_id] = (snapshot, self._clock())
+            return snapshot
+
+    def _retain(self, snapshot: MenuSnapshot) -> None:
+        now = self._clock()
+        with self._version_lock:
+            self._retained[snapshot.version_id] = (snapshot, now)
+            old = sorted(
+                (used, version_id)
+                for version_id, (retained, used) in self._retained.items()
+                if retained is not snapshot
+            )
+            for index, (used, version_id) in enumerate(old):
+                expired = now - used > self.retain_seconds
+                if expired or len(old) - index >= self.max_retained:
+                    del self._retained[version_id]
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": self._version,
+            "current": snapshot.version_id if snapshot else None,
+            "retained": sorted(self._retained),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+menu_cache = MenuCache(ttl=MENU_CACHE_TTL)
+
+
+def bump_menu_version() -> int:
+    return menu_cache.bump()
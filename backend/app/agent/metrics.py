@@ -0,0 +1,447 @@
+"""
+Đo thời gian, token và cache của agent theo từng node.
+
+- Mỗi node trong build_graph() được bọc bởi instrument_node(): thời gian chạy
+  (wall time) của node
+- Mọi lần gọi chat model (llm / structured_llm / turn_llm) đi qua
+  LLMMetricsHandler (callback gắn vào graph): thời gian model, token
+  prompt/completion (usage_metadata của Gemini, không có thì ước lượng)
+- Query database (data.py) và checkpoint (checkpoint_store.py) đo bằng db_timer()
+- Cache menu / prompt / fast intent ghi hit/miss bằng record_cache()
+- Thời gian và chi phí (theo giá của route trong llm_routes.py) của mỗi lần
+  gọi model còn được đo theo route (node, model)
+- Token của mỗi lần gọi model còn được gửi cho các usage listener (ví dụ
+  token_ledger.py), kèm metadata của lần gọi (thread_id, user_id)
+
+Số liệu được cộng vào các histogram/counter dạng Prometheus (render() cho
+endpoint metrics) và vào TurnRecord của request hiện tại (turn()), in ra một
+dòng tóm tắt khi lượt chat kết thúc.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Iterator
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import METRICS_LOG_TURNS
+
+# Đủ chi tiết cho cả node chạy cục bộ (vài ms) lẫn lượt gọi model (vài giây)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CHECKPOINT = "checkpoint"  # label node cho thao tác checkpoint (chạy ngoài node)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, *labels) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = buckets
+        # labels -> [count theo từng bucket..., tổng số, tổng giá trị]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[-2] if series else 0
+
+    def total(self, *labels) -> float:
+        series = self._series.get(labels)
+        return series[-1] if series else 0.0
+
+    def label_values(self) -> list[tuple]:
+        with self._lock:
+            return sorted(self._series)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = _labels(self.label_names, labels, f'le="{bound:g}"')
+                    lines.append(f"{self.name}_bucket{le} {count}")
+                inf = _labels(self.label_names, labels, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf} {series[-2]}")
+                plain = _labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{plain} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{plain} {series[-2]}")
+        return lines
+
+
+class NodeStats:
+    __slots__ = (
+        "seconds",
+        "model_seconds",
+        "db_seconds",
+        "llm_calls",
+        "prompt_tokens",
+        "completion_tokens",
+        "cache_hits",
+        "cache_misses",
+    )
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+
+class TurnRecord:
+    """Số liệu của một lượt chat (một request), theo từng node"""
+
+    def __init__(self, thread_id: str | None):
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.nodes: dict[str, NodeStats] = {}
+
+    def node(self, name: str) -> NodeStats:
+        stats = self.nodes.get(name)
+        if stats is None:
+            stats = self.nodes[name] = NodeStats()
+        return stats
+
+    def summary(self) -> str:
+        parts = [f"thread={self.thread_id} total={self.seconds * 1000:.0f}ms"]
+        for name, stats in self.nodes.items():
+            text = f"{name}={stats.seconds * 1000:.0f}ms"
+            details = []
+            if stats.llm_calls:
+                details.append(
+                    f"model {stats.model_seconds * 1000:.0f}ms/{stats.llm_calls} call, "
+                    f"{stats.prompt_tokens}+{stats.completion_tokens} tok"
+                )
+            if stats.db_seconds:
+                details.append(f"db {stats.db_seconds * 1000:.0f}ms")
+            if stats.cache_hits or stats.cache_misses:
+                details.append(f"cache {stats.cache_hits}/{stats.cache_hits + stats.cache_misses}")
+            if details:
+                text += f" ({'; '.join(details)})"
+            parts.append(text)
+        return " | ".join(parts)
+
+
+_current_turn: ContextVar[TurnRecord | None] = ContextVar("agent_turn", default=None)
+_current_node: ContextVar[str | None] = ContextVar("agent_node", default=None)
+
+
+def _node_stats(node: str | None) -> NodeStats | None:
+    record = _current_turn.get()
+    if record is None or node is None:
+        return None
+    return record.node(node)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Callback đo mọi lần gọi chat model trong graph.
+
+    Lần gọi bị huỷ (quá deadline của gateway, request hedge thua, khách ngắt
+    kết nối) không có on_llm_end / on_llm_error: lần gọi bắt đầu quá
+    stale_seconds mà chưa xong thì bị bỏ khỏi _runs.
+    """
+
+    # Chạy ngay trên event loop (không qua thread pool) để thấy context của node
+    run_inline = True
+
+    def __init__(self, metrics: "AgentMetrics", stale_seconds: float = 600):
+        self.metrics = metrics
+        self.stale_seconds = stale_seconds
+        # run_id -> (bắt đầu, node, prompt tokens, metadata), theo thứ tự bắt đầu
+        self._runs: dict = {}
+        self.expired = 0
+
+    def _expire(self, now: float) -> None:
+        while self._runs:
+            run_id = next(iter(self._runs))
+            if now - self._runs[run_id][0] < self.stale_seconds:
+                break
+            del self._runs[run_id]
+            self.expired += 1
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        # Import ở đây để tránh import vòng (history -> prompt_store -> data -> metrics)
+        from history import message_tokens
+
+        node = (metadata or {}).get("langgraph_node") or _current_node.get() or "-"
+        prompt_tokens = sum(message_tokens(m) for batch in messages for m in batch)
+        now = time.perf_counter()
+        self._expire(now)
+        self._runs[run_id] = (now, node, prompt_tokens, metadata or {})
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, node, prompt_tokens, metadata = run
+        completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    prompt_tokens = usage.get("input_tokens", prompt_tokens)
+                    completion_tokens += usage.get("output_tokens", 0)
+                else:
+                    from prompt_store import approx_tokens
+
+                    completion_tokens += approx_tokens(generation.text or "")
+        self.metrics.observe_llm(
+            node, time.perf_counter() - started, prompt_tokens, completion_tokens, metadata
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            started, node, prompt_tokens, metadata = run
+            self.metrics.observe_llm(
+                node, time.perf_counter() - started, prompt_tokens, 0, metadata
+            )
+
+
+class AgentMetrics:
+    def __init__(self, log_turns: bool = True):
+        self.log_turns = log_turns
+        self.turn_seconds = Histogram(
+            "agent_turn_seconds", "Thời gian một lượt chat (request)"
+        )
+        self.node_seconds = Histogram(
+            "agent_node_seconds", "Thời gian chạy của node", ("node",)
+        )
+        self.llm_seconds = Histogram(
+            "agent_llm_seconds", "Thời gian một lần gọi chat model", ("node",)
+        )
+        self.db_seconds = Histogram(
+            "agent_db_seconds", "Thời gian query database / checkpoint", ("node", "op")
+        )
+        self.prompt_tokens = Counter(
+            "agent_llm_prompt_tokens_total", "Token prompt gửi lên model", ("node",)
+        )
+        self.completion_tokens = Counter(
+            "agent_llm_completion_tokens_total", "Token model trả về", ("node",)
+        )
+        self.cache_requests = Counter(
+            "agent_cache_requests_total", "Lượt tra cache", ("cache", "result")
+        )
+        self.route_seconds = Histogram(
+            "agent_llm_route_seconds", "Thời gian gọi model theo route (node, model)", ("node", "model")
+        )
+        self.route_cost = Counter(
+            "agent_llm_cost_usd_total", "Chi phí ước tính (USD) theo route", ("node", "model")
+        )
+        # model -> (giá input, giá output) USD / 1 triệu token (xem llm_routes.py)
+        self.model_prices: dict[str, tuple[float, float]] = {}
+        self.callback_handler = LLMMetricsHandler(self)
+        self._usage_listeners: list = []
+        # Metric của các module khác (ví dụ llm_gateway.py), render cùng endpoint
+        self._collectors: list = []
+
+    @contextmanager
+    def turn(self, thread_id: str | None = None) -> Iterator[TurnRecord]:
+        """Gom số liệu của một lượt chat; các node/task con dùng chung record này"""
+        record = TurnRecord(thread_id)
+        token = _current_turn.set(record)
+        try:
+            yield record
+        finally:
+            _current_turn.reset(token)
+            record.seconds = time.perf_counter() - record.started
+            self.turn_seconds.observe(record.seconds)
+            if self.log_turns:
+                print(f"[Metrics] {record.summary()}")
+
+    def instrument_node(self, name: str, func):
+        """Bọc một node (async) của graph để đo thời gian chạy"""
+
+        @wraps(func)
+        async def node(state):
+            token = _current_node.set(name)
+            started = time.perf_counter()
+            try:
+                return await func(state)
+            finally:
+                elapsed = time.perf_counter() - started
+                _current_node.reset(token)
+                self.node_seconds.observe(elapsed, name)
+                stats = _node_stats(name)
+                if stats is not None:
+                    stats.seconds += elapsed
+
+        return node
+
+    def register(self, *collectors) -> None:
+        self._collectors.extend(collectors)
+
+    def set_model_price(self, model: str, input_price: float, output_price: float) -> None:
+        """Giá USD / 1 triệu token, dùng để tính agent_llm_cost_usd_total"""
+        self.model_prices[model] = (input_price, output_price)
+
+    def add_usage_listener(self, listener) -> None:
+        """listener(node, prompt_tokens, completion_tokens, metadata) sau mỗi lần gọi model"""
+        self._usage_listeners.append(listener)
+
+    def observe_llm(
+        self,
+        node: str,
+        seconds: float,
+        prompt_tokens: int,
+        completion_tokens: int,
+        metadata: dict | None = None,
+    ) -> None:
+        self.llm_seconds.observe(seconds, node)
+        self.prompt_tokens.inc(prompt_tokens, node)
+        self.completion_tokens.inc(completion_tokens, node)
+        model = (metadata or {}).get("ls_model_name") or "-"
+        self.route_seconds.observe(seconds, node, model)
+        input_price, output_price = self.model_prices.get(model, (0.0, 0.0))
+        self.route_cost.inc(
+            (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000, node, model
+        )
+        stats = _node_stats(node)
+        if stats is not None:
+            stats.llm_calls += 1
+            stats.model_seconds += seconds
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+        for listener in self._usage_listeners:
+            try:
+                listener(node, prompt_tokens, completion_tokens, metadata or {})
+            except Exception as e:
+                print(f"[Metrics] Usage listener failed: {e}")
+
+    @contextmanager
+    def db_timer(self, op: str, node: str | None = None) -> Iterator[None]:
+        """Đo một thao tác database, gán cho node đang chạy (hoặc `node`)"""
+        node = node or _current_node.get() or "-"
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_seconds.observe(elapsed, node, op)
+            stats = _node_stats(node)
+            if stats is not None:
+                stats.db_seconds += elapsed
+
+    def record_cache(self, cache: str, hit: bool) -> None:
+        self.cache_requests.inc(1, cache, "hit" if hit else "miss")
+        stats = _node_stats(_current_node.get())
+        if stats is not None:
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+
+    def route_stats(self) -> list[dict]:
+        """Số lần gọi, độ trễ trung bình và chi phí theo (node, model)"""
+        stats = []
+        for node, model in self.route_seconds.label_values():
+            calls = self.route_seconds.count(node, model)
+            stats.append(
+                {
+                    "node": node,
+                    "model": model,
+                    "calls": calls,
+                    "avg_seconds": self.route_seconds.total(node, model) / calls,
+                    "cost_usd": self.route_cost.value(node, model),
+                }
+            )
+        return stats
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in (
+            self.turn_seconds,
+            self.node_seconds,
+            self.llm_seconds,
+            self.db_seconds,
+            self.prompt_tokens,
+            self.completion_tokens,
+            self.cache_requests,
+            self.route_seconds,
+            self.route_cost,
+            *self._collectors,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+agent_metrics = AgentMetrics(log_turns=METRICS_LOG_TURNS)
@@ -1,69 +1,202 @@
+import asyncio
+import time
 from typing import List
-from langchain_core.messages import SystemMessage, HumanMessage
-from schema import AgentState, UserIntent
-from config import llm, structured_llm
-from prompt import system_prompt, order_system_prompt
-from data import (
-    get_user_name,
-    get_all_items,
-    get_discount_items,
-    get_item_by_id,
-    format_items_for_prompt,
-    format_items_for_intent,
+from langchain_core.messages import AIMessage, SystemMessage, HumanMessage
+from langgraph.config import get_config, get_stream_writer
+from langgraph.types import Overwrite
+from schema import AgentState, TurnResult, UserIntent, merge_cart_lines
+from config import (
+    LLM_ROUTES,
+    route_models,
+    FAST_INTENT_ENABLED,
+    GREETING_CACHE_ENABLED,
+    HISTORY_MAX_TURNS,
+    CHAT_HISTORY_TOKEN_BUDGET,
+    INTENT_HISTORY_TOKEN_BUDGET,
+    SOLVE_BUY_MODE,
+    SOLVE_UNCLEAR_MODE,
+    TOKEN_BUDGET_ACTION,
+)
+from data import aget_menu_snapshot, aget_session_data
+from menu_cache import MenuSnapshot
+from prompt_store import prompt_store
+from fast_intent import fast_intent_parser
+from history import INSTRUCTION, window_messages
+from token_ledger import token_ledger
+from greeting_cache import greeting_cache, greeting_key
+from metrics import agent_metrics
+from llm_gateway import LLMBusy, LLMUnavailable, ModelRouter, llm_gateway
+from response_templates import (
+    response_templates,
+    suggest_items,
+    cart_total,
+    format_price,
+)
+
+# Mọi lần gọi model đi qua gateway: giới hạn số lần gọi đồng thời, hàng đợi
+# công bằng theo user, deadline, circuit breaker (xem llm_gateway.py). Model
+# được chọn theo node đang chạy (LLM_ROUTES). Output của structured_llm không
+# stream cho khách nên được hedge
+llm = ModelRouter(route_models, LLM_ROUTES, llm_gateway)
+structured_llm = ModelRouter(
+    {node: model.with_structured_output(UserIntent) for node, model in route_models.items()},
+    LLM_ROUTES,
+    llm_gateway,
+    hedge=True,
+)
+# Chế độ một lần gọi: schema dạng dict để output được parse dần khi stream
+# (mỗi chunk là một dict chưa hoàn chỉnh), nhờ đó reply stream được cho khách
+turn_llm = ModelRouter(
+    {
+        node: model.with_structured_output(TurnResult.model_json_schema(), method="json_schema")
+        for node, model in route_models.items()
+    },
+    LLM_ROUTES,
+    llm_gateway,
 )
 
 
-def get_data(state: AgentState):
-    """Lấy dữ liệu ban đầu"""
-    all_items = get_all_items()
-    discount_items = get_discount_items()
+async def get_menu(state: AgentState) -> MenuSnapshot:
+    """Menu mà thread đang dùng (giữ nguyên version từ lúc bắt đầu hội thoại)"""
+    return await aget_menu_snapshot(state.get("menu_version"))
 
-    all_items_full_str = format_items_for_prompt(all_items)
-    discount_items_str = format_items_for_prompt(discount_items)
 
-    items_str = format_items_for_intent(all_items)
+async def chat_window(state: AgentState) -> list:
+    """
+    Lịch sử (đã cắt gọn) gửi cho llm ở các node solve_*. System prompt chứa
+    menu không lưu trong state mà được thêm vào lúc gọi model.
+    """
+    prompts = prompt_store.get(await get_menu(state))
+    return window_messages(
+        [SystemMessage(content=prompts.system_prompt)] + state["messages"],
+        max_turns=HISTORY_MAX_TURNS,
+        token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+        cart=state.get("current_cart"),
+    )
+
+
+async def budget_exceeded(state: AgentState) -> str | None:
+    """
+    Giới hạn token mà hội thoại / user đã vượt (xem token_ledger.py), None nếu
+    vẫn còn được gọi LLM. Vượt rồi thì các node trả lời bằng template.
+    """
+    try:
+        thread_id = get_config().get("configurable", {}).get("thread_id")
+    except RuntimeError:
+        # Node được gọi trực tiếp, ngoài graph
+        thread_id = None
+    reason = await token_ledger.over_budget(
+        thread_id, state.get("user_id"), state.get("conversation_started_at") or 0
+    )
+    if reason:
+        print(f"[TokenLedger] Thread {thread_id} vượt giới hạn {reason}, không gọi LLM")
+    return reason
 
-    user_name = "Bạn"
-    if state.get("user_id"):
-        user_name = get_user_name(state["user_id"])
+
+async def llm_allowed(state: AgentState) -> bool:
+    """
+    Node có nên gọi LLM không: không khi model đang sự cố (mạch mở, hoặc lượt
+    này đã gọi lỗi) hoặc đã vượt giới hạn token. Không thì trả lời bằng template.
+    """
+    if state.get("llm_fallback") or not llm_gateway.available():
+        return False
+    return not await budget_exceeded(state)
+
+
+def template_reply(text: str) -> AIMessage:
+    """
+    Câu trả lời dựng sẵn: gửi ngay qua stream "custom" (API stream ra client
+    giống token của LLM) và trả về AIMessage để lưu vào lịch sử.
+    """
+    get_stream_writer()({"content": text})
+    return AIMessage(content=text)
+
+
+async def get_data(state: AgentState):
+    """Lấy dữ liệu ban đầu (menu và tên user được lấy song song)"""
+    menu, user_name = await aget_session_data(state.get("user_id"))
+    # Render sẵn prompt cho version menu này, dùng chung cho mọi phiên chat
+    prompt_store.get(menu)
 
     return {
         "user_name": user_name,
-        "all_items": [item.model_dump() for item in all_items],
-        "discount_items": [item.model_dump() for item in discount_items],
-        "current_cart": [],
-        "items_str": items_str,
-        "messages": [
-            SystemMessage(
-                content=system_prompt.format(
-                    all_items=all_items_full_str, discount_items=discount_items_str
-                )
-            )
-        ],
-        "user_choice_messages": [
-            SystemMessage(content=order_system_prompt.format(items_str=items_str))
-        ],
+        "menu_version": menu.version_id,
+        "conversation_started_at": time.time(),
+        # Bắt đầu hội thoại mới: ghi đè thay vì nối thêm vào lịch sử cũ
+        "current_cart": Overwrite([]),
+        "messages": Overwrite([]),
+        "user_choice_messages": Overwrite([]),
     }
 
 
-def greet_user(state: AgentState):
-    """Chào khách hàng và giới thiệu các món giảm giá"""
-    discount_names = [item["title"] for item in state["discount_items"]]
-    request = HumanMessage(
-        content=f"""Người dùng tên là {state["user_name"]}. 
+async def greet_user(state: AgentState):
+    """
+    Chào khách hàng và giới thiệu các món giảm giá.
+
+    Lời chào lấy từ greeting_cache nếu có; chưa có thì chào bằng template
+    ngay và để model viết lời chào cho lần sau ở background.
+    """
+    menu = await get_menu(state)
+    discount_names = [item.title for item in menu.discount_items]
+    if not await llm_allowed(state):
+        return greeting_template(state, discount_names)
+    request = greeting_request(state["user_name"], discount_names)
+    if GREETING_CACHE_ENABLED:
+        key = greeting_key(menu.version_id, discount_names, state["user_name"])
+        cached = greeting_cache.get(key)
+        # Mỗi lượt chào cho model viết thêm một variant cho tới khi đủ
+        greeting_cache.warm(key, lambda: generate_greeting(menu, request))
+        if cached is None:
+            return greeting_template(state, discount_names)
+        return {"messages": [request, template_reply(cached)]}
+
+    prompts = prompt_store.get(menu)
+    try:
+        response = await llm.ainvoke(
+            [SystemMessage(content=prompts.system_prompt)] + state["messages"] + [request]
+        )
+    except LLMUnavailable as e:
+        print(f"[LLM] {e}: chào bằng template")
+        return greeting_template(state, discount_names)
+    print(f"\n🤖 Bot: {response.content}\n")
+    return {"messages": [request, response]}
+
+
+def greeting_request(user_name: str, discount_names: list[str]) -> HumanMessage:
+    return HumanMessage(
+        content=f"""Người dùng tên là {user_name}. 
 Các món đang giảm giá: {", ".join(discount_names)}. 
 
 Hãy:
 1. Chào khách hàng thân thiện (đoán giới tính, gọi tên không gọi họ)
-2. Giới thiệu các món đang giảm giá và hỏi họ muốn đặt gì."""
+2. Giới thiệu các món đang giảm giá và hỏi họ muốn đặt gì.""",
+        name=INSTRUCTION,
     )
-    messages = state["messages"] + [request]
-    response = llm.invoke(messages)
-    print(f"\n🤖 Bot: {response.content}\n")
-    return {"messages": messages + [response]}
 
 
-def get_user_input(state: AgentState):
+async def generate_greeting(menu: MenuSnapshot, request: HumanMessage) -> str:
+    """Lời chào do model viết cho greeting_cache (chạy ngoài graph)"""
+    prompts = prompt_store.get(menu)
+    response = await llm.ainvoke(
+        [SystemMessage(content=prompts.system_prompt), request],
+        # Vẫn dùng route và metrics của greet_user
+        {
+            "callbacks": [agent_metrics.callback_handler],
+            "metadata": {"langgraph_node": "greet_user"},
+        },
+    )
+    return response.content
+
+
+def greeting_template(state: AgentState, discount_names: list[str]) -> dict:
+    """Chào bằng template, lưu vào lịch sử giống như khi model chào"""
+    response = template_reply(
+        response_templates.greeting(state["user_name"], discount_names)
+    )
+    return {"messages": [greeting_request(state["user_name"], discount_names), response]}
+
+
+async def get_user_input(state: AgentState):
     """
     Lấy input từ người dùng.
 
@@ -78,108 +211,316 @@ def get_user_input(state: AgentState):
     if state.get("pending_user_input"):
         user_input = state["pending_user_input"]
         return {
-            "messages": state["messages"] + [HumanMessage(content=user_input)],
+            "messages": [HumanMessage(content=user_input)],
             "pending_user_input": None,  # Clear sau khi sử dụng
         }
 
-    # Fallback cho CLI mode
-    user_input = input("👤 Bạn: ").strip()
-    return {"messages": state["messages"] + [HumanMessage(content=user_input)]}
+    # Fallback cho CLI mode (input() chạy trong thread để không chặn event loop)
+    user_input = (await asyncio.to_thread(input, "👤 Bạn: ")).strip()
+    return {"messages": [HumanMessage(content=user_input)]}
+
+
+def apply_intent(parsed: UserIntent, menu: MenuSnapshot) -> dict:
+    """
+    Từ intent đã parse: intent cuối cùng và các dòng giỏ hàng cần thêm.
+    Món nào thiếu ID/số lượng hoặc ID không có trong menu thì bỏ qua và đếm vào
+    skipped_items để hỏi lại; không thêm được món nào thì coi như UNCLEAR.
+    """
+    if parsed.intent == "BUY":
+        # Check ID và Quantity chặt chẽ. Tại đôi khi LLM dở chứng, mặc dù điền
+        # quantity None nhưng vẫn phân loại là BUY
+        items = menu.get_many(line.item_id for line in parsed.items)
+        lines = []
+        skipped = 0
+        for order in parsed.items:
+            item = items.get(order.item_id)
+            if item is None or not order.quantity or order.quantity < 0:
+                skipped += 1
+                continue
+            lines.append(
+                {
+                    "item_id": item.id,
+                    "title": item.title,
+                    "price": int(item.price),
+                    "quantity": order.quantity,
+                    "discount": item.discount,
+                }
+            )
+        # Cùng một món nhắc nhiều lần trong câu thì gộp thành một dòng
+        lines = merge_cart_lines([], lines)
+        if lines:
+            return {
+                "user_intent": "BUY",
+                "current_cart": lines,
+                "added_items": lines,
+                "skipped_items": skipped,
+            }
+        return {"user_intent": "UNCLEAR", "added_items": [], "skipped_items": skipped}
+
+    if parsed.intent == "NOT_BUY":
+        return {"user_intent": "NOT_BUY", "added_items": [], "skipped_items": 0}
 
+    return {"user_intent": "UNCLEAR", "added_items": [], "skipped_items": 0}
 
-def parse_user_order(state: AgentState):
+
+def format_order(parsed: UserIntent) -> str:
+    return ", ".join(f"{line.quantity} x #{line.item_id}" for line in parsed.items)
+
+
+async def parse_user_order(state: AgentState):
     """Xác định ý định của người dùng"""
     user_message = HumanMessage(content=state["messages"][-1].content)
-    request = state["user_choice_messages"] + [user_message]
+    # Các node chỉ trả về phần thêm vào, reducer trong AgentState sẽ nối vào state
+    request = [user_message]
+    menu = await get_menu(state)
 
     try:
-        # parsed là object UserIntent đơn lẻ
-        # print(f"Parse user choice: {request}")
-        parsed: UserIntent = structured_llm.invoke(request)
+        # Thử parser cục bộ trước, chỉ gọi LLM khi parser không chắc chắn.
+        # Vượt giới hạn token hoặc model đang sự cố thì chỉ dùng parser cục bộ
+        over_budget = await budget_exceeded(state)
+        offline = over_budget or not llm_gateway.available()
+        parsed: UserIntent | None = None
+        if FAST_INTENT_ENABLED or offline:
+            parsed = fast_intent_parser.parse(user_message.content, menu)
+        if parsed is None and not offline:
+            # parsed là object UserIntent đơn lẻ
+            # print(f"Parse user choice: {request}")
+            prompts = prompt_store.get(menu)
+            history = window_messages(
+                [SystemMessage(content=prompts.order_system_prompt)]
+                + state["user_choice_messages"],
+                max_turns=HISTORY_MAX_TURNS,
+                token_budget=INTENT_HISTORY_TOKEN_BUDGET,
+                cart=state.get("current_cart"),
+                kind="user_choice_messages",
+            )
+            try:
+                parsed = await structured_llm.ainvoke(history + [user_message])
+            except LLMUnavailable as e:
+                # Các node solve_* của lượt này cũng không gọi LLM nữa
+                print(f"[LLM] {e}: dùng parser cục bộ")
+                offline = True
+                if not FAST_INTENT_ENABLED:
+                    parsed = fast_intent_parser.parse(user_message.content, menu)
+        if parsed is None:
+            # Không có LLM và parser cục bộ không chắc chắn: hỏi lại. Vượt giới
+            # hạn token với TOKEN_BUDGET_ACTION="end": kết thúc qua solve_not_buy
+            end = over_budget and TOKEN_BUDGET_ACTION == "end"
+            parsed = UserIntent(intent="NOT_BUY" if end else "UNCLEAR")
 
         print(
-            f"[Debug] Parsed Intent: {parsed.intent}, Item ID: {parsed.item_id}, Quantity: {parsed.quantity}"
+            f"[Debug] Parsed Intent: {parsed.intent}, Items: {format_order(parsed)}"
         )
 
-        if parsed.intent == "BUY":
-            # Check ID và Quantity chặt chẽ
-            # Nếu thiếu 1 trong 2 thì coi như UNCLEAR để hỏi lại. Tại đôi khi LLM dở chứng, mặc dù điền quantity None nhưng vẫn phân loại là BUY
-            if not parsed.item_id or not parsed.quantity:
-                # print(
-                #     "[Logic] Missing ID or Quantity for BUY intent -> Switching to UNCLEAR"
-                # )
-                return {"user_intent": "UNCLEAR", "user_choice_messages": request}
-
-            item = get_item_by_id(parsed.item_id)
-            if item:
-                cart = state["current_cart"]
-                price = item.price
-                if item.discount:
-                    price = int(item.price)
-
-                cart.append(
-                    {
-                        "item_id": item.id,
-                        "title": item.title,
-                        "price": price,
-                        "quantity": parsed.quantity,
-                        "discount": item.discount,
-                    }
+        return {
+            **apply_intent(parsed, menu),
+            "user_choice_messages": request,
+            "llm_fallback": offline,
+        }
+
+    except LLMBusy:
+        # Không coi là UNCLEAR: API báo bận và khôi phục thread về trước lượt này
+        raise
+    except Exception as e:
+        # print(f"[Error] Parsing failed: {e}")
+        return {
+            "user_intent": "UNCLEAR",
+            "user_choice_messages": request,
+            "llm_fallback": False,
+        }
+
+
+def cart_context(cart: list[dict] | None) -> str:
+    """Giỏ hàng và tổng tiền (tính sẵn) gửi kèm prompt của chế độ một lần gọi"""
+    if not cart:
+        return "\n\nGiỏ hàng hiện tại: trống."
+    lines = [f"- {line['title']}: {line['quantity']}" for line in cart]
+    return (
+        "\n\nGiỏ hàng hiện tại:\n"
+        + "\n".join(lines)
+        + f"\nTổng: {format_price(cart_total(cart))}"
+    )
+
+
+async def parse_and_reply(state: AgentState):
+    """
+    Chế độ một lần gọi (AGENT_GRAPH_MODE=single_call): thay cho
+    parse_user_order + solve_*. Một request structured output trả về cả
+    intent và câu trả lời; phần reply được stream cho khách (stream "custom")
+    ngay khi model sinh ra.
+    """
+    menu = await get_menu(state)
+    cart = state.get("current_cart") or []
+    user_message = state["messages"][-1]
+    write = get_stream_writer()
+    over_budget = await budget_exceeded(state)
+    offline = over_budget or not llm_gateway.available()
+
+    # Parser cục bộ chắc chắn là BUY: trả lời bằng template, không cần gọi LLM
+    parsed = None
+    if FAST_INTENT_ENABLED or offline:
+        parsed = fast_intent_parser.parse(user_message.content, menu)
+        if parsed is not None:
+            update = apply_intent(parsed, menu)
+            if "current_cart" in update:
+                new_cart = merge_cart_lines(cart, update["current_cart"])
+                response = template_reply(
+                    response_templates.buy(
+                        update["added_items"],
+                        new_cart,
+                        suggest_items(menu, new_cart),
+                        update["skipped_items"],
+                    )
                 )
-                return {
-                    "user_intent": "BUY",
-                    "user_choice_messages": request,
-                    "current_cart": cart,
-                }
-            else:
-                # ID trả về không tồn tại
-                return {"user_intent": "UNCLEAR", "user_choice_messages": request}
+                return {**update, "messages": [response]}
 
-        if parsed.intent == "NOT_BUY":
-            return {"user_intent": "NOT_BUY", "user_choice_messages": request}
+    if offline:
+        # Vượt giới hạn token / model sự cố: tạm biệt (khách không mua nữa, hoặc
+        # vượt giới hạn với TOKEN_BUDGET_ACTION="end") hoặc hỏi lại bằng template
+        end = over_budget and TOKEN_BUDGET_ACTION == "end"
+        if end or (parsed and parsed.intent == "NOT_BUY"):
+            intent = "NOT_BUY"
+            response = template_reply(response_templates.goodbye(cart))
+        else:
+            intent = "UNCLEAR"
+            response = template_reply(
+                response_templates.unclear(suggest_items(menu, cart))
+            )
+        return {
+            "user_intent": intent,
+            "added_items": [],
+            "skipped_items": 0,
+            "messages": [response],
+        }
 
-        return {"user_intent": "UNCLEAR", "user_choice_messages": request}
+    prompts = prompt_store.get(menu)
+    history = window_messages(
+        [SystemMessage(content=prompts.single_call_prompt + cart_context(cart))]
+        + state["messages"],
+        max_turns=HISTORY_MAX_TURNS,
+        token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+        cart=cart,
+    )
 
+    sent = ""
+    try:
+        result = None
+        # Mỗi chunk là dict đã parse được tới thời điểm đó, reply dài dần ra
+        async for partial in turn_llm.astream(history):
+            result = partial
+            reply = (partial or {}).get("reply") or ""
+            if len(reply) > len(sent) and reply.startswith(sent):
+                write({"content": reply[len(sent) :]})
+                sent = reply
+        parsed = TurnResult.model_validate(result)
+        print(
+            f"[Debug] Parsed Intent: {parsed.intent}, Items: {format_order(parsed)}"
+        )
+        update = apply_intent(parsed, menu)
+        if parsed.reply.startswith(sent) and len(parsed.reply) > len(sent):
+            write({"content": parsed.reply[len(sent) :]})
+            sent = parsed.reply
+        if update["user_intent"] == parsed.intent and sent:
+            if update["skipped_items"]:
+                # Một số món không thêm được: nhắc khách nói lại các món đó
+                note = " " + response_templates.skipped(update["skipped_items"]).strip()
+                write({"content": note})
+                sent += note
+            return {**update, "messages": [AIMessage(content=sent)]}
+    except LLMBusy:
+        raise
     except Exception as e:
-        # print(f"[Error] Parsing failed: {e}")
-        return {"user_intent": "UNCLEAR", "user_choice_messages": request}
+        # print(f"[Error] Single-call turn failed: {e}")
+        pass
+
+    # Output lỗi hoặc BUY không hợp lệ (sai id / thiếu số lượng): phần đã stream
+    # có thể đã xác nhận món, nên gửi tiếp câu hỏi lại bằng template
+    correction = response_templates.unclear(suggest_items(menu, cart))
+    if sent:
+        correction = "\n\n" + correction
+    write({"content": correction})
+    return {
+        "user_intent": "UNCLEAR",
+        "added_items": [],
+        "skipped_items": 0,
+        "messages": [AIMessage(content=sent + correction)],
+    }
+
+
+async def unclear_template(state: AgentState) -> dict:
+    menu = await get_menu(state)
+    response = template_reply(
+        response_templates.unclear(suggest_items(menu, state.get("current_cart")))
+    )
+    return {"messages": [response], "user_choice_messages": [response]}
+
 
+async def solve_unclear(state: AgentState):
+    if SOLVE_UNCLEAR_MODE == "template" or not await llm_allowed(state):
+        return await unclear_template(state)
 
-def solve_unclear(state: AgentState):
     request = SystemMessage(
         content="Người dùng nhập món không tồn tại hoặc thiếu số lượng. Hãy hỏi lại để làm rõ. Không nói dài dòng thêm gì cả"
     )
-    messages = state["messages"] + [request]
-
     # print(f"Solve unclear: {messages}")
-    response = llm.invoke(messages)
+    try:
+        response = await llm.ainvoke(await chat_window(state) + [request])
+    except LLMUnavailable as e:
+        print(f"[LLM] {e}: trả lời bằng template")
+        return await unclear_template(state)
     # print(f"\n🤖 Bot: {response.content}\n")
     return {
-        "messages": state["messages"]
-        + [response],  # Tại sao không thêm request, vì nó không cần thiết
-        "user_choice_messages": state["user_choice_messages"]
-        + [
+        "messages": [response],  # Tại sao không thêm request, vì nó không cần thiết
+        "user_choice_messages": [
             response
         ],  # Thêm cả response vì đôi lúc bot sẽ hỏi bạn muốn ăn cơm sườn nướng đúng không -> user: đúng-> hỗ trợ việc xác định intent
     }
 
 
-def solve_buy(state: AgentState):
+async def buy_template(state: AgentState) -> dict:
+    menu = await get_menu(state)
+    cart = state.get("current_cart") or []
+    response = template_reply(
+        response_templates.buy(
+            state.get("added_items"),
+            cart,
+            suggest_items(menu, cart),
+            state.get("skipped_items") or 0,
+        )
+    )
+    return {"messages": [response], "user_choice_messages": [response]}
+
+
+async def solve_buy(state: AgentState):
     # print("Come here solve_buy")
+    if SOLVE_BUY_MODE == "template" or not await llm_allowed(state):
+        return await buy_template(state)
+
     request = HumanMessage(
-        content="Hãy hỏi khách muốn mua gì trong các món đang có không"
+        content="Hãy hỏi khách muốn mua gì trong các món đang có không",
+        name=INSTRUCTION,
     )
-    messages = state["messages"] + [request]
-    response = llm.invoke(messages)
+    try:
+        response = await llm.ainvoke(await chat_window(state) + [request])
+    except LLMUnavailable as e:
+        print(f"[LLM] {e}: trả lời bằng template")
+        return await buy_template(state)
     # print(f"\n🤖 Bot: {response.content}\n")
     return {
-        "messages": state["messages"]
-        + [response],  # Tương tự không cần thêm request vì không cần thiết
-        "user_choice_messages": state["user_choice_messages"] + [request] + [response],
+        "messages": [response],  # Tương tự không cần thêm request vì không cần thiết
+        "user_choice_messages": [request, response],
     }
 
 
-def solve_not_buy(state: AgentState):
+def goodbye_template(state: AgentState) -> dict:
+    response = template_reply(response_templates.goodbye(state.get("current_cart")))
+    return {"messages": [response]}
+
+
+async def solve_not_buy(state: AgentState):
+    if not await llm_allowed(state):
+        return goodbye_template(state)
+
     if state["current_cart"] is None:
         request = SystemMessage(
             content="Khách hàng không muốn mua. Chào tạm biệt thân thiện và mời họ quay lại."
@@ -204,7 +545,10 @@ def solve_not_buy(state: AgentState):
         request = SystemMessage(
             content=f"Khách hàng đã mua {cart_summary}. Với tổng tiền là {total:,}đ. BẠN CHỈ CẦN BẢO KHÁCH ĐẾN GIỎ HÀNG ĐỂ THANH TOÁN"
         )
-    messages = state["messages"] + [request]
-    response = llm.invoke(messages)
+    try:
+        response = await llm.ainvoke(await chat_window(state) + [request])
+    except LLMUnavailable as e:
+        print(f"[LLM] {e}: tạm biệt bằng template")
+        return goodbye_template(state)
     # print(f"\n🤖 Bot: {response.content}\n")
-    return {"messages": messages + [response]}
+    return {"messages": [request, response]}
@@ -0,0 +1,90 @@
+import threading
+from menu_cache import MAX_RETAINED_VERSIONS, MenuSnapshot
+from prompt import system_prompt, order_system_prompt, single_call_system_prompt
+from data import format_items_for_prompt, format_items_for_intent
+from metrics import agent_metrics
+
+# Ước lượng thô: ~4 ký tự / token. Đủ để so sánh độ lớn, không dùng để tính tiền
+CHARS_PER_TOKEN = 4
+
+
+def approx_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class PromptArtifacts:
+    """Các chuỗi prompt đã render sẵn cho một version menu"""
+
+    __slots__ = (
+        "version",
+        "all_items_str",
+        "discount_items_str",
+        "items_str",
+        "system_prompt",
+        "order_system_prompt",
+        "single_call_prompt",
+    )
+
+    def __init__(self, menu: MenuSnapshot):
+        self.version = menu.version
+        self.all_items_str = format_items_for_prompt(menu.items)
+        self.discount_items_str = format_items_for_prompt(menu.discount_items)
+        self.items_str = format_items_for_intent(menu.items)
+        self.system_prompt = system_prompt.format(
+            all_items=self.all_items_str, discount_items=self.discount_items_str
+        )
+        self.order_system_prompt = order_system_prompt.format(items_str=self.items_str)
+        self.single_call_prompt = single_call_system_prompt.format(
+            all_items=self.all_items_str, discount_items=self.discount_items_str
+        )
+
+    def sizes(self) -> dict:
+        """Kích thước (ký tự, token ước lượng) của từng chuỗi"""
+        sizes = {}
+        for name in self.__slots__[1:]:
+            value = getattr(self, name)
+            sizes[name] = {"chars": len(value), "tokens": approx_tokens(value)}
+        return sizes
+
+
+class PromptStore:
+    """
+    Render prompt một lần cho mỗi version menu và trả về cùng một object
+    cho mọi phiên chat dùng version đó.
+    """
+
+    # Giữ đủ prompt cho mọi version menu mà MenuCache còn giữ lại
+    def __init__(self, max_versions: int = MAX_RETAINED_VERSIONS):
+        self.max_versions = max_versions
+        self._artifacts: dict[int, PromptArtifacts] = {}
+        self._lock = threading.Lock()
+        self.renders = 0
+
+    def get(self, menu: MenuSnapshot) -> PromptArtifacts:
+        artifacts = self._artifacts.get(menu.version)
+        agent_metrics.record_cache("prompt", artifacts is not None)
+        if artifacts is not None:
+            return artifacts
+
+        with self._lock:
+            artifacts = self._artifacts.get(menu.version)
+            if artifacts is None:
+                artifacts = PromptArtifacts(menu)
+                self.renders += 1
+                self._artifacts[menu.version] = artifacts
+                # Bỏ các version cũ nhất (dict giữ thứ tự thêm vào)
+                while len(self._artifacts) > self.max_versions:
+                    del self._artifacts[next(iter(self._artifacts))]
+                print(f"[Prompt] Rendered menu v{menu.version}: {artifacts.sizes()}")
+            return artifacts
+
+    def stats(self) -> dict:
+        latest = max(self._artifacts.values(), key=lambda a: a.version, default=None)
+        return {
+            "renders": self.renders,
+            "cached_versions": sorted(self._artifacts),
+            "latest": latest.sizes() if latest else None,
+        }
+
+
+prompt_store = PromptStore()
@@ -0,0 +1,167 @@
+"""
+Câu trả lời dựng sẵn cho solve_buy / solve_unclear (và lời chào / tạm biệt
+khi hội thoại đã vượt giới hạn token, xem token_ledger.py).
+
+Sau khi đã xác định được intent, câu trả lời ở hai node này gần như cố định
+("còn muốn đặt gì nữa không?", "bạn nói rõ món/số lượng giúp mình"), nên
+không cần gọi LLM lần thứ hai trong lượt. Mỗi loại có nhiều cách nói, chọn
+ngẫu nhiên để không lặp lại y hệt.
+"""
+
+import random
+from menu_cache import MenuSnapshot
+
+BUY_TEMPLATES = [
+    "Dạ, mình đã thêm {items} vào giỏ hàng rồi ạ. {cart}{suggestion}Bạn muốn đặt thêm món gì nữa không?",
+    "Đã ghi nhận {items} ạ! {cart}{suggestion}Bạn có muốn gọi thêm món nào khác không?",
+    "Ok, {items} đã nằm trong giỏ hàng của bạn. {cart}{suggestion}Bạn còn muốn thêm gì không ạ?",
+    "Dạ vâng, mình thêm {items} cho bạn rồi nhé. {cart}{suggestion}Bạn cần đặt thêm món gì nữa không ạ?",
+]
+
+CART_TEMPLATES = [
+    "Tạm tính: {total}. ",
+    "Tổng giỏ hàng hiện tại là {total}. ",
+    "Giỏ hàng của bạn đang là {total}. ",
+]
+
+SUGGESTION_TEMPLATES = [
+    "Hôm nay {items} đang giảm giá, bạn thử không? ",
+    "Bạn có thể tham khảo thêm {items} đang có giá ưu đãi. ",
+    "Gợi ý cho bạn: {items} đang được giảm giá đó ạ. ",
+]
+
+UNCLEAR_TEMPLATES = [
+    "Xin lỗi, mình chưa rõ bạn muốn món nào và số lượng bao nhiêu. Bạn nói lại giúp mình nhé, ví dụ \"2 {example}\".",
+    "Bạn cho mình xin tên món và số lượng cụ thể được không ạ? Ví dụ: \"1 {example}\".",
+    "Mình chưa tìm thấy món hoặc số lượng trong tin nhắn của bạn. Bạn ghi rõ giúp mình, ví dụ \"2 {example}\" nhé.",
+]
+
+SKIPPED_TEMPLATES = [
+    "Còn {count} món mình chưa rõ tên hoặc số lượng, bạn nói lại giúp mình nhé. ",
+    "Có {count} món mình chưa tìm thấy trong menu hoặc thiếu số lượng, bạn kiểm tra lại giúp mình ạ. ",
+]
+
+UNCLEAR_SUGGESTION_TEMPLATES = [
+    " Quán đang có: {items}.",
+    " Một vài món bạn có thể chọn: {items}.",
+]
+
+GREETING_TEMPLATES = [
+    "Xin chào {name}! {discounts}Hôm nay bạn muốn đặt món gì ạ?",
+    "Chào {name}, rất vui được phục vụ bạn. {discounts}Bạn muốn dùng gì hôm nay ạ?",
+]
+
+GREETING_DISCOUNT_TEMPLATES = [
+    "Hôm nay {items} đang giảm giá đó ạ. ",
+    "Quán đang có ưu đãi cho {items}. ",
+]
+
+GOODBYE_TEMPLATES = [
+    "Cảm ơn bạn đã ghé quán! {cart}Hẹn gặp lại bạn lần sau nhé.",
+    "Dạ, cảm ơn bạn nhiều ạ. {cart}Chúc bạn một ngày vui vẻ!",
+]
+
+GOODBYE_CART_TEMPLATES = [
+    "Giỏ hàng của bạn có {items}, tổng {total}. Bạn vào giỏ hàng để thanh toán giúp mình nhé. ",
+    "Bạn đã chọn {items} (tổng {total}), bạn đến giỏ hàng để thanh toán nhé. ",
+]
+
+# Số món gợi ý tối đa trong một câu trả lời
+MAX_SUGGESTIONS = 2
+
+
+def format_price(value: float) -> str:
+    return f"{int(round(value)):,}đ"
+
+
+def line_total(line: dict) -> float:
+    """Thành tiền một dòng giỏ hàng (discount tính theo %)"""
+    return line["price"] * line["quantity"] * (1 - (line.get("discount") or 0) / 100)
+
+
+def format_lines(lines: list[dict]) -> str:
+    """Các dòng giỏ hàng thành một cụm: 2 Phở bò, 1 Trà đá và 3 Chè"""
+    parts = [f"{line['quantity']} {line['title']}" for line in lines]
+    if len(parts) > 1:
+        return ", ".join(parts[:-1]) + " và " + parts[-1]
+    return "".join(parts)
+
+
+def cart_total(cart: list[dict] | None) -> float:
+    return sum(line_total(line) for line in cart or [])
+
+
+def suggest_items(menu: MenuSnapshot, cart: list[dict] | None) -> list[str]:
+    """Món gợi ý: ưu tiên món đang giảm giá, bỏ qua món đã có trong giỏ"""
+    in_cart = {line["item_id"] for line in cart or []}
+    candidates = [item for item in menu.discount_items if item.id not in in_cart]
+    if not candidates:
+        candidates = [item for item in menu.items if item.id not in in_cart]
+    return [item.title for item in candidates[:MAX_SUGGESTIONS]]
+
+
+class ResponseTemplates:
+    """Chọn và điền template. Truyền rng (random.Random(seed)) để kết quả cố định khi test"""
+
+    def __init__(self, rng: random.Random | None = None):
+        self._random = rng or random.Random()
+
+    def buy(
+        self,
+        lines: list[dict] | None,
+        cart: list[dict] | None,
+        suggestions: list[str],
+        skipped: int = 0,
+    ) -> str:
+        """lines: các dòng vừa thêm vào giỏ ở lượt này, skipped: số món không thêm được"""
+        if not lines:
+            return self.unclear(suggestions)
+        cart_text = self._random.choice(CART_TEMPLATES).format(
+            total=format_price(cart_total(cart))
+        )
+        if skipped:
+            cart_text += self.skipped(skipped)
+        suggestion = ""
+        # Chỉ thỉnh thoảng gợi ý để câu trả lời không dài dòng
+        if suggestions and self._random.random() < 0.5:
+            suggestion = self._random.choice(SUGGESTION_TEMPLATES).format(
+                items=", ".join(suggestions)
+            )
+        return self._random.choice(BUY_TEMPLATES).format(
+            items=format_lines(lines),
+            cart=cart_text,
+            suggestion=suggestion,
+        )
+
+    def skipped(self, count: int) -> str:
+        return self._random.choice(SKIPPED_TEMPLATES).format(count=count)
+
+    def unclear(self, suggestions: list[str]) -> str:
+        example = suggestions[0].lower() if suggestions else "cơm sườn"
+        text = self._random.choice(UNCLEAR_TEMPLATES).format(example=example)
+        if suggestions:
+            text += self._random.choice(UNCLEAR_SUGGESTION_TEMPLATES).format(
+                items=", ".join(suggestions)
+            )
+        return text
+
+    def greeting(self, name: str, discount_names: list[str]) -> str:
+        discounts = ""
+        if discount_names:
+            discounts = self._random.choice(GREETING_DISCOUNT_TEMPLATES).format(
+                items=", ".join(discount_names[:MAX_SUGGESTIONS])
+            )
+        return self._random.choice(GREETING_TEMPLATES).format(
+            name=name, discounts=discounts
+        )
+
+    def goodbye(self, cart: list[dict] | None) -> str:
+        cart_text = ""
+        if cart:
+            cart_text = self._random.choice(GOODBYE_CART_TEMPLATES).format(
+                items=format_lines(cart), total=format_price(cart_total(cart))
+            )
+        return self._random.choice(GOODBYE_TEMPLATES).format(cart=cart_text)
+
+
+response_templates = ResponseTemplates()
@@ -1,8 +1,15 @@
 from pyasn1.type.univ import Any
-from typing import List, TypedDict, Literal, Optional
+from typing import Annotated, List, TypedDict, Literal, Optional
 from pydantic import BaseModel, Field
+from langchain_core.messages import AnyMessage
+from langgraph.graph.message import add_messages
+from langgraph.channels import DeltaChannel
 import enum
 
+# Sau bao nhiêu lần cập nhật thì checkpoint lưu lại toàn bộ giá trị của channel
+# (các lần khác chỉ lưu phần thêm vào, xem DeltaChannel)
+DELTA_SNAPSHOT_FREQUENCY = 20
+
 
 class Flavour(str, enum.Enum):
     spicy = "spicy"
@@ -29,17 +36,34 @@ class Item(BaseModel):
     flavour: Optional[List[str]] = None
 
 
+class OrderLine(BaseModel):
+    """Một món trong tin nhắn đặt món"""
+
+    item_id: Optional[int] = Field(
+        default=None,
+        description="ID món ăn mà người dùng muốn đặt. None nếu không có hoặc không hợp lệ.",
+    )
+    quantity: Optional[int] = Field(default=None, description="Số lượng món ăn.")
+
+
 class UserIntent(BaseModel):
     """Output structure cho việc xác định thông tin món mà user mong muốn"""
 
     intent: Literal["BUY", "NOT_BUY", "UNCLEAR"] = Field(
         description="Ý định của người dùng: BUY (muốn mua), NOT_BUY (từ chối), UNCLEAR (không rõ ràng)",
     )
-    item_id: Optional[int] = Field(
-        default=None,
-        description="ID món ăn mà người dùng muốn đặt. None nếu không có hoặc không hợp lệ.",
+    items: List[OrderLine] = Field(
+        default_factory=list,
+        description="Các món người dùng muốn đặt trong tin nhắn, mỗi món một dòng. Rỗng nếu không đặt món nào.",
+    )
+
+
+class TurnResult(UserIntent):
+    """Output của chế độ một lần gọi: intent và câu trả lời cho khách trong cùng một response"""
+
+    reply: str = Field(
+        description="Câu trả lời gửi cho khách hàng, bằng tiếng Việt, ngắn gọn và thân thiện.",
     )
-    quantity: Optional[int] = Field(default=None, description="Số lượng món ăn.")
 
 
 class CartItem(TypedDict):
@@ -49,21 +73,65 @@ class CartItem(TypedDict):
     quantity: int
 
 
+def append_messages(messages: list, updates: list) -> list:
+    """Reducer cho messages: mỗi node chỉ trả về các message mới"""
+    new_messages = []
+    for update in updates:
+        new_messages.extend(update if isinstance(update, list) else [update])
+    return add_messages(messages, new_messages)
+
+
+def merge_cart_lines(cart: list, lines: list) -> list:
+    """Thêm các dòng vào giỏ, món đã có trong giỏ thì cộng dồn số lượng"""
+    cart = list(cart or [])
+    positions = {line["item_id"]: index for index, line in enumerate(cart)}
+    for line in lines:
+        index = positions.get(line["item_id"])
+        if index is None:
+            positions[line["item_id"]] = len(cart)
+            cart.append(line)
+        else:
+            cart[index] = {
+                **cart[index],
+                "quantity": cart[index]["quantity"] + line["quantity"],
+            }
+    return cart
+
+
+def append_cart(cart: list, updates: list) -> list:
+    """Reducer cho giỏ hàng: mỗi node chỉ trả về các dòng mới thêm vào"""
+    for update in updates:
+        cart = merge_cart_lines(cart, update or [])
+    return list(cart or [])
+
+
 class AgentState(TypedDict):
     user_id: Optional[int]  # ID của user hiện tại (nếu đã login)
     user_name: str  # Dùng để chào hỏi
-    all_items: List[dict]  # Dùng để tư vấn các món (nếu cần)
-    discount_items: List[dict]  # Dùng để tư vấn các món đang giảm giá lúc ban đầu
-    items_str: List[
-        Any
-    ]  # Danh sách các món (chỉ gồm id và name) cho việc xác định intent
-    current_cart: List[CartItem] | None = (
-        None  # Giỏ hàng hiện tại. Nơi lưu trữ các món mà người mua đang đặt
-    )
-    messages: List  # Conversation history
+    # version_id của MenuSnapshot mà thread đang dùng. Các món và prompt menu
+    # không lưu trong state mà lấy từ snapshot dùng chung (xem menu_cache.py)
+    menu_version: Optional[str]
+    current_cart: Annotated[
+        List[CartItem], DeltaChannel(append_cart, snapshot_frequency=DELTA_SNAPSHOT_FREQUENCY)
+    ]  # Giỏ hàng hiện tại. Nơi lưu trữ các món mà người mua đang đặt
+    messages: Annotated[
+        List[AnyMessage],
+        DeltaChannel(append_messages, snapshot_frequency=DELTA_SNAPSHOT_FREQUENCY),
+    ]  # Conversation history
     user_intent: Optional[str] = None
-    user_choice_messages: (
-        List  # Conversation history nhưng dành cho việc xác định intent
-    )
+    user_choice_messages: Annotated[
+        List[AnyMessage],
+        DeltaChannel(append_messages, snapshot_frequency=DELTA_SNAPSHOT_FREQUENCY),
+    ]  # Conversation history nhưng dành cho việc xác định intent
     pending_user_input: Optional[str] = None  # Input từ frontend/API
+    # Kết quả đặt món của lượt hiện tại (ghi đè mỗi lượt): các dòng vừa thêm
+    # vào giỏ và số món không xác định được (sai tên / thiếu số lượng)
+    added_items: Optional[List[CartItem]]
+    skipped_items: Optional[int]
+    # Thời điểm (time.time()) bắt đầu hội thoại, để tính token đã dùng trong
+    # hội thoại này (xem token_ledger.py)
+    conversation_started_at: Optional[float]
+    # Lượt hiện tại đã không gọi được LLM (lỗi / quá deadline / mạch mở, xem
+    # llm_gateway.py): các node sau trong lượt trả lời bằng template
+    llm_fallback: Optional[bool]
     # intent_items_str: str
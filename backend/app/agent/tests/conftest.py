@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+# Các module của agent import theo kiểu phẳng (from schema import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py khởi tạo client Gemini và engine ngay khi import; test không gọi
+# model thật và không kết nối database thật
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+for name, value in {
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "postgres",
+    "POSTGRES_DB": "foodshop_test",
+    "POSTGRES_PORT": "5432",
+    "TOKEN_LEDGER_BACKEND": "memory",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture(autouse=True)
+def reset_greeting_cache():
+    # Lời chào đã cache từ test trước làm greet_user không gọi model
+    from greeting_cache import greeting_cache
+
+    greeting_cache.clear()
+    yield
+    greeting_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def restore_llm():
+    # install_llm / install_stub_llm thay model và các chế độ của nodes
+    from fake_llm import restored_llm
+
+    with restored_llm():
+        yield
@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from sqlalchemy import create_engine, func, select
+import checkpoint_store
+from checkpoint_store import SQLCheckpointSaver, checkpoints_table, threads_table
+from fake_llm import install_stub_llm, run_session
+from graph import build_graph
+from schema import append_cart, append_messages
+
+
+def make_saver(tmp_path, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'checkpoints.db'}")
+    saver = SQLCheckpointSaver(engine, **kwargs)
+    saver.setup()
+    return saver
+
+
+def count(saver, table, thread_id):
+    with saver.engine.connect() as conn:
+        return conn.execute(
+            select(func.count()).select_from(table).where(table.c.thread_id == thread_id)
+        ).scalar_one()
+
+
+def test_state_survives_new_saver(tmp_path):
+    install_stub_llm(0)
+    graph = build_graph(checkpointer=make_saver(tmp_path))
+    asyncio.run(run_session(graph, "t1", turns=2))
+
+    # Giống restart: saver mới trên cùng database
+    graph = build_graph(checkpointer=make_saver(tmp_path))
+    state = asyncio.run(graph.aget_state({"configurable": {"thread_id": "t1"}}))
+    assert state.next == ("get_user_input",)
+    # Hai lượt cùng đặt một món: gộp thành một dòng
+    assert [line["quantity"] for line in state.values["current_cart"]] == [2]
+
+
+def test_keeps_latest_checkpoints(tmp_path):
+    install_stub_llm(0)
+    saver = make_saver(tmp_path, keep_latest=3)
+    graph = build_graph(checkpointer=saver)
+    asyncio.run(run_session(graph, "t1", turns=25))
+
+    # 4 checkpoint mỗi lượt; các checkpoint cũ hơn snapshot gần nhất đã bị xoá
+    assert count(saver, checkpoints_table, "t1") < 4 * 25 // 2
+    state = asyncio.run(graph.aget_state({"configurable": {"thread_id": "t1"}}))
+    assert [line["quantity"] for line in state.values["current_cart"]] == [25]
+    # lời chào (chỉ dẫn + trả lời) + 25 x (khách, bot)
+    assert len(state.values["messages"]) == 2 + 2 * 25
+
+
+def test_cleanup_ttl_and_max_threads(tmp_path):
+    install_stub_llm(0)
+    saver = make_saver(tmp_path, ttl_seconds=60, max_threads=2)
+    graph = build_graph(checkpointer=saver)
+    for thread_id in ("a", "b", "c", "d"):
+        asyncio.run(run_session(graph, thread_id, turns=0))
+
+    with saver.engine.begin() as conn:
+        conn.execute(
+            threads_table.update()
+            .where(threads_table.c.thread_id == "a")
+            .values(updated_at=0)
+        )
+
+    # "a" hết hạn TTL, "b" là thread cũ nhất vượt quá max_threads
+    assert saver.cleanup() == 2
+    assert count(saver, checkpoints_table, "a") == 0
+    assert count(saver, checkpoints_table, "b") == 0
+    assert count(saver, checkpoints_table, "d") > 0
+    assert saver.get_tuple({"configurable": {"thread_id": "a"}}) is None
+
+
+def test_delete_thread(tmp_path):
+    install_stub_llm(0)
+    saver = make_saver(tmp_path)
+    graph = build_graph(checkpointer=saver)
+    asyncio.run(run_session(graph, "t1", turns=1))
+
+    saver.delete_thread("t1")
+    assert count(saver, checkpoints_table, "t1") == 0
+    assert count(saver, threads_table, "t1") == 0
+
+
+def test_reducers_are_batching_invariant():
+    first = [[HumanMessage(content="a", id="1")], [AIMessage(content="b", id="2")]]
+    second = [[HumanMessage(content="c", id="3")]]
+    assert append_messages(append_messages([], first), second) == append_messages(
+        [], first + second
+    )
+
+    line = {"item_id": 1, "title": "Cơm sườn", "price": 35000, "quantity": 1}
+    other = {**line, "item_id": 2, "title": "Phở bò"}
+    assert append_cart(append_cart([], [[line]]), [[other, line]]) == append_cart(
+        [], [[line], [other, line]]
+    )
+    assert append_cart([], [[line], [other, line]]) == [{**line, "quantity": 2}, other]
+
+
+def test_restart_overwrites_history(tmp_path):
+    install_stub_llm(0)
+    graph = build_graph(checkpointer=make_saver(tmp_path))
+    asyncio.run(run_session(graph, "t1", turns=2))
+    # Gửi lại tin nhắn đầu tiên trên cùng thread: bắt đầu lại từ đầu
+    asyncio.run(run_session(graph, "t1", turns=0))
+
+    state = asyncio.run(graph.aget_state({"configurable": {"thread_id": "t1"}}))
+    assert state.values["current_cart"] == []
+    assert len(state.values["messages"]) == 2
+
+
+def test_list_and_expire_idle_threads(tmp_path):
+    install_stub_llm(0)
+    saver = make_saver(tmp_path)
+    graph = build_graph(checkpointer=saver)
+    for thread_id in ("old", "new"):
+        asyncio.run(run_session(graph, thread_id, turns=0))
+    with saver.engine.begin() as conn:
+        conn.execute(
+            threads_table.update()
+            .where(threads_table.c.thread_id == "old")
+            .values(updated_at=0)
+        )
+
+    total, threads = saver.list_threads()
+    assert total == 2
+    assert [thread["thread_id"] for thread in threads] == ["new", "old"]
+    assert all(thread["size_bytes"] > 0 for thread in threads)
+    assert threads[1]["idle_seconds"] > threads[0]["idle_seconds"]
+
+    assert saver.expire_idle(3600) == 1
+    assert [thread["thread_id"] for thread in saver.list_threads()[1]] == ["new"]
+
+
+def test_thread_size_is_kept_incrementally(tmp_path):
+    install_stub_llm(0)
+    saver = make_saver(tmp_path, keep_latest=3)
+    graph = build_graph(checkpointer=saver)
+    asyncio.run(run_session(graph, "t1", turns=10))
+
+    # Dung lượng cộng dồn khớp với tổng dung lượng các checkpoint còn giữ
+    with saver.engine.connect() as conn:
+        actual = conn.execute(
+            select(func.sum(func.length(checkpoints_table.c.checkpoint))).where(
+                checkpoints_table.c.thread_id == "t1"
+            )
+        ).scalar_one()
+    assert saver.list_threads()[1][0]["size_bytes"] == actual
+
+    # Thread mới ghi hai lần (vd. hai worker cùng lúc): upsert, không trùng khoá
+    with saver.engine.begin() as conn:
+        saver._touch_thread(conn, "t2", 1.0, 10)
+        saver._touch_thread(conn, "t2", 2.0, 5)
+    t2 = next(t for t in saver.list_threads()[1] if t["thread_id"] == "t2")
+    assert t2["size_bytes"] == 15 and t2["created_at"] == 1.0 and t2["updated_at"] == 2.0
+
+
+def test_unsupported_langgraph_checkpoint_fails_loudly(monkeypatch):
+    monkeypatch.setattr(checkpoint_store, "package_version", lambda name: "5.0.1")
+    with pytest.raises(ImportError, match="langgraph-checkpoint"):
+        checkpoint_store._check_langgraph_checkpoint()
@@ -0,0 +1,23 @@
+import asyncio
+import nodes
+from benchmarks.bench_concurrency import run_load
+from fake_llm import install_stub_llm, restored_llm
+from menu_cache import menu_cache
+
+
+def test_sessions_overlap_llm_waits():
+    # Mỗi lượt đặt món gọi model 2 lần (200ms/lần). Chạy tuần tự 20 phiên x 3
+    # lượt mất ~10s; các node async phải chồng các lần chờ model lên nhau.
+    result = asyncio.run(run_load(sessions=20, turns=2, delay=0.2))
+    assert result["turns"] == 60
+    assert result["elapsed"] < 3
+
+
+def test_installed_llm_is_restored():
+    llm, fast_intent, version = nodes.llm, nodes.FAST_INTENT_ENABLED, menu_cache.version
+    with restored_llm():
+        install_stub_llm(0, solve_mode="template")
+        assert nodes.llm is not llm and not nodes.FAST_INTENT_ENABLED
+    assert nodes.llm is llm and nodes.FAST_INTENT_ENABLED == fast_intent
+    # Menu mẫu bị bỏ: lần sau load lại menu thật
+    assert menu_cache.version > version and menu_cache.peek() is None
@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from db_pool import PoolCollector, get_engine, pool_stats
+
+
+def test_same_url_shares_one_engine(tmp_path):
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    engine = get_engine(url, pool_size=2)
+    # Lần sau (ví dụ từ agent sau API) nhận lại đúng engine đó
+    assert get_engine(url, pool_size=50) is engine
+    assert engine.pool.size() == 2
+    assert get_engine(f"sqlite:///{tmp_path / 'other.db'}") is not engine
+
+
+def test_pool_counters(tmp_path):
+    engine = get_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    for _ in range(3):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    with engine.connect():
+        assert pool_stats(engine)["checked_out"] == 1
+        # Pool hết connection: chờ pool_timeout rồi báo lỗi
+        with pytest.raises(PoolTimeout):
+            engine.connect()
+
+    stats = pool_stats(engine)
+    assert stats["checkouts"] == 4 and stats["connects"] == 1 and stats["timeouts"] == 1
+    assert stats["checked_out"] == 0 and stats["max_wait_seconds"] >= 0.05
+
+    # dispose() tạo pool mới nhưng giữ bộ đếm
+    engine.dispose()
+    assert pool_stats(engine)["checkouts"] == 4
+    assert "agent_db_pool_checkouts_total 4" in PoolCollector(engine).render()
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from langchain_core.messages import HumanMessage
+from benchmarks.bench_replay import load_conversations, percentile, run_replay
+from fake_llm import FakeChatModel, track_model_time
+from history import INSTRUCTION
+from schema import TurnResult, UserIntent
+
+SCRIPT = {
+    "2 phở bò": {
+        "intent": "BUY",
+        "items": [{"item_id": 2, "quantity": 2}],
+        "reply": "Đã thêm 2 Phở bò ạ.",
+    }
+}
+
+
+def test_streams_tokens_with_latency():
+    model = FakeChatModel(
+        script=SCRIPT, first_token_latency=0.05, per_token_latency=0.01, chars_per_token=4
+    )
+
+    async def stream():
+        start = time.perf_counter()
+        stamps, chunks = [], []
+        async for chunk in model.astream([HumanMessage(content="2 phở bò")]):
+            stamps.append(time.perf_counter() - start)
+            if chunk.content:
+                chunks.append(chunk.content)
+        return stamps, chunks
+
+    with track_model_time() as clock:
+        stamps, chunks = asyncio.run(stream())
+    assert "".join(chunks) == "Đã thêm 2 Phở bò ạ."
+    assert len(chunks) == 5
+    assert stamps[0] >= 0.05
+    assert stamps[-1] >= 0.05 + 4 * 0.01
+    assert clock.calls == 1 and clock.seconds >= stamps[-1] - 0.01
+
+
+def test_scripted_structured_output():
+    model = FakeChatModel(script=SCRIPT)
+    messages = [
+        HumanMessage(content="2 phở bò"),
+        HumanMessage(content="chỉ dẫn cho model", name=INSTRUCTION),
+    ]
+    parsed = model.with_structured_output(UserIntent).invoke(messages)
+    assert parsed == UserIntent(intent="BUY", items=[{"item_id": 2, "quantity": 2}])
+    # Không có trong script: output mặc định
+    unknown = model.with_structured_output(UserIntent).invoke([HumanMessage(content="?")])
+    assert unknown.intent == "UNCLEAR"
+
+    # Schema dạng dict: stream ra các dict chưa hoàn chỉnh, reply dài dần
+    turn_llm = model.with_structured_output(TurnResult.model_json_schema())
+    partials = list(turn_llm.stream(messages))
+    replies = [p.get("reply") for p in partials if p.get("reply")]
+    assert len(replies) > 1 and replies[-1] == SCRIPT["2 phở bò"]["reply"]
+
+
+def test_replay_reports(tmp_path):
+    conversations = load_conversations()
+    report = asyncio.run(
+        run_replay(
+            conversations,
+            sessions=2,
+            first_token_latency=0.01,
+            per_token_latency=0,
+            checkpoint_dir=str(tmp_path),
+        )
+    )
+    assert report["turns"] == 2 * sum(len(c["turns"]) for c in conversations)
+    assert report["intent_mismatches"] == 0
+    assert report["latency"][50] <= report["latency"][99]
+    assert report["ttft"][50] <= report["latency"][99]
+    assert report["checkpoint_bytes_per_thread"] > 0
+    assert 0 < report["llm_calls_per_turn"] < 2
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0.0
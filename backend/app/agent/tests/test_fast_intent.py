@@ -0,0 +1,173 @@
+import unicodedata
+import pytest
+import fast_intent
+from fast_intent import FastIntentParser, parse_quantity, normalize
+from fuzzy_index import FuzzyIndex
+from menu_cache import MenuSnapshot
+from schema import Item
+
+MENU = MenuSnapshot(
+    0,
+    [
+        Item(id=1, title="Cơm sườn", price=35000),
+        Item(id=2, title="Cơm sườn bì chả", price=45000),
+        Item(id=3, title="Trà đá", price=5000),
+        Item(id=4, title="Bánh bao", price=15000),
+        Item(id=5, title="Phở bò", price=40000),
+    ],
+)
+
+
+@pytest.mark.parametrize(
+    "words, expected",
+    [
+        ("2", 2),
+        ("hai", 2),
+        ("ba", 3),
+        ("mười", 10),
+        ("mười hai", 12),
+        ("hai mươi lăm", 25),
+        ("một chục", 10),
+        ("chục", 10),
+        ("nửa chục", 5),
+        ("hai ba", None),
+        ("lăm", None),
+        ("cơm", None),
+    ],
+)
+def test_parse_quantity(words, expected):
+    assert parse_quantity(words.split()) == expected
+
+
+@pytest.mark.parametrize(
+    "text, item_id, quantity",
+    [
+        ("2 cơm sườn", 1, 2),
+        ("Cho mình 2 phần cơm sườn nhé", 1, 2),
+        ("cơm sườn x3", 1, 3),
+        ("hai cơm sườn bì chả", 2, 2),
+        ("một chục bánh bao", 4, 10),
+        ("ba ly trà đá", 3, 3),
+        ("Phở bò 1 tô!", 5, 1),
+    ],
+)
+def test_buy(text, item_id, quantity):
+    parsed = FastIntentParser().parse(text, MENU)
+    assert parsed is not None
+    assert parsed.intent == "BUY"
+    assert [(line.item_id, line.quantity) for line in parsed.items] == [(item_id, quantity)]
+
+
+@pytest.mark.parametrize(
+    "text", ["không mua nữa", "Thôi", "vậy đủ rồi ạ", "thôi không mua nữa nhé"]
+)
+def test_not_buy(text):
+    parsed = FastIntentParser().parse(text, MENU)
+    assert parsed is not None and parsed.intent == "NOT_BUY"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "cơm sườn",  # thiếu số lượng
+        "2 cơm",  # không khớp tên món
+        "cơm sườn bao nhiêu tiền?",
+        "không lấy cơm sườn nữa",
+        "2 cơm sườn ít cơm",
+        "2 cơm sườn 1 trà đá 3",  # số lượng vừa trước vừa sau tên món
+        "2 cơm sườn và trà đá",  # thiếu số lượng của một món
+        "đúng rồi",
+        "100 trà đá",
+    ],
+)
+def test_falls_back(text):
+    assert FastIntentParser().parse(text, MENU) is None
+
+
+@pytest.mark.parametrize(
+    "text, lines",
+    [
+        ("2 cơm sườn và 1 trà đá", [(1, 2), (3, 1)]),
+        ("cho mình 2 phở bò, 1 trà đá với 3 bánh bao nhé", [(5, 2), (3, 1), (4, 3)]),
+        ("phở bò x2, trà đá x1", [(5, 2), (3, 1)]),
+        ("hai cơm sườn bì chả và một cơm sườn", [(2, 2), (1, 1)]),
+    ],
+)
+def test_buy_many(text, lines):
+    parsed = FastIntentParser().parse(text, MENU)
+    assert parsed is not None and parsed.intent == "BUY"
+    assert [(line.item_id, line.quantity) for line in parsed.items] == lines
+
+
+def test_counters():
+    parser = FastIntentParser()
+    parser.parse("2 cơm sườn", MENU)
+    parser.parse("món nào ngon?", MENU)
+    parser.parse("thôi", MENU)
+    stats = parser.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert stats["fallback_rate"] == pytest.approx(1 / 3)
+
+
+def test_normalize_nfd_input():
+    assert normalize(unicodedata.normalize("NFD", "2 Cơm Sườn")) == ["2", "cơm", "sườn"]
+
+
+@pytest.mark.parametrize(
+    "text, item_id, quantity",
+    [
+        ("2 com suon", 1, 2),
+        ("cho 2 com suong", 1, 2),  # gõ sai
+        ("ba tra da nha", 3, 3),
+    ],
+)
+def test_buy_without_diacritics(text, item_id, quantity):
+    parsed = FastIntentParser().parse(text, MENU)
+    assert parsed is not None
+    assert parsed.intent == "BUY"
+    assert [(line.item_id, line.quantity) for line in parsed.items] == [(item_id, quantity)]
+
+
+ACCENT_MENU = MenuSnapshot(
+    0,
+    [
+        Item(id=1, title="Cá kho", price=40000),
+        Item(id=2, title="Cà kho", price=30000),
+        Item(id=3, title="Bò nướng", price=60000),
+        Item(id=4, title="Sinh tố bơ", price=30000),
+    ],
+)
+
+
+@pytest.mark.parametrize(
+    "text, item_id",
+    [
+        ("2 cá kho", 1),
+        ("2 cà kho", 2),
+        ("2 bo nuong", 3),
+        ("2 sinh to bơ", 4),
+    ],
+)
+def test_exact_diacritics_win(text, item_id):
+    parsed = FastIntentParser().parse(text, ACCENT_MENU)
+    assert parsed is not None
+    assert [(line.item_id, line.quantity) for line in parsed.items] == [(item_id, 2)]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "2 ca kho",  # bỏ dấu thì khớp cả hai món
+        "2 cả kho",  # dấu không khớp món nào
+        "2 bơ nướng",  # gõ sai tên món nhưng dấu chỉ sang món khác
+    ],
+)
+def test_ambiguous_diacritics_fall_back(text):
+    assert FastIntentParser().parse(text, ACCENT_MENU) is None
+
+
+def test_fuzzy_candidate_missing_from_menu(monkeypatch):
+    # Index dùng chung đang đồng bộ với một snapshot khác (có món 9)
+    other = FuzzyIndex([(9, "Mì Quảng")], coverage_weight=0.2)
+    monkeypatch.setattr(fast_intent, "get_menu_title_index", lambda menu: other)
+    assert FastIntentParser().parse("2 mi quangg", MENU) is None
@@ -0,0 +1,78 @@
+import threading
+from fuzzy_index import FuzzyIndex, fold, trigrams
+
+TITLES = [
+    (1, "Cơm sườn"),
+    (2, "Cơm sườn bì chả"),
+    (3, "Phở bò tái"),
+    (4, "Trà đá"),
+    (5, "Bánh mì đặc biệt"),
+]
+
+
+def test_fold():
+    assert fold("Phở Bò Tái!") == "pho bo tai"
+    assert fold("Bánh mì  đặc biệt") == "banh mi dac biet"
+
+
+def test_trigrams_pad_words():
+    assert trigrams("đá") == frozenset({"  d", " da", "da "})
+
+
+def test_search_without_diacritics():
+    index = FuzzyIndex(TITLES)
+    results = index.search("com suon")
+    assert [item_id for item_id, _ in results][:2] == [1, 2]
+    assert results[0][1] == 1.0
+    assert index.search("pho bo tai")[0][0] == 3
+
+
+def test_search_misspelling():
+    index = FuzzyIndex(TITLES, coverage_weight=0.2)
+    top = index.search("banh my dac biet", limit=1)
+    assert top[0][0] == 5
+
+
+def test_search_no_match():
+    index = FuzzyIndex(TITLES)
+    assert index.search("pizza hải sản") == []
+    assert index.search("") == []
+
+
+def test_incremental_updates():
+    index = FuzzyIndex(TITLES)
+    index.add(6, "Trà sữa")
+    assert 6 in index and len(index) == 6
+    index.add(4, "Nước cam")  # đổi tên
+    assert index.search("tra da", min_score=0.9) == []
+    assert index.search("nuoc cam")[0][0] == 4
+    index.remove(3)
+    assert index.search("pho") == []
+
+    index.sync([(1, "Cơm sườn"), (7, "Chè ba màu")])
+    assert len(index) == 2
+    assert index.search("che ba mau")[0][0] == 7
+
+
+def test_sync_while_adding_from_other_threads():
+    index = FuzzyIndex((i, f"Món {i}") for i in range(200))
+    errors = []
+
+    def writer():
+        try:
+            for i in range(200, 2000):
+                index.add(i, f"Món {i}")
+                index.remove(i)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(50):
+            index.sync((i, f"Món {i}") for i in range(200))
+    except Exception as e:
+        errors.append(e)
+    thread.join()
+    assert not errors
+    assert len(index) == 200
@@ -0,0 +1,74 @@
+import asyncio
+from langgraph.checkpoint.memory import MemorySaver
+from fake_llm import DEFAULT_REPLY, install_stub_llm, track_model_time
+from graph import build_graph
+from greeting_cache import GreetingCache, greeting_cache, greeting_key
+
+
+def test_variants_and_lru():
+    cache = GreetingCache(variants=2, max_entries=2)
+    a = greeting_key("v1", ["Phở bò", "Cơm sườn"], "An")
+    # Thứ tự các món giảm giá không đổi key
+    assert a == greeting_key("v1", ["Cơm sườn", "Phở bò"], "An")
+    b, c = greeting_key("v1", [], "Bình"), greeting_key("v2", [], "An")
+
+    assert cache.get(a) is None
+    for text in ("Chào An!", "Chào An!", "Xin chào An", "Chào An nhé"):
+        cache.add(a, text)
+    assert sorted({cache.get(a) for _ in range(20)}) == ["Chào An!", "Xin chào An"]
+
+    cache.add(b, "Chào Bình")
+    cache.get(a)
+    # a vừa được dùng: b là key dùng lâu nhất nên bị bỏ
+    cache.add(c, "Chào An (menu mới)")
+    assert cache.get(b) is None and cache.get(a) is not None
+    assert cache.stats()["evicted"] == 1
+
+
+def test_warm_runs_once_per_key():
+    cache = GreetingCache(variants=1)
+    key = greeting_key("v1", [], "An")
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "Chào An"
+
+    async def run():
+        first = cache.warm(key, generate)
+        assert cache.warm(key, generate) is None
+        await first
+        # Đủ variant: không gọi model nữa
+        assert cache.warm(key, generate) is None
+
+    asyncio.run(run())
+    assert calls == [1] and cache.get(key) == "Chào An"
+
+
+def test_first_greeting_uses_template_then_cache(monkeypatch):
+    install_stub_llm(0.05)
+    monkeypatch.setattr(greeting_cache, "variants", 1)
+    greeting_cache.clear()
+    generated = greeting_cache.stats()["generated"]
+    graph = build_graph(checkpointer=MemorySaver())
+
+    async def greet(thread_id):
+        config = {"configurable": {"thread_id": thread_id}}
+        with track_model_time() as clock:
+            async for _ in graph.astream({}, config=config, stream_mode="messages"):
+                pass
+        return clock.calls, (await graph.aget_state(config)).values["messages"][-1].content
+
+    async def run():
+        # Lần đầu: template ngay, model viết lời chào ở background
+        calls, first = await greet("greeting-1")
+        await greeting_cache.join()
+        calls_cached, second = await greet("greeting-2")
+        return calls, first, calls_cached, second
+
+    calls, first, calls_cached, second = asyncio.run(run())
+    assert calls == 0 and calls_cached == 0
+    # Lần sau: lời chào của model lấy từ cache, không gọi model trong lượt
+    assert "Phở bò" in first and second == DEFAULT_REPLY
+    assert greeting_cache.stats()["generated"] == generated + 1
@@ -0,0 +1,84 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from history import (
+    INSTRUCTION,
+    HistoryMetrics,
+    split_turns,
+    summarize_turns,
+    window_messages,
+)
+
+SYSTEM = SystemMessage(content="system prompt " * 50)
+
+
+def conversation(turns):
+    messages = [SYSTEM]
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"khách nói câu {i}"))
+        messages.append(AIMessage(content=f"bot trả lời câu {i}"))
+    return messages
+
+
+def test_split_turns():
+    turns = split_turns(conversation(3)[1:])
+    assert len(turns) == 3
+    assert all(isinstance(turn[0], HumanMessage) for turn in turns)
+
+
+def test_short_history_untouched():
+    messages = conversation(2)
+    assert window_messages(messages, max_turns=6, token_budget=1000) == messages
+
+
+def test_keeps_last_turns_and_summarizes_rest():
+    messages = conversation(10)
+    cart = [{"item_id": 1, "title": "Cơm sườn", "quantity": 2}]
+    window = window_messages(messages, max_turns=3, token_budget=1000, cart=cart)
+
+    assert window[0] is SYSTEM
+    context = window[1]
+    assert isinstance(context, SystemMessage)
+    assert "khách nói câu 6" in context.content
+    assert "2 x Cơm sườn" in context.content
+    assert [m.content for m in window[2:]] == [m.content for m in messages[-6:]]
+
+
+def test_token_budget_limits_turns():
+    messages = conversation(10)
+    # mỗi lượt ~9 token: budget 20 chỉ đủ cho 2 lượt
+    window = window_messages(messages, max_turns=10, token_budget=20)
+    assert window[-1].content == "bot trả lời câu 9"
+    assert len(window) == 2 + 4
+
+
+def test_always_keeps_last_turn():
+    messages = [SYSTEM, HumanMessage(content="x" * 4000)]
+    window = window_messages(messages, max_turns=1, token_budget=10)
+    assert window == messages
+
+
+def test_summary_skips_instructions_and_respects_budget():
+    turns = [
+        [
+            HumanMessage(content="Hãy chào khách", name=INSTRUCTION),
+            AIMessage(content="Chào bạn"),
+        ],
+        [HumanMessage(content="2 cơm sườn"), AIMessage(content="Dạ")],
+    ]
+    summary = summarize_turns(turns, token_budget=100)
+    assert "Hãy chào khách" not in summary
+    assert "- Khách: 2 cơm sườn" in summary
+    assert "- Bot: Chào bạn" in summary
+
+    short = summarize_turns(turns, token_budget=5)
+    assert "bỏ qua" in short
+    assert "Chào bạn" not in short
+
+
+def test_metrics():
+    metrics = HistoryMetrics()
+    metrics.record("messages", 100, 40)
+    metrics.record("messages", 200, 50)
+    stats = metrics.stats()["messages"]
+    assert stats["calls"] == 2
+    assert stats["saved_tokens"] == 210
+    assert stats["last_saved"] == 150
@@ -0,0 +1,17 @@
+import os
+from benchmarks.bench_import import loaded_agent_stack, run_importtime
+
+# Ngân sách cold start của `import app.main` (ms). Trước khi agent được load
+# lazy, import kéo theo langgraph / langchain / Gemini client mất ~3 s
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "2500"))
+
+
+def test_api_import_stays_within_budget(tmp_path):
+    records, raw = run_importtime("app.main")
+    # Giữ lại output của -X importtime để xem module nào chậm khi test lỗi
+    artifact = os.getenv("IMPORTTIME_ARTIFACT") or str(tmp_path / "importtime.txt")
+    with open(artifact, "w", encoding="utf-8") as f:
+        f.write(raw)
+
+    assert loaded_agent_stack(records) == []
+    assert records["app.main"][1] / 1000 < IMPORT_BUDGET_MS, artifact
@@ -0,0 +1,252 @@
+import asyncio
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+import nodes
+from fake_llm import FakeChatModel, FakeModelError, install_stub_llm, run_session
+from graph import build_graph
+from llm_gateway import CircuitBreaker, LLMBusy, LLMGateway, LLMUnavailable, llm_gateway
+
+
+def test_concurrency_is_bounded():
+    gateway = LLMGateway(max_concurrency=2, queue_timeout=1)
+    running = []
+    peak = 0
+
+    async def work():
+        nonlocal peak
+        running.append(1)
+        peak = max(peak, len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    async def run():
+        await asyncio.gather(*(gateway.call(work, key=f"user:{i}") for i in range(6)))
+
+    asyncio.run(run())
+    assert peak == 2
+    assert gateway.stats()["in_flight"] == 0 and gateway.stats()["queued"] == 0
+    assert gateway.wait_seconds.count() == 6
+
+
+def test_users_take_turns():
+    gateway = LLMGateway(max_concurrency=1, queue_timeout=1)
+    order = []
+
+    def work(name):
+        async def call():
+            order.append(name)
+            await asyncio.sleep(0.005)
+
+        return call
+
+    async def run():
+        # a gửi 3 lần liên tiếp trước b: b không phải chờ hết các lần của a
+        calls = [gateway.call(work(f"a{i}"), key="a") for i in range(3)]
+        calls.append(gateway.call(work("b0"), key="b"))
+        await asyncio.gather(*calls)
+
+    asyncio.run(run())
+    assert order == ["a0", "a1", "b0", "a2"]
+
+
+def test_rejects_when_queue_is_full_or_wait_too_long():
+    gateway = LLMGateway(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+
+    async def run():
+        release = asyncio.Event()
+        holder = asyncio.create_task(gateway.call(release.wait, key="a"))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(gateway.call(asyncio.sleep, key="b"))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMBusy) as full:
+            await gateway.call(asyncio.sleep, key="c")
+        with pytest.raises(LLMBusy) as timeout:
+            await waiter
+        release.set()
+        await holder
+        return full.value.reason, timeout.value.reason
+
+    assert asyncio.run(run()) == ("queue_full", "queue_timeout")
+    stats = gateway.stats()
+    assert stats["rejected"]["queue_full"] == 1 and stats["rejected"]["queue_timeout"] == 1
+    assert stats["queued"] == 0 and stats["in_flight"] == 0
+
+
+def test_call_deadline():
+    gateway = LLMGateway(call_timeout=0.05)
+    model = gateway.wrap(FakeChatModel(first_token_latency=0.5))
+
+    async def stream():
+        return [chunk async for chunk in model.astream("xin chào")]
+
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(model.ainvoke("xin chào"))
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(stream())
+    assert gateway.stats()["failures"]["deadline"] == 2
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_circuit_breaker_opens_and_recovers():
+    now = [0.0]
+    gateway = LLMGateway(breaker=CircuitBreaker(2, reset_timeout=10, clock=lambda: now[0]))
+    fake = FakeChatModel(failing=True)
+    model = gateway.wrap(fake)
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable) as error:
+            asyncio.run(model.ainvoke("xin chào"))
+        assert isinstance(error.value.__cause__, FakeModelError)
+    assert gateway.breaker.state == "open" and not gateway.available()
+
+    # Mạch mở: từ chối ngay, không gọi tới provider
+    with pytest.raises(LLMUnavailable) as error:
+        asyncio.run(model.ainvoke("xin chào"))
+    assert error.value.reason == "circuit_open" and fake.calls == 2
+
+    # Hết reset_timeout: một lần gọi thử, lỗi thì mở lại, thành công thì đóng
+    now[0] = 10
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(model.ainvoke("xin chào"))
+    assert gateway.breaker.state == "open"
+    now[0] = 20
+    fake.failing = False
+    assert asyncio.run(model.ainvoke("xin chào")).content
+    assert gateway.breaker.state == "closed"
+
+
+@pytest.mark.parametrize("hedge", [False, True])
+def test_cancelled_probe_lets_next_call_through(hedge):
+    now = [0.0]
+    gateway = LLMGateway(
+        breaker=CircuitBreaker(1, reset_timeout=10, clock=lambda: now[0]),
+        hedge_delay=0.01 if hedge else None,
+    )
+    gateway.breaker.record_failure()
+    now[0] = 10
+    assert gateway.breaker.state == "half_open"
+    model = gateway.wrap(FakeChatModel(call_latencies=[1.0, 1.0, 0.0]), hedge=hedge)
+
+    async def scenario():
+        # Lần gọi thử bị huỷ giữa chừng (vd. khách ngắt kết nối)
+        probe = asyncio.ensure_future(model.ainvoke("xin chào"))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await model.ainvoke("xin chào")
+
+    assert asyncio.run(scenario()).content
+    assert gateway.breaker.state == "closed"
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_cancelled_stream_probe_lets_next_call_through():
+    now = [0.0]
+    gateway = LLMGateway(breaker=CircuitBreaker(1, reset_timeout=10, clock=lambda: now[0]))
+    gateway.breaker.record_failure()
+    now[0] = 10
+    model = gateway.wrap(FakeChatModel(call_latencies=[1.0, 0.0]))
+
+    async def scenario():
+        async def consume():
+            async for _ in model.astream("xin chào"):
+                pass
+
+        probe = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await model.ainvoke("xin chào")
+
+    assert asyncio.run(scenario()).content
+    assert gateway.breaker.state == "closed"
+
+
+def test_hedged_request_wins_over_slow_first_call():
+    gateway = LLMGateway(hedge_delay=0.05)
+    fake = FakeChatModel(call_latencies=[1.0, 0.0])
+    model = gateway.wrap(fake, hedge=True)
+
+    async def timed():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await model.ainvoke("xin chào")
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(timed())
+    assert result.content and elapsed < 0.5
+    assert fake.calls == 2
+    stats = gateway.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1 and stats["in_flight"] == 0
+
+
+def test_half_open_probe_is_not_hedged():
+    now = [0.0]
+    gateway = LLMGateway(
+        breaker=CircuitBreaker(1, reset_timeout=10, clock=lambda: now[0]),
+        hedge_delay=0.01,
+    )
+    gateway.breaker.record_failure()
+    now[0] = 10
+    fake = FakeChatModel(call_latencies=[0.1, 0.0])
+    assert asyncio.run(gateway.wrap(fake, hedge=True).ainvoke("xin chào")).content
+    assert fake.calls == 1 and gateway.stats()["hedged"] == 0
+    assert gateway.breaker.state == "closed"
+
+
+def test_fast_call_is_not_hedged():
+    gateway = LLMGateway(hedge_delay=0.5)
+    fake = FakeChatModel()
+    asyncio.run(gateway.wrap(fake, hedge=True).ainvoke("xin chào"))
+    assert fake.calls == 1 and gateway.stats()["hedged"] == 0
+
+
+def test_busy_is_not_treated_as_unclear(monkeypatch):
+    install_stub_llm(0)
+    graph = build_graph(checkpointer=MemorySaver())
+    asyncio.run(run_session(graph, "gateway-busy", turns=0))
+    # Không còn chỗ và không được chờ: mọi lần gọi bị từ chối ngay
+    monkeypatch.setattr(llm_gateway, "max_concurrency", 0)
+    monkeypatch.setattr(llm_gateway, "max_queue", 0)
+    config = {"configurable": {"thread_id": "gateway-busy"}}
+
+    async def turn():
+        await graph.aupdate_state(config, {"pending_user_input": "món nào ngon?"})
+        async for _ in graph.astream(None, config=config):
+            pass
+
+    # parse_user_order không nuốt lỗi thành UNCLEAR, API sẽ báo [BUSY]
+    with pytest.raises(LLMBusy):
+        asyncio.run(turn())
+    assert asyncio.run(graph.aget_state(config)).next == ("parse_user_order",)
+
+
+@pytest.mark.parametrize("mode", ["two_call", "single_call"])
+def test_provider_outage_falls_back_to_templates(monkeypatch, mode):
+    install_stub_llm(0, solve_mode="llm")
+    graph = build_graph(checkpointer=MemorySaver(), mode=mode)
+    thread_id = f"gateway-outage-{mode}"
+    asyncio.run(run_session(graph, thread_id, turns=0))
+    config = {"configurable": {"thread_id": thread_id}}
+    fake = nodes.llm.model
+    monkeypatch.setattr(fake, "failing", True)
+    monkeypatch.setattr(llm_gateway, "breaker", CircuitBreaker(1, reset_timeout=60))
+
+    async def turn(text):
+        await graph.aupdate_state(config, {"pending_user_input": text})
+        async for _ in graph.astream(None, config=config):
+            pass
+        return (await graph.aget_state(config)).values
+
+    # Lần gọi lỗi đầu tiên mở mạch; lượt này vẫn có câu trả lời (template)
+    values = asyncio.run(turn("món nào ngon?"))
+    assert values["user_intent"] == "UNCLEAR" and values["messages"][-1].content
+    calls = fake.calls
+    # Mạch mở: parser cục bộ + template, không gọi model nữa
+    values = asyncio.run(turn("2 cơm sườn"))
+    assert values["user_intent"] == "BUY" and values["current_cart"][0]["quantity"] == 2
+    values = asyncio.run(turn("thôi"))
+    assert values["user_intent"] == "NOT_BUY" and "giỏ hàng" in values["messages"][-1].content
+    assert fake.calls == calls
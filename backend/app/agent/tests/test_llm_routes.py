@@ -0,0 +1,74 @@
+import asyncio
+import json
+import pytest
+from langchain_core.runnables import RunnableLambda
+from fake_llm import FakeChatModel
+from llm_gateway import LLMGateway, LLMUnavailable, ModelRouter
+from llm_routes import DEFAULT, build_model, load_routes
+from metrics import AgentMetrics
+
+
+def test_routes_override_defaults_per_field(tmp_path):
+    routes = load_routes(
+        json.dumps(
+            {
+                "default": {"model": "gemini-2.5-flash", "timeout": 20},
+                "solve_buy": {"temperature": 0.2},
+                "parse_user_order": {"max_output_tokens": 128},
+            }
+        )
+    )
+    # Node mới: các field còn lại lấy theo route default
+    assert routes["solve_buy"].model == "gemini-2.5-flash"
+    assert routes["solve_buy"].temperature == 0.2 and routes["solve_buy"].timeout == 20
+    # Node có route sẵn: chỉ field được khai báo bị ghi đè
+    assert routes["parse_user_order"].model == "gemini-2.0-flash-lite"
+    assert routes["parse_user_order"].max_output_tokens == 128
+    assert routes["greet_user"].temperature == 0.9
+
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps({"greet_user": {"model": "gemini-2.5-pro"}}))
+    assert load_routes("{}", str(path))["greet_user"].model == "gemini-2.5-pro"
+    with pytest.raises(ValueError):
+        load_routes("[]")
+
+
+def test_router_picks_model_and_deadline_of_node():
+    routes = load_routes(json.dumps({"slow_node": {"timeout": 0.05}}))
+    models = {node: build_model(route, "fake") for node, route in routes.items()}
+    models["slow_node"] = FakeChatModel(model="slow", first_token_latency=0.5)
+    gateway = LLMGateway(call_timeout=5)
+    router = ModelRouter(models, routes, gateway)
+
+    def run_as(node):
+        # Giống lúc gọi trong node của graph: metadata có langgraph_node
+        async def call(_):
+            return await router.ainvoke("xin chào")
+
+        step = RunnableLambda(call)
+        return asyncio.run(step.ainvoke(None, {"metadata": {"langgraph_node": node}}))
+
+    assert router.for_node("parse_user_order").model.model == "gemini-2.0-flash-lite"
+    assert router.for_node("solve_unclear").model.model == routes[DEFAULT].model
+    assert run_as("parse_user_order").content
+    with pytest.raises(LLMUnavailable):
+        run_as("slow_node")
+    assert gateway.stats()["failures"]["deadline"] == 1
+
+
+def test_route_latency_and_cost():
+    metrics = AgentMetrics(log_turns=False)
+    metrics.set_model_price("gemini-2.0-flash-lite", 0.075, 0.30)
+    metadata = {"ls_model_name": "gemini-2.0-flash-lite"}
+    metrics.observe_llm("parse_user_order", 0.2, 1000, 100, metadata)
+    metrics.observe_llm("parse_user_order", 0.4, 1000, 100, metadata)
+    metrics.observe_llm("greet_user", 0.1, 10, 10, {})
+
+    usage = {(row["node"], row["model"]): row for row in metrics.route_stats()}
+    parse = usage[("parse_user_order", "gemini-2.0-flash-lite")]
+    assert parse["calls"] == 2
+    assert parse["avg_seconds"] == pytest.approx(0.3)
+    assert parse["cost_usd"] == pytest.approx(2 * (1000 * 0.075 + 100 * 0.30) / 1_000_000)
+    # Model không rõ giá: vẫn đo độ trễ, chi phí 0
+    assert usage[("greet_user", "-")]["cost_usd"] == 0
+    assert 'agent_llm_cost_usd_total{node="parse_user_order"' in metrics.render()
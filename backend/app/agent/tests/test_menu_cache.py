@@ -0,0 +1,157 @@
+import asyncio
+from langgraph.checkpoint.memory import MemorySaver
+from fake_llm import ITEMS, install_stub_llm, run_session
+from graph import build_graph
+from menu_cache import MenuCache, menu_cache
+from schema import Item
+
+
+def make_items():
+    return [
+        Item(id=1, title="Cơm sườn", price=35000, discount=None),
+        Item(id=2, title="Phở bò", price=45000, discount=0.1),
+        Item(id=3, title="Trà đá", price=5000, discount=0),
+    ]
+
+
+def test_snapshot_indexes():
+    cache = MenuCache()
+    menu = cache.get(make_items)
+    assert menu.version == 0
+    assert len(menu) == 3
+    assert menu.get(2).title == "Phở bò"
+    assert menu.get(99) is None
+    assert [item.id for item in menu.discount_items] == [2]
+
+
+def test_loader_called_once_until_bump():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return make_items()
+
+    cache = MenuCache()
+    first = cache.get(loader)
+    for _ in range(10):
+        assert cache.get(loader) is first
+    assert len(calls) == 1
+    assert cache.hits == 10 and cache.misses == 1
+
+    assert cache.bump() == 1
+    second = cache.get(loader)
+    assert second is not first
+    assert second.version == 1
+    assert len(calls) == 2
+
+
+def test_bump_during_load_rebuilds_next_time():
+    cache = MenuCache()
+
+    def loader():
+        cache.bump()
+        return make_items()
+
+    stale = cache.get(loader)
+    assert stale.version == 0
+    fresh = cache.get(make_items)
+    assert fresh.version == 1
+
+
+def test_ttl_picks_up_changes_from_other_workers():
+    now = [0.0]
+    items = make_items()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return items
+
+    cache = MenuCache(ttl=60, clock=lambda: now[0])
+    first = cache.get(loader)
+    now[0] = 30
+    assert cache.peek() is first
+
+    # Quá ttl, menu không đổi: giữ snapshot và version cũ
+    now[0] = 61
+    assert cache.peek() is None
+    assert cache.get(loader) is first and cache.version == 0
+    assert len(calls) == 2
+
+    # Worker khác đổi giá món (không có bump trong worker này)
+    items = [items[0].model_copy(update={"price": 99000})] + items[1:]
+    now[0] = 122
+    changed = cache.get(loader)
+    assert changed.version == 1 and changed.get(1).price == 99000
+    assert cache.resolve(first.version_id) is first
+
+
+def test_version_id_follows_content():
+    cache = MenuCache()
+    first = cache.get(make_items)
+    cache.bump()
+    same = cache.get(make_items)
+    assert same.version_id == first.version_id
+
+    cache.bump()
+    changed = cache.get(lambda: make_items()[:2])
+    assert changed.version_id != first.version_id
+
+
+def test_old_versions_resolve_until_evicted():
+    cache = MenuCache(max_retained=2)
+    versions = []
+    for size in (3, 2, 1):
+        cache.bump()
+        versions.append(cache.get(lambda: make_items()[:size]).version_id)
+
+    assert len(cache.resolve(versions[2])) == 1
+    assert len(cache.resolve(versions[1])) == 2
+    # Chỉ giữ 2 version: version cũ nhất đã bị bỏ
+    assert cache.resolve(versions[0]) is None
+    assert cache.resolve("unknown") is None
+
+
+def test_retained_versions_expire_by_clock():
+    now = [0.0]
+    cache = MenuCache(retain_seconds=10, clock=lambda: now[0])
+    first = cache.get(lambda: make_items()[:3]).version_id
+    now[0] = 8
+    assert cache.resolve(first) is not None
+
+    now[0] = 15
+    cache.bump()
+    second = cache.get(lambda: make_items()[:2]).version_id
+    # Lần resolve lúc t=8 gia hạn version đầu
+    assert cache.resolve(first) is not None
+
+    now[0] = 30
+    cache.bump()
+    cache.get(lambda: make_items()[:1])
+    assert cache.resolve(first) is None
+    assert cache.resolve(second) is None
+
+
+def test_thread_keeps_its_menu_version():
+    install_stub_llm(0)
+    graph = build_graph(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "pinned"}}
+    asyncio.run(run_session(graph, "pinned", turns=0))
+
+    # Menu đổi (món 1 đổi giá) giữa hội thoại
+    menu_cache.bump()
+    menu_cache.get(lambda: [ITEMS[0].model_copy(update={"price": 99000})] + ITEMS[1:])
+
+    async def order():
+        await graph.aupdate_state(config, {"pending_user_input": "1 cơm sườn"})
+        await graph.ainvoke(None, config=config)
+        return await graph.aget_state(config)
+
+    state = asyncio.run(order())
+    assert "all_items" not in state.values
+    assert state.values["current_cart"][0]["price"] == ITEMS[0].price
+
+    # Thread mới dùng menu mới
+    asyncio.run(run_session(graph, "fresh", turns=1))
+    state = asyncio.run(graph.aget_state({"configurable": {"thread_id": "fresh"}}))
+    assert state.values["current_cart"][0]["price"] == 99000
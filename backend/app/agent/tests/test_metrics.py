@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine
+from checkpoint_store import SQLCheckpointSaver
+from fake_llm import FakeChatModel, install_stub_llm, run_session
+from graph import build_graph
+from llm_gateway import LLMGateway, LLMUnavailable
+from metrics import AgentMetrics, Histogram, agent_metrics
+
+
+def test_histogram_render():
+    histogram = Histogram("latency_seconds", "help", ("node",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 2.0):
+        histogram.observe(value, "a")
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{node="a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{node="a",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{node="a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{node="a"} 3' in lines
+    assert 'latency_seconds_sum{node="a"} 2.550000' in lines
+
+
+def test_turn_records_nodes_model_and_checkpoint(tmp_path):
+    install_stub_llm(0.01)
+    saver = SQLCheckpointSaver(create_engine(f"sqlite:///{tmp_path / 'm.db'}"))
+    saver.setup()
+    graph = build_graph(checkpointer=saver)
+    before = agent_metrics.node_seconds.count("parse_user_order")
+
+    async def run():
+        with agent_metrics.turn("metrics") as record:
+            await run_session(graph, "metrics", turns=1)
+        return record
+
+    record = asyncio.run(run())
+    assert agent_metrics.node_seconds.count("parse_user_order") == before + 1
+    parse = record.nodes["parse_user_order"]
+    assert parse.llm_calls == 1
+    assert 0.01 <= parse.model_seconds <= parse.seconds
+    assert parse.prompt_tokens > 0 and parse.completion_tokens > 0
+    assert record.nodes["checkpoint"].db_seconds > 0
+    assert record.nodes["get_data"].cache_hits > 0
+    assert "parse_user_order=" in record.summary()
+
+
+def test_render_includes_all_metrics():
+    metrics = AgentMetrics(log_turns=False)
+    metrics.observe_llm("solve_buy", 0.2, 100, 20)
+    metrics.record_cache("menu", True)
+    text = metrics.render()
+    assert "# TYPE agent_node_seconds histogram" in text
+    assert 'agent_llm_prompt_tokens_total{node="solve_buy"} 100' in text
+    assert 'agent_cache_requests_total{cache="menu",result="hit"} 1' in text
+
+
+def test_cancelled_llm_runs_expire():
+    metrics = AgentMetrics(log_turns=False)
+    handler = metrics.callback_handler
+    handler.stale_seconds = 0.05
+    gateway = LLMGateway(call_timeout=0.05)
+    config = {"callbacks": [handler]}
+
+    async def run():
+        # Quá deadline: lần gọi bị huỷ, không có on_llm_end / on_llm_error
+        with pytest.raises(LLMUnavailable):
+            await gateway.wrap(FakeChatModel(first_token_latency=1)).ainvoke("xin chào", config)
+        assert len(handler._runs) == 1
+        await asyncio.sleep(0.05)
+        await gateway.wrap(FakeChatModel()).ainvoke("xin chào", config)
+
+    asyncio.run(run())
+    assert handler._runs == {} and handler.expired == 1
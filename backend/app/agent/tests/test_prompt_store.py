@@ -0,0 +1,53 @@
+from menu_cache import MAX_RETAINED_VERSIONS, MenuSnapshot
+from prompt_store import PromptStore, approx_tokens
+from schema import Item
+
+
+def make_menu(version):
+    return MenuSnapshot(
+        version,
+        [
+            Item(id=1, title="Cơm sườn", price=35000, category=["main_dish"], flavour=[]),
+            Item(id=2, title="Phở bò", price=45000, discount=0.1, category=[], flavour=[]),
+        ],
+    )
+
+
+def test_render_once_per_version():
+    store = PromptStore()
+    menu = make_menu(0)
+    first = store.get(menu)
+    assert store.get(make_menu(0)) is first
+    assert store.renders == 1
+
+    assert "- ID 1: Cơm sườn" in first.items_str
+    assert "Phở bò" in first.discount_items_str
+    assert "Cơm sườn" not in first.discount_items_str
+    assert first.items_str in first.order_system_prompt
+    assert first.all_items_str in first.system_prompt
+
+    second = store.get(make_menu(1))
+    assert second is not first
+    assert store.renders == 2
+
+
+def test_old_versions_evicted():
+    store = PromptStore(max_versions=2)
+    for version in range(4):
+        store.get(make_menu(version))
+    assert store.stats()["cached_versions"] == [2, 3]
+
+
+def test_keeps_every_retained_menu_version():
+    store = PromptStore()
+    for version in range(MAX_RETAINED_VERSIONS):
+        store.get(make_menu(version))
+    assert store.stats()["cached_versions"] == list(range(MAX_RETAINED_VERSIONS))
+
+
+def test_sizes():
+    artifacts = PromptStore().get(make_menu(0))
+    sizes = artifacts.sizes()
+    assert sizes["system_prompt"]["chars"] == len(artifacts.system_prompt)
+    assert sizes["items_str"]["tokens"] == approx_tokens(artifacts.items_str)
+    assert approx_tokens("abcde") == 2
@@ -0,0 +1,97 @@
+import asyncio
+import random
+from langgraph.checkpoint.memory import MemorySaver
+import nodes
+from fake_llm import ITEMS, install_stub_llm, run_session
+from graph import build_graph
+from menu_cache import MenuSnapshot
+from response_templates import ResponseTemplates, cart_total, suggest_items
+from schema import OrderLine, UserIntent
+
+MENU = MenuSnapshot(1, ITEMS)
+LINE = {"item_id": 1, "title": "Cơm sườn", "price": 35000, "quantity": 2, "discount": None}
+
+
+def test_buy_mentions_item_and_total():
+    templates = ResponseTemplates(random.Random(0))
+    cart = [LINE, {**LINE, "item_id": 2, "price": 45000, "quantity": 1, "discount": 10}]
+    assert cart_total(cart) == 70000 + 40500
+    text = templates.buy(cart, cart, [])
+    assert "2 Cơm sườn và 1 Cơm sườn" in text
+    assert "110,500đ" in text
+
+
+def test_phrasings_vary():
+    templates = ResponseTemplates(random.Random(1))
+    texts = {templates.buy([LINE], [LINE], ["Phở bò"]) for _ in range(30)}
+    assert len(texts) > 3
+
+
+def test_suggestions_skip_items_in_cart():
+    assert suggest_items(MENU, []) == ["Phở bò"]
+    # Món giảm giá đã có trong giỏ: gợi ý các món khác
+    assert suggest_items(MENU, [{**LINE, "item_id": 2}]) == ["Cơm sườn", "Trà đá"]
+    assert "Phở bò" in ResponseTemplates(random.Random(0)).unclear(["Phở bò"])
+
+
+def test_template_mode_streams_reply_without_llm_call():
+    install_stub_llm(0, solve_mode="template")
+    graph = build_graph(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "templates"}}
+    asyncio.run(run_session(graph, "templates", turns=0))
+
+    async def order():
+        await graph.aupdate_state(config, {"pending_user_input": "1 cơm sườn"})
+        return [
+            chunk
+            async for mode, chunk in graph.astream(
+                None, config=config, stream_mode=["messages", "custom"]
+            )
+            if mode == "custom"
+        ]
+
+    custom = asyncio.run(order())
+    state = asyncio.run(graph.aget_state(config))
+    reply = state.values["messages"][-1]
+    assert custom == [{"content": reply.content}]
+    assert "Cơm sườn" in reply.content
+
+
+def test_multi_item_order_in_one_turn():
+    install_stub_llm(0, solve_mode="template")
+    nodes.FAST_INTENT_ENABLED = True
+    graph = build_graph(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "multi"}}
+    asyncio.run(run_session(graph, "multi", turns=0))
+
+    async def order(text):
+        await graph.aupdate_state(config, {"pending_user_input": text})
+        await graph.ainvoke(None, config=config)
+        return (await graph.aget_state(config)).values
+
+    asyncio.run(order("2 phở bò, 1 trà đá nhé"))
+    values = asyncio.run(order("thêm 1 phở bò"))
+    cart = [(line["title"], line["quantity"]) for line in values["current_cart"]]
+    assert cart == [("Phở bò", 3), ("Trà đá", 1)]
+    assert "1 Phở bò" in values["messages"][-1].content
+
+
+def test_unknown_items_are_skipped():
+    parsed = UserIntent(
+        intent="BUY",
+        items=[
+            OrderLine(item_id=2, quantity=1),
+            OrderLine(item_id=99, quantity=1),
+            OrderLine(item_id=3),
+            OrderLine(item_id=2, quantity=2),
+        ],
+    )
+    update = nodes.apply_intent(parsed, MENU)
+    assert update["user_intent"] == "BUY"
+    assert [(line["item_id"], line["quantity"]) for line in update["current_cart"]] == [(2, 3)]
+    assert update["skipped_items"] == 2
+    text = ResponseTemplates(random.Random(0)).buy(update["added_items"], [], [], 2)
+    assert "2 món" in text
+
+    update = nodes.apply_intent(UserIntent(intent="BUY", items=[]), MENU)
+    assert update["user_intent"] == "UNCLEAR"
@@ -0,0 +1,80 @@
+import asyncio
+import time
+import pytest
+from sqlalchemy import create_engine, text
+import data
+from menu_cache import menu_cache
+from metrics import AgentMetrics
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY, full_name TEXT, email TEXT)'))
+        conn.execute(
+            text(
+                "CREATE TABLE item (id INTEGER PRIMARY KEY, title TEXT, price INTEGER, "
+                "discount REAL, category TEXT, flavour TEXT, is_active BOOLEAN)"
+            )
+        )
+        conn.execute(
+            text(
+                'INSERT INTO "user" VALUES '
+                "(1, 'Nguyễn An', 'an@example.com'), (2, NULL, 'binh@example.com')"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO item VALUES (1, 'Cơm sườn', 35000, NULL, '{}', '{}', 1), "
+                "(2, 'Phở bò', 45000, 0.1, '{}', '{}', 1), (3, 'Bún chả', 40000, 0.2, '{}', '{}', 0)"
+            )
+        )
+    monkeypatch.setattr(data, "engine", engine)
+    menu_cache.bump()
+    yield engine
+    # Các test khác dùng menu mẫu của benchmark
+    menu_cache.bump()
+
+
+def test_user_name_in_one_query(sqlite_db):
+    assert data.get_user_name(1) == "Nguyễn An"
+    assert data.get_user_name(2) == "binh"
+    assert data.get_user_name(99) == "Bạn"
+
+
+def test_discounts_are_derived_from_menu(sqlite_db):
+    assert [item.title for item in data.get_discount_items()] == ["Phở bò"]
+    # Lần sau lấy từ menu đã cache, không query lại
+    misses = menu_cache.misses
+    data.get_discount_items()
+    assert menu_cache.misses == misses
+
+
+def test_session_data_fetched_concurrently(sqlite_db, monkeypatch):
+    metrics = AgentMetrics(log_turns=False)
+    monkeypatch.setattr(data, "agent_metrics", metrics)
+    get_user_name = data.get_user_name
+    get_all_items = data.get_all_items
+
+    def slow(func):
+        def call(*args):
+            time.sleep(0.2)
+            return func(*args)
+
+        return call
+
+    monkeypatch.setattr(data, "get_user_name", slow(get_user_name))
+    monkeypatch.setattr(data, "get_all_items", slow(get_all_items))
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await data.aget_session_data(1)
+        return result, loop.time() - started
+
+    (menu, user_name), elapsed = asyncio.run(run())
+    assert user_name == "Nguyễn An" and len(menu) == 2
+    assert elapsed < 0.35
+    assert metrics.db_seconds.count("-", "menu") == 1
+    assert metrics.db_seconds.count("-", "user_name") == 1
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.memory import MemorySaver
+import nodes
+from fake_llm import TURN_REPLY, install_stub_llm, run_session
+from graph import build_graph
+
+
+async def order(graph, config, text):
+    """Một lượt: trả về các chunk của stream "custom" và state sau lượt"""
+    await graph.aupdate_state(config, {"pending_user_input": text})
+    custom = [
+        chunk
+        async for mode, chunk in graph.astream(
+            None, config=config, stream_mode=["messages", "custom"]
+        )
+        if mode == "custom"
+    ]
+    return custom, (await graph.aget_state(config)).values
+
+
+def start(thread_id):
+    install_stub_llm(0)
+    graph = build_graph(checkpointer=MemorySaver(), mode="single_call")
+    asyncio.run(run_session(graph, thread_id, turns=0))
+    return graph, {"configurable": {"thread_id": thread_id}}
+
+
+def test_reply_streams_and_cart_updates():
+    graph, config = start("single")
+    custom, values = asyncio.run(order(graph, config, "cho mình một phần cơm sườn"))
+    # Reply được stream thành nhiều chunk, ghép lại đúng bằng câu trả lời đã lưu
+    assert len(custom) > 1
+    assert "".join(chunk["content"] for chunk in custom) == TURN_REPLY
+    assert values["messages"][-1].content == TURN_REPLY
+    assert values["user_intent"] == "BUY"
+    assert [line["item_id"] for line in values["current_cart"]] == [1]
+
+
+def test_invalid_buy_sends_correction():
+    graph, config = start("single-invalid")
+
+    async def unknown_item(messages):
+        yield {"intent": "BUY", "items": [{"item_id": 99, "quantity": 1}], "reply": "Đã thêm!"}
+
+    nodes.turn_llm = RunnableLambda(unknown_item)
+    custom, values = asyncio.run(order(graph, config, "cho mình món gì đó"))
+    assert custom[0] == {"content": "Đã thêm!"}
+    assert len(custom) == 2
+    assert values["user_intent"] == "UNCLEAR"
+    assert values["messages"][-1].content.startswith("Đã thêm!\n\n")
+    assert not values["current_cart"]
+
+
+def test_not_buy_ends_conversation():
+    graph, config = start("single-bye")
+
+    async def bye(messages):
+        yield {"intent": "NOT_BUY", "items": [], "reply": "Tạm biệt!"}
+
+    nodes.turn_llm = RunnableLambda(bye)
+    _, values = asyncio.run(order(graph, config, "thôi không mua nữa"))
+    assert values["messages"][-1].content == "Tạm biệt!"
+    assert not asyncio.run(graph.aget_state(config)).next
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        build_graph(checkpointer=MemorySaver(), mode="three_call")
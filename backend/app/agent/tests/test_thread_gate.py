@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from fake_llm import install_stub_llm, run_session
+from graph import build_graph
+from thread_gate import ThreadBusy, ThreadGate
+
+CONFIG = {"configurable": {"thread_id": "stress"}}
+
+
+async def send(graph, gate, text):
+    """Giống chat_message: giữ lượt của thread rồi inject input và resume graph"""
+    try:
+        async with gate.turn("stress", text) as message:
+            if message is None:
+                return "coalesced"
+            await graph.aupdate_state(CONFIG, {"pending_user_input": message})
+            await graph.ainvoke(None, config=CONFIG)
+            return "done"
+    except ThreadBusy:
+        return "rejected"
+
+
+async def stress(policy, messages=10, max_pending=20):
+    install_stub_llm(0.02)
+    graph = build_graph(checkpointer=MemorySaver())
+    await run_session(graph, "stress", turns=0)
+    gate = ThreadGate(policy, max_pending=max_pending)
+    results = await asyncio.gather(
+        *(send(graph, gate, f"{i + 1} cơm sườn") for i in range(messages))
+    )
+    state = await graph.aget_state(CONFIG)
+    return results, state.values, gate
+
+
+def test_queue_runs_every_message_once_in_order():
+    results, values, gate = asyncio.run(stress("queue"))
+    assert results == ["done"] * 10
+    assert values["current_cart"][0]["quantity"] == 10
+    user_messages = [m.content for m in values["messages"] if m.type == "human"][1:]
+    assert user_messages == [f"{i + 1} cơm sườn" for i in range(10)]
+    assert gate.stats()["queued"] == 9
+
+
+def test_queue_rejects_beyond_max_pending():
+    results, values, _ = asyncio.run(stress("queue", max_pending=3))
+    assert results.count("done") == 4
+    assert results.count("rejected") == 6
+    assert values["current_cart"][0]["quantity"] == 4
+
+
+def test_coalesce_merges_waiting_messages():
+    results, values, gate = asyncio.run(stress("coalesce"))
+    # Lượt đầu chạy ngay, 9 message còn lại gộp vào một lượt
+    assert results.count("done") == 2
+    assert results.count("coalesced") == 8
+    merged = [m.content for m in values["messages"] if m.type == "human"][-1]
+    assert merged.splitlines() == [f"{i + 1} cơm sườn" for i in range(1, 10)]
+
+
+def test_coalesced_messages_survive_cancelled_leader():
+    gate = ThreadGate("coalesce")
+
+    async def run():
+        holder = await gate.acquire("t", "a")
+        leader = asyncio.ensure_future(gate.acquire("t", "b"))
+        await asyncio.sleep(0)
+        follower = await gate.acquire("t", "c")
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        holder.release()
+        async with gate.turn("t", "d") as message:
+            return follower.message, message
+
+    assert asyncio.run(run()) == (None, "c\nd")
+
+
+def test_reject_when_busy():
+    results, values, gate = asyncio.run(stress("reject"))
+    assert results.count("done") == 1
+    assert gate.stats()["rejected"] == 9
+
+
+def test_idle_locks_are_evicted():
+    gate = ThreadGate(idle_seconds=0)
+
+    async def run():
+        for i in range(5):
+            async with gate.turn(f"t{i}", "hi"):
+                pass
+        await asyncio.sleep(0.01)
+        async with gate.turn("last", "hi"):
+            pass
+
+    asyncio.run(run())
+    assert gate.stats()["threads"] == 1
+    assert gate.stats()["evicted"] == 5
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ThreadGate("drop")
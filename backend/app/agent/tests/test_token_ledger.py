@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from sqlalchemy import create_engine, func, select
+import nodes
+from fake_llm import install_stub_llm, run_session, track_model_time
+from graph import build_graph
+from token_ledger import DAY_SECONDS, TokenLedger, token_ledger, token_usage_table
+
+NOW = 1_700_000_000.0
+
+
+def sqlite_ledger(tmp_path, **kwargs) -> TokenLedger:
+    ledger = TokenLedger(create_engine(f"sqlite:///{tmp_path / 'ledger.db'}"), **kwargs)
+    ledger.setup()
+    return ledger
+
+
+def stored_rows(ledger: TokenLedger) -> int:
+    with ledger.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(token_usage_table)).scalar_one()
+
+
+def test_rows_are_written_in_batches(tmp_path):
+    ledger = sqlite_ledger(tmp_path, batch_size=3)
+    for _ in range(2):
+        ledger.record("greet_user", 100, 20, thread_id="t", user_id=1)
+    assert stored_rows(ledger) == 0
+    # Đủ lô (ngoài event loop thì ghi ngay)
+    ledger.record("solve_buy", 50, 10, thread_id="t", user_id=1)
+    assert stored_rows(ledger) == 3
+    ledger.record("solve_buy", 50, 10, thread_id="t", user_id=1)
+    assert ledger.flush() == 1 and stored_rows(ledger) == 4
+
+
+def test_totals_are_loaded_from_database(tmp_path):
+    ledger = sqlite_ledger(tmp_path)
+    ledger.record("greet_user", 100, 20, thread_id="t", user_id=1, now=NOW - DAY_SECONDS)
+    ledger.record("solve_buy", 50, 10, thread_id="t", user_id=1, now=NOW)
+    ledger.record("solve_buy", 30, 0, thread_id="other", user_id=1, now=NOW)
+    ledger.flush()
+
+    # Ledger mới (worker khác / sau restart) đọc lại tổng từ database
+    ledger = sqlite_ledger(tmp_path)
+    assert asyncio.run(ledger.conversation_tokens("t")) == 180
+    # Hội thoại mới trên cùng thread chỉ tính từ lúc bắt đầu
+    assert asyncio.run(ledger.conversation_tokens("t", since=NOW)) == 60
+    # Theo ngày (UTC): bỏ qua lượt gọi của hôm qua
+    assert asyncio.run(ledger.user_daily_tokens(1, now=NOW)) == 90
+
+    # Các lượt gọi sau đó được cộng thẳng vào tổng đang giữ
+    ledger.record("solve_buy", 5, 5, thread_id="t", user_id=1, now=NOW)
+    assert asyncio.run(ledger.conversation_tokens("t", since=NOW)) == 70
+    assert asyncio.run(ledger.user_daily_tokens(1, now=NOW)) == 100
+
+
+def test_tracked_totals_are_bounded(tmp_path):
+    ledger = sqlite_ledger(tmp_path, max_tracked=2)
+    for thread_id in ("a", "b", "c"):
+        ledger.record("solve_buy", 10, 0, thread_id=thread_id, now=NOW)
+    ledger.flush()
+    for thread_id in ("a", "b", "c"):
+        asyncio.run(ledger.conversation_tokens(thread_id))
+    # Chỉ giữ 2 tổng dùng gần nhất; tổng bị bỏ được đọc lại từ database
+    assert ledger.stats()["tracked_threads"] == 2
+    assert asyncio.run(ledger.conversation_tokens("a")) == 10
+
+
+def test_over_budget(tmp_path):
+    ledger = sqlite_ledger(tmp_path, conversation_budget=100, user_daily_budget=150)
+    ledger.record("greet_user", 80, 10, thread_id="a", user_id=1)
+    assert asyncio.run(ledger.over_budget("a", 1)) is None
+    ledger.record("solve_buy", 10, 0, thread_id="a", user_id=1)
+    assert asyncio.run(ledger.over_budget("a", 1)) == "conversation"
+    ledger.record("greet_user", 60, 0, thread_id="b", user_id=1)
+    assert asyncio.run(ledger.over_budget("b", 1)) == "user_daily"
+    assert asyncio.run(ledger.over_budget("b", 2)) is None
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    """Một lần gọi model là hết giới hạn token của hội thoại"""
+    monkeypatch.setattr(token_ledger, "conversation_budget", 1)
+
+
+def run_turn(graph, config, text):
+    async def turn():
+        with track_model_time() as clock:
+            await graph.aupdate_state(config, {"pending_user_input": text})
+            async for _ in graph.astream(None, config=config, stream_mode="messages"):
+                pass
+        return clock.calls, (await graph.aget_state(config)).values
+
+    return asyncio.run(turn())
+
+
+@pytest.mark.parametrize("mode", ["two_call", "single_call"])
+def test_over_budget_replies_from_templates(small_budget, mode):
+    install_stub_llm(0, solve_mode="llm")
+    graph = build_graph(checkpointer=MemorySaver(), mode=mode)
+    asyncio.run(run_session(graph, f"budget-{mode}", turns=0))
+    config = {"configurable": {"thread_id": f"budget-{mode}"}}
+    # Lời chào lấy từ cache / template, không tốn token của hội thoại
+    token_ledger.record("greet_user", 1, 0, thread_id=f"budget-{mode}")
+
+    # Parser cục bộ vẫn xử lý được đơn đặt món, không gọi model
+    calls, values = run_turn(graph, config, "2 cơm sườn")
+    assert calls == 0
+    assert values["user_intent"] == "BUY" and values["current_cart"][0]["quantity"] == 2
+
+    calls, values = run_turn(graph, config, "món nào ngon nhất vậy?")
+    assert calls == 0 and values["user_intent"] == "UNCLEAR"
+
+
+@pytest.mark.parametrize("mode", ["two_call", "single_call"])
+def test_over_budget_ends_conversation(small_budget, monkeypatch, mode):
+    monkeypatch.setattr(nodes, "TOKEN_BUDGET_ACTION", "end")
+    install_stub_llm(0, solve_mode="llm")
+    graph = build_graph(checkpointer=MemorySaver(), mode=mode)
+    asyncio.run(run_session(graph, f"budget-end-{mode}", turns=1))
+    config = {"configurable": {"thread_id": f"budget-end-{mode}"}}
+
+    calls, values = run_turn(graph, config, "món nào ngon nhất vậy?")
+    assert calls == 0
+    assert values["user_intent"] == "NOT_BUY"
+    assert "giỏ hàng" in values["messages"][-1].content
+    assert (asyncio.run(graph.aget_state(config))).next == ()
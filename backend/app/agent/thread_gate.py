@@ -0,0 +1,186 @@
+"""
+Tuần tự hoá các lượt chat trên cùng một thread.
+
+Hai request cùng thread_id (bấm gửi hai lần, client retry) nếu chạy song song
+sẽ ghi đè pending_user_input của nhau hoặc resume graph hai lần. ThreadGate
+đảm bảo mỗi thread chỉ có một lượt chạy tại một thời điểm, các input đến sau
+được xử lý theo policy:
+
+- "queue": xếp hàng FIFO, mỗi input là một lượt riêng
+- "coalesce": các input đang chờ được gộp thành một lượt
+- "reject": thread đang bận thì từ chối (API trả về 409)
+
+Số input chờ mỗi thread bị giới hạn bởi max_pending; vượt quá thì từ chối.
+Lock của các thread không hoạt động quá idle_seconds được dọn khỏi registry.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from config import (
+    THREAD_QUEUE_POLICY,
+    THREAD_QUEUE_MAX_PENDING,
+    THREAD_LOCK_IDLE_SECONDS,
+)
+
+POLICIES = ("queue", "coalesce", "reject")
+
+
+class ThreadBusy(Exception):
+    """Thread đang có lượt chạy và không nhận thêm input"""
+
+
+class _ThreadSlot:
+    __slots__ = ("lock", "waiting", "batch", "carry", "last_used")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiting = 0  # số request đang chờ lock
+        self.batch: list[str] | None = None  # input đang chờ gộp (coalesce)
+        self.carry: list[str] = []  # input đã gộp nhưng request dẫn lượt bị huỷ
+        self.last_used = time.monotonic()
+
+    def idle(self) -> bool:
+        return not self.lock.locked() and not self.waiting
+
+
+class Ticket:
+    """Quyền chạy một lượt trên thread, release() gọi nhiều lần cũng được"""
+
+    __slots__ = ("message", "_slot")
+
+    def __init__(self, message: str | None, slot: "_ThreadSlot | None"):
+        self.message = message
+        self._slot = slot
+
+    def release(self) -> None:
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            slot.last_used = time.monotonic()
+            slot.lock.release()
+
+
+class ThreadGate:
+    def __init__(
+        self, policy: str = "queue", max_pending: int = 4, idle_seconds: float = 600
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown thread queue policy: {policy}")
+        self.policy = policy
+        self.max_pending = max_pending
+        self.idle_seconds = idle_seconds
+        self._slots: dict[str, _ThreadSlot] = {}
+        self._last_sweep = time.monotonic()
+        self.turns = 0
+        self.queued = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    async def acquire(self, thread_id: str, message: str | None = None) -> "Ticket":
+        """
+        Chờ tới lượt của thread. Ticket.message là input cần chạy (có thể là
+        nhiều input đã gộp), hoặc None khi input này đã được gộp vào lượt của
+        một request khác (coalesce). message=None (lượt mở đầu hội thoại)
+        không bao giờ bị gộp. Raise ThreadBusy nếu bị từ chối.
+
+        Nếu request dẫn lượt bị huỷ khi đang chờ, các input đã gộp vào lượt
+        của nó được chạy kèm lượt kế tiếp của thread.
+        """
+        self._sweep()
+        slot = self._slots.get(thread_id)
+        if slot is None:
+            slot = self._slots[thread_id] = _ThreadSlot()
+        slot.last_used = time.monotonic()
+
+        busy = slot.lock.locked() or slot.waiting > 0
+        if busy and self.policy == "reject":
+            self.rejected += 1
+            raise ThreadBusy(thread_id)
+
+        leader = False
+        if busy and self.policy == "coalesce" and message is not None:
+            if slot.batch is not None:
+                if len(slot.batch) >= self.max_pending:
+                    self.rejected += 1
+                    raise ThreadBusy(thread_id)
+                # Đã có request đang chờ: gửi kèm input vào lượt của request đó
+                slot.batch.append(message)
+                self.coalesced += 1
+                return Ticket(None, None)
+            slot.batch = [message]
+            leader = True
+
+        if busy:
+            if slot.waiting >= self.max_pending:
+                self.rejected += 1
+                raise ThreadBusy(thread_id)
+            self.queued += 1
+
+        slot.waiting += 1
+        try:
+            await slot.lock.acquire()
+        except BaseException:
+            if leader:
+                # Bỏ input của chính request bị huỷ, giữ lại input đã gộp vào
+                slot.carry.extend(slot.batch[1:])
+                slot.batch = None
+            raise
+        finally:
+            slot.waiting -= 1
+
+        if leader:
+            message = "\n".join(slot.batch)
+            slot.batch = None
+        if message is None:
+            # Lượt mở đầu / xoá hội thoại: input cũ không còn ý nghĩa
+            slot.carry.clear()
+        elif slot.carry:
+            message = "\n".join([*slot.carry, message])
+            slot.carry.clear()
+        self.turns += 1
+        return Ticket(message, slot)
+
+    @asynccontextmanager
+    async def turn(
+        self, thread_id: str, message: str | None = None
+    ) -> AsyncIterator[str | None]:
+        """acquire() + release() trong một khối `async with`"""
+        ticket = await self.acquire(thread_id, message)
+        try:
+            yield ticket.message
+        finally:
+            ticket.release()
+
+    def _sweep(self) -> None:
+        """Bỏ lock của các thread rảnh quá idle_seconds (chạy tối đa mỗi idle_seconds)"""
+        now = time.monotonic()
+        if now - self._last_sweep < self.idle_seconds:
+            return
+        self._last_sweep = now
+        stale = [
+            thread_id
+            for thread_id, slot in self._slots.items()
+            if slot.idle() and now - slot.last_used > self.idle_seconds
+        ]
+        for thread_id in stale:
+            del self._slots[thread_id]
+        self.evicted += len(stale)
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "threads": len(self._slots),
+            "busy_threads": sum(not slot.idle() for slot in self._slots.values()),
+            "turns": self.turns,
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
+
+
+thread_gate = ThreadGate(
+    THREAD_QUEUE_POLICY, THREAD_QUEUE_MAX_PENDING, THREAD_LOCK_IDLE_SECONDS
+)
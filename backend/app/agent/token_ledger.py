@@ -0,0 +1,305 @@
+"""
+Sổ ghi token LLM theo hội thoại (thread_id) và theo user, kèm giới hạn token.
+
+- Mỗi lần gọi chat model (LLMMetricsHandler trong metrics.py) ghi một dòng
+  (thread_id, user_id, node, prompt_tokens, completion_tokens) vào bộ đệm;
+  bộ đệm được ghi xuống database theo lô (đủ batch_size dòng, hoặc định kỳ
+  bằng start_flush_task)
+- Tổng token của một hội thoại (từ lúc bắt đầu hội thoại) và của một user
+  trong ngày (UTC) được giữ trong bộ nhớ (tối đa max_tracked tổng, bỏ tổng
+  dùng lâu nhất), lần đầu cần thì lấy tổng từ database
+- over_budget() cho các node biết đã vượt giới hạn chưa, để chuyển sang trả
+  lời bằng template / kết thúc hội thoại thay vì tiếp tục gọi model
+
+Bảng agent_token_usage được tạo bằng migration alembic (backend/alembic/versions),
+setup() chỉ dùng cho SQLite (test).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    select,
+)
+from sqlalchemy.engine import Engine
+from metrics import agent_metrics
+from db_pool import get_engine
+from config import (
+    DB_POOL_OPTIONS,
+    TOKEN_BUDGET_CONVERSATION,
+    TOKEN_BUDGET_USER_DAILY,
+    TOKEN_LEDGER_BACKEND,
+    TOKEN_LEDGER_BATCH_SIZE,
+    TOKEN_LEDGER_DB_URL,
+    TOKEN_LEDGER_MAX_TRACKED,
+)
+
+DAY_SECONDS = 24 * 60 * 60
+
+metadata_obj = MetaData()
+
+token_usage_table = Table(
+    "agent_token_usage",
+    metadata_obj,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("thread_id", String, nullable=True, index=True),
+    Column("user_id", Integer, nullable=True, index=True),
+    Column("node", String, nullable=False),
+    Column("prompt_tokens", Integer, nullable=False, default=0),
+    Column("completion_tokens", Integer, nullable=False, default=0),
+    Column("created_at", Float, nullable=False, index=True),
+)
+
+
+def day_start(now: float) -> float:
+    """Đầu ngày (UTC) chứa thời điểm now"""
+    return now - now % DAY_SECONDS
+
+
+class TokenLedger:
+    """
+    Args:
+        engine: engine SQLAlchemy để lưu các dòng token (None: chỉ giữ trong bộ nhớ)
+        conversation_budget: số token tối đa của một hội thoại (0: không giới hạn)
+        user_daily_budget: số token tối đa của một user trong ngày (0: không giới hạn)
+        batch_size: số dòng trong bộ đệm thì ghi xuống database
+        max_tracked: số tổng (thread / user) tối đa giữ trong bộ nhớ; tổng bị
+            bỏ được lấy lại từ database khi cần
+    """
+
+    def __init__(
+        self,
+        engine: Engine | None = None,
+        *,
+        conversation_budget: int = 0,
+        user_daily_budget: int = 0,
+        batch_size: int = 50,
+        max_tracked: int = 10000,
+    ):
+        self.engine = engine
+        self.conversation_budget = conversation_budget
+        self.user_daily_budget = user_daily_budget
+        self.batch_size = max(1, batch_size)
+        self.max_tracked = max_tracked
+        self._pending: list[dict] = []
+        # ("thread", thread_id) / ("user", user_id) -> [tính từ thời điểm, tổng token] (LRU)
+        self._totals: OrderedDict[tuple, list] = OrderedDict()
+        self._lock = threading.Lock()
+        # Giữ trong lúc ghi một lô, để query tổng chờ các lô đang ghi dở
+        self._write_lock = threading.Lock()
+        self._flush_task: asyncio.Task | None = None
+        # Các lần ghi lô đang chạy (giữ reference để task không bị thu hồi)
+        self._batch_tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "TokenLedger":
+        return cls(get_engine(url, **DB_POOL_OPTIONS), **kwargs)
+
+    def setup(self) -> None:
+        """Tạo bảng nếu chưa có (test / SQLite; Postgres dùng migration alembic)"""
+        if self.engine is not None:
+            metadata_obj.create_all(self.engine)
+
+    # --- Ghi ---
+
+    def record(
+        self,
+        node: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        thread_id: str | None = None,
+        user_id: int | None = None,
+        now: float | None = None,
+    ) -> None:
+        """Ghi một lần gọi model vào bộ đệm và cộng vào các tổng đang theo dõi"""
+        row = {
+            "thread_id": thread_id,
+            "user_id": user_id,
+            "node": node,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "created_at": time.time() if now is None else now,
+        }
+        tokens = prompt_tokens + completion_tokens
+        with self._lock:
+            for key in (("thread", thread_id), ("user", user_id)):
+                total = self._totals.get(key)
+                if key[1] is not None and total is not None and row["created_at"] >= total[0]:
+                    total[1] += tokens
+                    self._totals.move_to_end(key)
+            if self.engine is None:
+                return
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            try:
+                task = asyncio.get_running_loop().create_task(self.aflush())
+            except RuntimeError:
+                self.flush()
+            else:
+                self._batch_tasks.add(task)
+                task.add_done_callback(self._batch_tasks.discard)
+
+    def on_usage(self, node: str, prompt_tokens: int, completion_tokens: int, metadata: dict):
+        """Listener của agent_metrics: mỗi lần gọi chat model xong"""
+        self.record(
+            node,
+            prompt_tokens,
+            completion_tokens,
+            thread_id=metadata.get("thread_id"),
+            user_id=metadata.get("user_id"),
+        )
+
+    def flush(self) -> int:
+        """Ghi các dòng trong bộ đệm xuống database, trả về số dòng đã ghi"""
+        if self.engine is None:
+            return 0
+        with self._write_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(insert(token_usage_table), rows)
+            except Exception:
+                # Giữ lại để lần sau ghi tiếp, nhưng không để bộ đệm phình mãi
+                with self._lock:
+                    self._pending = (rows + self._pending)[-self.batch_size * 20 :]
+                raise
+        return len(rows)
+
+    async def aflush(self) -> int:
+        if not self._pending:
+            return 0
+        try:
+            with agent_metrics.db_timer("token_usage"):
+                return await asyncio.to_thread(self.flush)
+        except Exception as e:
+            print(f"[TokenLedger] Flush failed: {e}")
+            return 0
+
+    def start_flush_task(self, interval: float) -> asyncio.Task:
+        """Chạy aflush() mỗi `interval` giây trên event loop hiện tại (chỉ tạo một lần)"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._flush_loop(interval)
+            )
+        return self._flush_task
+
+    async def _flush_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.aflush()
+
+    # --- Đọc ---
+
+    def _query_total(self, column, value, since: float) -> int:
+        if self.engine is None:
+            return 0
+        query = select(
+            func.coalesce(
+                func.sum(
+                    token_usage_table.c.prompt_tokens + token_usage_table.c.completion_tokens
+                ),
+                0,
+            )
+        ).where(column == value, token_usage_table.c.created_at >= since)
+        # Chờ các lô đang ghi dở để tổng không thiếu
+        with self._write_lock, self.engine.connect() as conn:
+            return int(conn.execute(query).scalar_one())
+
+    async def _total(self, kind: str, value, since: float) -> int:
+        key = (kind, value)
+        with self._lock:
+            total = self._totals.get(key)
+            if total is not None and total[0] == since:
+                self._totals.move_to_end(key)
+                return total[1]
+        # Lần đầu (hoặc sang hội thoại / ngày mới): lấy tổng từ database. Ghi
+        # bộ đệm xuống trước để tổng không thiếu các lượt gọi chưa flush
+        column = token_usage_table.c.thread_id if kind == "thread" else token_usage_table.c.user_id
+        value_in_db = 0
+        if self.engine is not None:
+            await self.aflush()
+            with agent_metrics.db_timer("token_usage"):
+                value_in_db = await asyncio.to_thread(self._query_total, column, value, since)
+        with self._lock:
+            self._totals[key] = [since, value_in_db]
+            self._totals.move_to_end(key)
+            while len(self._totals) > self.max_tracked:
+                self._totals.popitem(last=False)
+        return value_in_db
+
+    async def conversation_tokens(self, thread_id: str, since: float = 0) -> int:
+        """Tổng token của thread tính từ lúc bắt đầu hội thoại (since)"""
+        return await self._total("thread", thread_id, since)
+
+    async def user_daily_tokens(self, user_id: int, now: float | None = None) -> int:
+        """Tổng token của user từ đầu ngày (UTC)"""
+        return await self._total("user", user_id, day_start(time.time() if now is None else now))
+
+    async def over_budget(
+        self,
+        thread_id: str | None,
+        user_id: int | None = None,
+        since: float = 0,
+    ) -> str | None:
+        """Giới hạn đã vượt: "conversation", "user_daily" hoặc None"""
+        if (
+            self.conversation_budget
+            and thread_id is not None
+            and await self.conversation_tokens(thread_id, since) >= self.conversation_budget
+        ):
+            return "conversation"
+        if (
+            self.user_daily_budget
+            and user_id is not None
+            and await self.user_daily_tokens(user_id) >= self.user_daily_budget
+        ):
+            return "user_daily"
+        return None
+
+    def forget(self, thread_id: str) -> None:
+        """Bỏ tổng đang giữ của thread (thread đã bị xoá)"""
+        with self._lock:
+            self._totals.pop(("thread", thread_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_rows": len(self._pending),
+                "tracked_threads": sum(1 for kind, _ in self._totals if kind == "thread"),
+                "tracked_users": sum(1 for kind, _ in self._totals if kind == "user"),
+                "conversation_budget": self.conversation_budget,
+                "user_daily_budget": self.user_daily_budget,
+            }
+
+
+def create_token_ledger() -> TokenLedger:
+    """Ledger theo config: "sql" (mặc định) lưu vào database, "memory" chỉ giữ trong bộ nhớ"""
+    kwargs = {
+        "conversation_budget": TOKEN_BUDGET_CONVERSATION,
+        "user_daily_budget": TOKEN_BUDGET_USER_DAILY,
+        "batch_size": TOKEN_LEDGER_BATCH_SIZE,
+        "max_tracked": TOKEN_LEDGER_MAX_TRACKED,
+    }
+    if TOKEN_LEDGER_BACKEND == "memory":
+        return TokenLedger(**kwargs)
+    return TokenLedger.from_url(TOKEN_LEDGER_DB_URL, **kwargs)
+
+
+token_ledger = create_token_ledger()
+agent_metrics.add_usage_listener(token_ledger.on_usage)
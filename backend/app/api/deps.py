@@ -1,3 +1,4 @@
+import secrets
 from typing import Generator, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -52,3 +53,14 @@ def get_current_active_superuser(
             status_code=400, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+def get_metrics_scraper(
+    db: Session = Depends(get_db), token: str = Depends(reusable_oauth2)
+) -> None:
+    """Metrics access: the METRICS_SCRAPE_TOKEN bearer token, or a superuser."""
+    if settings.METRICS_SCRAPE_TOKEN and secrets.compare_digest(
+        token.encode(), settings.METRICS_SCRAPE_TOKEN.encode()
+    ):
+        return
+    get_current_active_superuser(get_current_user(db, token))
@@ -1,21 +1,59 @@
-import sys
-import os
-
-# Add agent directory to path so we can import from it
-agent_dir = os.path.join(
-    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-    "agent",
-)
-sys.path.insert(0, agent_dir)
-
-from fastapi import APIRouter
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from langchain_core.messages import HumanMessage
+from datetime import datetime, timezone
+from functools import cache
+from types import SimpleNamespace
+import asyncio
 import json
 
-from app import deps, models
-from graph import build_graph
+from app import models
+from app.api import deps
+from app.core.agent_path import ensure_agent_path
+from app.db.session import engine, pool_stats
+
+
+@cache
+def agent() -> SimpleNamespace:
+    """
+    The agent stack, imported on first use instead of with the API: it pulls
+    in langgraph, langchain and the model clients, which workers that never
+    serve chat do not need (see the startup warm-up in app/core/warmup.py).
+    """
+    # Agent modules use flat imports (from schema import ...)
+    ensure_agent_path()
+    from graph import SILENT_NODES, build_graph
+    from checkpoint_store import SQLCheckpointSaver
+    from config import CHECKPOINT_CLEANUP_INTERVAL, LLM_ROUTES, TOKEN_LEDGER_FLUSH_INTERVAL
+    from prompt_store import prompt_store
+    from fast_intent import fast_intent_parser
+    from greeting_cache import greeting_cache
+    from history import history_metrics
+    from llm_gateway import LLMBusy, llm_gateway
+    from metrics import agent_metrics
+    from thread_gate import ThreadBusy, thread_gate
+    from token_ledger import token_ledger
+
+    return SimpleNamespace(
+        SILENT_NODES=SILENT_NODES,
+        build_graph=build_graph,
+        SQLCheckpointSaver=SQLCheckpointSaver,
+        CHECKPOINT_CLEANUP_INTERVAL=CHECKPOINT_CLEANUP_INTERVAL,
+        LLM_ROUTES=LLM_ROUTES,
+        TOKEN_LEDGER_FLUSH_INTERVAL=TOKEN_LEDGER_FLUSH_INTERVAL,
+        prompt_store=prompt_store,
+        fast_intent_parser=fast_intent_parser,
+        greeting_cache=greeting_cache,
+        history_metrics=history_metrics,
+        LLMBusy=LLMBusy,
+        llm_gateway=llm_gateway,
+        agent_metrics=agent_metrics,
+        ThreadBusy=ThreadBusy,
+        thread_gate=thread_gate,
+        token_ledger=token_ledger,
+    )
+
 
 router = APIRouter()
 
@@ -26,7 +64,12 @@ _graph = None
 def get_graph():
     global _graph
     if _graph is None:
-        _graph = build_graph()
+        _graph = agent().build_graph()
+    # Background task that drops expired threads from the checkpoint store
+    if isinstance(_graph.checkpointer, agent().SQLCheckpointSaver):
+        _graph.checkpointer.start_cleanup_task(agent().CHECKPOINT_CLEANUP_INTERVAL)
+    # Background task that writes buffered token usage rows to the database
+    agent().token_ledger.start_flush_task(agent().TOKEN_LEDGER_FLUSH_INTERVAL)
     return _graph
 
 
@@ -38,6 +81,29 @@ def escape_sse_content(content: str) -> str:
     return content.replace("\n", "\\n").replace("\r", "\\r")
 
 
+async def sse_events(stream):
+    """
+    Turn a graph stream (stream_mode=["messages", "custom"]) into SSE events:
+    LLM tokens from the reply nodes, plus replies that nodes send themselves
+    through the custom stream (template responses).
+    """
+    silent_nodes = agent().SILENT_NODES
+    async for mode, chunk in stream:
+        if mode == "custom":
+            content = chunk.get("content") if isinstance(chunk, dict) else None
+        else:
+            msg, metadata = chunk
+            if (
+                # Only chat model tokens (not state updates), from reply nodes
+                "ls_provider" not in metadata
+                or metadata.get("langgraph_node") in silent_nodes
+            ):
+                continue
+            content = msg.content
+        if content:
+            yield f"data: {escape_sse_content(content)}\n\n"
+
+
 class ChatRequest(BaseModel):
     message: str
     thread_id: str
@@ -49,10 +115,6 @@ class ChatResponse(BaseModel):
     thread_id: str
 
 
-from app import deps, models
-
-
-# ... imports ...
 @router.post("/message")
 async def chat_message(
     request: ChatRequest,
@@ -68,47 +130,87 @@ async def chat_message(
     with cart data so frontend can add items to localStorage cart.
     """
     graph = get_graph()
-    config = {"configurable": {"thread_id": request.thread_id}}
+    config = {
+        "configurable": {"thread_id": request.thread_id},
+        # Token usage of every LLM call is recorded per thread and per user
+        "metadata": {"user_id": current_user.id},
+    }
+
+    # One turn at a time per thread; concurrent messages are queued, coalesced
+    # or rejected depending on THREAD_QUEUE_POLICY
+    try:
+        ticket = await agent().thread_gate.acquire(
+            request.thread_id, None if request.is_first_message else request.message
+        )
+    except agent().ThreadBusy:
+        raise HTTPException(
+            status_code=409, detail="This conversation is busy with another message"
+        )
 
     async def generate():
+        try:
+            if ticket.message is None and not request.is_first_message:
+                # Merged into the turn of a concurrent request on the same thread
+                yield "data: [COALESCED]\n\n"
+                yield "data: [DONE]\n\n"
+                return
+            # Per-node timings/tokens of this turn, logged as one summary line
+            with agent().agent_metrics.turn(request.thread_id):
+                async for chunk in run_turn(ticket.message):
+                    yield chunk
+        finally:
+            ticket.release()
+
+    async def run_turn(message: str | None):
         if request.is_first_message:
             # First message: Initialize and run until interrupt (before get_user_input)
             # Pass user_id to initial state
-            async for msg, metadata in graph.astream(
-                {"user_id": current_user.id},
-                config=config,
-                stream_mode="messages",
-            ):
-                if (
-                    metadata.get("ls_provider") == "google_genai"
-                    and metadata.get("langgraph_node") != "parse_user_order"
+            try:
+                async for event in sse_events(
+                    graph.astream(
+                        {"user_id": current_user.id},
+                        config=config,
+                        stream_mode=["messages", "custom"],
+                    )
                 ):
-                    escaped = escape_sse_content(msg.content)
-                    yield f"data: {escaped}\n\n"
+                    yield event
+            except agent().LLMBusy as e:
+                # The next first message starts the conversation over
+                print(f"[Chat] {e}")
+                yield "data: [BUSY]\n\n"
+                yield "data: [DONE]\n\n"
+                return
         else:
             # Subsequent messages: Update state with user input and resume
+            before = await graph.aget_state(config)
             try:
                 # Inject user input into state and resume from where we stopped
                 # Also ensure user_id is updated in case it wasn't there (though it should be persisted)
-                graph.update_state(
+                await graph.aupdate_state(
                     config,
-                    {"pending_user_input": request.message, "user_id": current_user.id},
+                    {"pending_user_input": message, "user_id": current_user.id},
                 )
 
                 # Resume execution - this will run get_user_input (which reads pending_user_input)
                 # then parse_user_order, then solve_*, then stop before get_user_input again
-                async for msg, metadata in graph.astream(
-                    None,  # None means resume from interrupt
-                    config=config,
-                    stream_mode="messages",
+                async for event in sse_events(
+                    graph.astream(
+                        None,  # None means resume from interrupt
+                        config=config,
+                        stream_mode=["messages", "custom"],
+                    )
                 ):
-                    if (
-                        metadata.get("ls_provider") == "google_genai"
-                        and metadata.get("langgraph_node") != "parse_user_order"
-                    ):
-                        escaped = escape_sse_content(msg.content)
-                        yield f"data: {escaped}\n\n"
+                    yield event
 
+            except agent().LLMBusy as e:
+                # The model could not be called in time: put the thread back to
+                # where it was before this message so the user can simply resend it
+                print(f"[Chat] {e}")
+                if before.values:
+                    await graph.aupdate_state(before.config, None, as_node="__copy__")
+                yield "data: [BUSY]\n\n"
+                yield "data: [DONE]\n\n"
+                return
             except Exception as e:
                 print(f"[Error] Chat error: {e}")
                 yield f"data: [ERROR] {str(e)}\n\n"
@@ -116,7 +218,7 @@ async def chat_message(
 
         # Check if conversation ended (solve_not_buy was executed) and has cart items
         try:
-            state = graph.get_state(config)
+            state = await graph.aget_state(config)
             if state.values.get("user_intent") == "NOT_BUY":
                 current_cart = state.values.get("current_cart", [])
                 if current_cart and len(current_cart) > 0:
@@ -135,10 +237,183 @@ async def chat_message(
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
         },
+        # Also release if the stream is never consumed (release is idempotent)
+        background=BackgroundTask(ticket.release),
     )
 
 
 @router.post("/reset")
-async def reset_chat(thread_id: str):
-    """Reset a chat session by clearing its state."""
-    return {"status": "ok", "message": "Please use a new thread_id to start fresh."}
+async def reset_chat(
+    thread_id: str,
+    current_user: models.User = deps.Depends(deps.get_current_user),
+):
+    """Reset a chat session by deleting all of its checkpoints."""
+    graph = get_graph()
+    config = {"configurable": {"thread_id": thread_id}}
+    state = await graph.aget_state(config)
+    owner_id = state.values.get("user_id")
+    if owner_id is not None and owner_id != current_user.id and not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    try:
+        async with agent().thread_gate.turn(thread_id):
+            await graph.checkpointer.adelete_thread(thread_id)
+        agent().token_ledger.forget(thread_id)
+    except agent().ThreadBusy:
+        raise HTTPException(
+            status_code=409, detail="This conversation is busy with another message"
+        )
+    return {"status": "ok", "message": "Chat state cleared."}
+
+
+def get_sql_checkpointer():
+    checkpointer = get_graph().checkpointer
+    if not isinstance(checkpointer, agent().SQLCheckpointSaver):
+        raise HTTPException(
+            status_code=400,
+            detail="Thread management requires CHECKPOINT_BACKEND=sql",
+        )
+    return checkpointer
+
+
+@router.get("/threads")
+async def read_threads(
+    limit: int = 100,
+    offset: int = 0,
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """Live chat threads, most recently active first, with idle time and stored state size."""
+    checkpointer = get_sql_checkpointer()
+    total, threads = await asyncio.to_thread(
+        checkpointer.list_threads, limit=limit, offset=offset
+    )
+    for thread in threads:
+        thread["last_activity"] = datetime.fromtimestamp(
+            thread.pop("updated_at"), tz=timezone.utc
+        )
+        thread["created_at"] = datetime.fromtimestamp(
+            thread["created_at"], tz=timezone.utc
+        )
+    return {"total": total, "threads": threads}
+
+
+@router.post("/threads/expire")
+async def expire_threads(
+    idle_seconds: int = Query(..., ge=0),
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """Delete every thread that has been idle for longer than idle_seconds."""
+    checkpointer = get_sql_checkpointer()
+    expired = await asyncio.to_thread(checkpointer.expire_idle, idle_seconds)
+    return {"expired": expired}
+
+
+@router.get("/prompt-stats")
+def read_prompt_stats(
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """Rendered prompt sizes (chars / approx tokens) for the cached menu versions."""
+    return agent().prompt_store.stats()
+
+
+@router.get("/greeting-stats")
+def read_greeting_stats(
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """Greeting cache entries, hit/miss counters and greetings generated in the background."""
+    return agent().greeting_cache.stats()
+
+
+@router.get("/intent-stats")
+def read_intent_stats(
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """Hit/miss counters of the local intent parser (misses fall back to the LLM)."""
+    return agent().fast_intent_parser.stats()
+
+
+@router.get("/history-stats")
+def read_history_stats(
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """Tokens sent vs. full history size for each windowed history."""
+    return agent().history_metrics.stats()
+
+
+@router.get("/queue-stats")
+def read_queue_stats(
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """Per-thread turn queue counters (queued / coalesced / rejected messages)."""
+    return agent().thread_gate.stats()
+
+
+@router.get("/llm-stats")
+def read_llm_stats(
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """
+    LLM gateway state: calls in flight, queue depth, rejected / failed calls,
+    circuit breaker state and hedged requests.
+    """
+    return agent().llm_gateway.stats()
+
+
+@router.get("/llm-routes")
+def read_llm_routes(
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """
+    Model routing table (model, temperature, output limit, deadline and
+    token prices per graph node) and observed calls, average latency and
+    estimated cost per (node, model).
+    """
+    return {
+        "routes": {
+            node: route.model_dump() for node, route in sorted(agent().LLM_ROUTES.items())
+        },
+        "usage": agent().agent_metrics.route_stats(),
+    }
+
+
+@router.get("/db-pool-stats")
+def read_db_pool_stats(
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """
+    Connection pool shared by the API and the agent in this worker: size,
+    connections checked out / idle / overflow, checkouts, new connections,
+    checkout timeouts and time spent waiting for a connection.
+    """
+    return pool_stats(engine)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def read_agent_metrics(_: None = deps.Depends(deps.get_metrics_scraper)):
+    """
+    Agent metrics in Prometheus text format: per-node wall/model/DB time
+    histograms, prompt/completion token counters, cache hit counters and
+    LLM gateway queue depth / wait time. Prometheus authenticates with
+    METRICS_SCRAPE_TOKEN as its bearer token.
+    """
+    return PlainTextResponse(
+        agent().agent_metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@router.get("/token-usage")
+async def read_token_usage(
+    thread_id: str | None = None,
+    user_id: int | None = None,
+    current_user: models.User = deps.Depends(deps.get_current_active_superuser),
+):
+    """
+    Token ledger state and budgets; with thread_id / user_id, also the tokens
+    used by that conversation and by that user today.
+    """
+    usage = agent().token_ledger.stats()
+    if thread_id is not None:
+        usage["conversation_tokens"] = await agent().token_ledger.conversation_tokens(thread_id)
+    if user_id is not None:
+        usage["user_daily_tokens"] = await agent().token_ledger.user_daily_tokens(user_id)
+    return usage
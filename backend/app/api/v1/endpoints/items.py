@@ -1,4 +1,6 @@
 import os
+import threading
+import time
 import uuid
 import shutil
 from typing import Any, List, Optional
@@ -7,9 +9,51 @@ from sqlalchemy.orm import Session
 
 from app import crud, models, schemas
 from app.api import deps
+from app.core.agent_path import ensure_agent_path, loaded_agent_module
+from app.core.config import settings
+
+ensure_agent_path()
+
+# Only the stdlib-only fuzzy index is imported here; the rest of the agent
+# stack is loaded by the chat endpoints on first use
+from fuzzy_index import FuzzyIndex
 
 router = APIRouter()
 
+
+def bump_menu_version() -> None:
+    """
+    Invalidate the agent's menu cache, if the agent is loaded in this worker.
+
+    Other workers reload the menu once their snapshot is older than
+    MENU_CACHE_TTL seconds.
+    """
+    menu_cache = loaded_agent_module("menu_cache")
+    if menu_cache is not None:
+        menu_cache.bump_menu_version()
+
+# Diacritic-insensitive title index for the name search, built on first use,
+# updated item by item from the write endpoints below and resynced with the
+# database every ITEM_INDEX_TTL seconds for writes handled by other workers
+_title_index: FuzzyIndex | None = None
+_title_index_synced_at = 0.0
+# Sync endpoints run in the threadpool: one request (re)builds the index at a time
+_title_index_lock = threading.Lock()
+
+
+def get_title_index(db: Session) -> FuzzyIndex:
+    global _title_index, _title_index_synced_at
+    with _title_index_lock:
+        now = time.monotonic()
+        if _title_index is None or now - _title_index_synced_at >= settings.ITEM_INDEX_TTL:
+            titles = db.query(models.Item.id, models.Item.title).all()
+            if _title_index is None:
+                _title_index = FuzzyIndex(titles)
+            else:
+                _title_index.sync(titles)
+            _title_index_synced_at = now
+        return _title_index
+
 UPLOAD_DIR = os.path.join(
     os.path.dirname(
         os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
@@ -32,14 +76,23 @@ def read_items(
     Retrieve items. Public access.
     """
     if name:
-        # Simple ilike filter
-        items = (
-            db.query(models.Item)
+        # Fuzzy matches ("com suon" -> "Cơm sườn") first, best first, then
+        # ilike matches the index does not have yet; paginated over the union
+        matches = get_title_index(db).search(name, limit=skip + limit)
+        ids = [item_id for item_id, _ in matches]
+        seen = set(ids)
+        substring_ids = (
+            db.query(models.Item.id)
             .filter(models.Item.title.ilike(f"%{name}%"))
-            .offset(skip)
-            .limit(limit)
+            .order_by(models.Item.id)
+            .limit(skip + limit)
             .all()
         )
+        ids += [item_id for (item_id,) in substring_ids if item_id not in seen]
+        ids = ids[skip : skip + limit]
+        rows = db.query(models.Item).filter(models.Item.id.in_(ids)).all() if ids else []
+        by_id = {item.id: item for item in rows}
+        items = [by_id[item_id] for item_id in ids if item_id in by_id]
     else:
         items = crud.item.get_multi(db, skip=skip, limit=limit)
     return items
@@ -106,6 +159,9 @@ def create_item(
     )
 
     item = crud.item.create(db, obj_in=item_in)
+    bump_menu_version()
+    if _title_index is not None:
+        _title_index.add(item.id, item.title)
     return item
 
 
@@ -182,6 +238,9 @@ def update_item(
 
     # Update item
     updated_item = crud.item.update(db, db_obj=item, obj_in=update_data)
+    bump_menu_version()
+    if _title_index is not None:
+        _title_index.add(updated_item.id, updated_item.title)
     return updated_item
 
 
@@ -199,6 +258,9 @@ def delete_item(
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     item = crud.item.remove(db, id=item_id)
+    bump_menu_version()
+    if _title_index is not None:
+        _title_index.remove(item_id)
     return item
 
 
@@ -0,0 +1,22 @@
+import os
+import sys
+
+# Agent modules (graph, nodes, data, ...) use flat imports, so the agent
+# directory itself has to be on sys.path before any of them is imported.
+AGENT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent"
+)
+
+
+def ensure_agent_path() -> None:
+    """Add the agent directory to sys.path (idempotent)."""
+    if AGENT_DIR not in sys.path:
+        sys.path.insert(0, AGENT_DIR)
+
+
+def loaded_agent_module(name: str):
+    """
+    An agent module if this worker has already imported it, else None. For
+    hooks (e.g. cache invalidation) that must not load the agent stack.
+    """
+    return sys.modules.get(name)
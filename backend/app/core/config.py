@@ -13,6 +13,27 @@ class Settings(BaseSettings):
     POSTGRES_PORT: str
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
 
+    ## Connection pool, shared with the agent (see app/agent/db_pool.py)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_TIMEOUT_MS: int = 5000
+    # Connections opened by the startup warm-up (see app/core/warmup.py)
+    DB_POOL_PREFILL: int = 2
+
+    ## Startup warm-up: compile the agent graph and load the menu before serving
+    AGENT_WARMUP: bool = True
+    AGENT_WARMUP_TIMEOUT: float = 30
+
+    ## Item name search: each worker resyncs its fuzzy title index with the
+    ## database at most this many seconds apart (items may change in another worker)
+    ITEM_INDEX_TTL: float = 60
+
+    ## Prometheus scrape of /chat/metrics: bearer token accepted in place of a
+    ## superuser access token (unset: superusers only)
+    METRICS_SCRAPE_TOKEN: Optional[str] = None
+
     ## Auth
     SECRET_KEY: str = "supersecret"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
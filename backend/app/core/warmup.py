@@ -0,0 +1,134 @@
+"""
+Agent warm-up at application startup.
+
+Without it the first chat request after a deploy or worker restart pays for
+opening database connections, importing the agent stack (loaded lazily, see
+chat.agent()), compiling the graph and loading / rendering the menu. The
+FastAPI lifespan (app/main.py) runs warm_up() before the worker starts
+serving, and GET /ready reports the result (retrying a failed warm-up in the
+background).
+"""
+
+import asyncio
+import time
+
+from app.core.agent_path import loaded_agent_module
+from app.core.config import settings
+from app.db.session import engine
+
+
+class WarmupState:
+    """Progress of the warm-up: status, per-step timings and the last error."""
+
+    def __init__(self):
+        self.status = "pending"  # pending | warming | ready | failed
+        self.steps: dict[str, float] = {}
+        self.error: str | None = None
+        self.seconds: float | None = None
+        self._lock: asyncio.Lock | None = None
+        self._retry: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "seconds": self.seconds,
+            "steps": {name: round(seconds, 4) for name, seconds in self.steps.items()},
+            "error": self.error,
+        }
+
+
+warmup_state = WarmupState()
+
+
+def open_db_pool() -> None:
+    """Check out (then return) a few connections so the pool starts filled."""
+    connections = []
+    try:
+        for _ in range(max(1, min(settings.DB_POOL_PREFILL, settings.DB_POOL_SIZE))):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def import_agent() -> None:
+    from app.api.v1.endpoints.chat import agent
+
+    agent()
+
+
+async def build_graph() -> None:
+    from app.api.v1.endpoints.chat import get_graph
+
+    # Runs on the event loop: get_graph() also starts the checkpoint cleanup
+    # and token ledger flush tasks
+    get_graph()
+
+
+async def load_menu() -> None:
+    from data import aget_menu_snapshot
+    from prompt_store import prompt_store
+
+    menu = await aget_menu_snapshot()
+    prompt_store.get(menu)
+
+
+async def _run(state: WarmupState) -> None:
+    steps = (
+        ("db_pool", lambda: asyncio.to_thread(open_db_pool)),
+        ("agent_import", import_agent),
+        ("graph", build_graph),
+        ("menu_and_prompts", load_menu),
+    )
+    for name, step in steps:
+        started = time.perf_counter()
+        await step()
+        state.steps[name] = time.perf_counter() - started
+
+
+async def warm_up(state: WarmupState = warmup_state) -> WarmupState:
+    """Run the warm-up steps (once at a time); failures leave the worker not ready."""
+    if state._lock is None:
+        state._lock = asyncio.Lock()
+    async with state._lock:
+        if state.ready:
+            return state
+        state.status = "warming"
+        state.error = None
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(_run(state), settings.AGENT_WARMUP_TIMEOUT)
+        except Exception as e:
+            state.status = "failed"
+            state.error = str(e) or type(e).__name__
+        else:
+            state.status = "ready"
+        state.seconds = round(time.perf_counter() - started, 4)
+        steps = " ".join(
+            f"{name}={seconds * 1000:.0f}ms" for name, seconds in state.steps.items()
+        )
+        print(f"[Startup] Warm-up {state.status} in {state.seconds * 1000:.0f}ms: {steps}")
+        if state.error:
+            print(f"[Startup] Warm-up error: {state.error}")
+        return state
+
+
+def retry_warm_up(state: WarmupState = warmup_state) -> None:
+    """Start warm_up() in a background task unless one is already running."""
+    if state.ready or (state._retry is not None and not state._retry.done()):
+        return
+    state._retry = asyncio.create_task(warm_up(state))
+
+
+async def shut_down() -> None:
+    """Write buffered token usage rows before the worker exits."""
+    retry = warmup_state._retry
+    if retry is not None and not retry.done():
+        retry.cancel()
+    token_ledger = loaded_agent_module("token_ledger")
+    if token_ledger is not None:
+        await token_ledger.token_ledger.aflush()
@@ -1,7 +1,19 @@
-
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from app.core.agent_path import ensure_agent_path
 from app.core.config import settings
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+ensure_agent_path()
+
+# One pool per worker: the agent data layer gets this same engine for the
+# same URL instead of opening a second pool
+from db_pool import get_engine, pool_stats
+
+engine = get_engine(
+    settings.SQLALCHEMY_DATABASE_URI,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    statement_timeout_ms=settings.DB_STATEMENT_TIMEOUT_MS,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -1,14 +1,28 @@
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.v1.api import api_router
 from app.core.config import settings
+from app.core.warmup import retry_warm_up, shut_down, warm_up, warmup_state
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the agent graph, open DB connections and load the menu before
+    # serving, so the first chat request does not pay for it
+    if settings.AGENT_WARMUP:
+        await warm_up()
+    yield
+    await shut_down()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -32,4 +46,18 @@ def root():
     return {"message": "Chào mừng bạn đến website của chúng tôi"}
 
 
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness probe: 503 until the startup warm-up has succeeded.
+
+    A failed warm-up is retried in the background, never inside the probe.
+    """
+    if not settings.AGENT_WARMUP:
+        return {"status": "disabled"}
+    if not warmup_state.ready:
+        retry_warm_up()
+        response.status_code = 503
+    return warmup_state.as_dict()
+
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
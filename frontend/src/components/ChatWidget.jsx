@@ -80,6 +80,15 @@ function ChatWidget() {
                         onDone();
                         return;
                     }
+                    if (data === '[BUSY]') {
+                        // The assistant is overloaded; the message was not processed
+                        onChunk('Hệ thống đang bận, bạn vui lòng gửi lại tin nhắn sau giây lát nhé.');
+                        continue;
+                    }
+                    if (data === '[COALESCED]') {
+                        // Message was merged into a concurrent turn on this thread
+                        continue;
+                    }
                     if (data.startsWith('[CART_DATA]')) {
                         // Parse cart data and add to localStorage
                         try {
@@ -100,7 +109,7 @@ function ChatWidget() {
         // Process any remaining data in buffer
         if (buffer.startsWith('data: ')) {
             const data = buffer.slice(6);
-            if (data && data !== '[DONE]' && !data.startsWith('[CART_DATA]')) {
+            if (data && data !== '[DONE]' && data !== '[COALESCED]' && data !== '[BUSY]' && !data.startsWith('[CART_DATA]')) {
                 onChunk(unescapeSSEContent(data));
             }
         }